@@ -1,188 +1,672 @@
 """
 Compatibility patch for Python 3.13 - provides missing audioop module functionality
+
+A drop-in replacement for the ``audioop`` C module (removed in Python
+3.13), vectorised with NumPy.  Fragments are viewed with
+``np.frombuffer`` using the native dtype for the sample width (signed
+8-, 16- and 32-bit; 24-bit samples are assembled from byte triplets),
+so every function is a handful of array operations instead of a
+per-sample ``struct.unpack_from`` loop.
+
+Return values follow CPython's ``Modules/audioop.c`` exactly: signed
+8-bit samples, clipping + round-towards-minus-infinity in ``mul`` /
+``add`` / ``tomono`` / ``tostereo``, wrap-around in ``bias``,
+``cross`` returning -1 for an empty fragment, and the C code's
+in-order ``double`` accumulation in ``avg`` / ``rms`` / ``avgpp``
+(sums are done in exact integers when no partial sum can exceed 2**53,
+which gives the same result, and sequentially in float64 otherwise).
+The encoders with feedback (``lin2adpcm`` / ``adpcm2lin`` and the
+``ratecv`` smoothing filter when ``weightB > 0``) are inherently
+sequential and are straight ports of the C loops.
+
+``verify_audioop_patch.py`` checks conformance against the stdlib
+module (on Pythons that still ship it) and benchmarks both.
 """
-import struct
+import builtins
+import math
 import sys
 
+import numpy as np
+
+
+class error(Exception):
+    pass
+
+
+_MAXVALS = (0, 0x7F, 0x7FFF, 0x7FFFFF, 0x7FFFFFFF)
+_MINVALS = (0, -0x80, -0x8000, -0x800000, -0x7FFFFFFF - 1)
+_DTYPES = {1: np.dtype('i1'), 2: np.dtype('=i2'), 4: np.dtype('=i4')}
+_INT_MIN = -0x7FFFFFFF - 1
+_INT_MAX = 0x7FFFFFFF
+
+# Partial sums below this are exact in a C double, so an exact integer
+# sum gives the same result as the C accumulator.
+_EXACT = 1 << 53
+_CHUNK = 1 << 20
+
+_LITTLE = sys.byteorder == 'little'
+
+
+# ---------------------------------------------------------------------------
+# Parameter checks and sample access
+# ---------------------------------------------------------------------------
+
+def _check_size(size):
+    if size not in (1, 2, 3, 4):
+        raise error("Size should be 1, 2, 3 or 4")
+
+
 def _check_parameters(length, size):
+    _check_size(size)
     if length % size != 0:
-        raise ValueError("not a whole number of frames")
-
-def _get_sample(size, data, offset):
-    if size == 1:
-        return struct.unpack_from('B', data, offset)[0]
-    elif size == 2:
-        return struct.unpack_from('h', data, offset)[0]
-    elif size == 4:
-        return struct.unpack_from('i', data, offset)[0]
+        raise error("not a whole number of frames")
+
+
+def _c_int(value):
+    value = int(value)
+    if not _INT_MIN <= value <= _INT_MAX:
+        raise OverflowError("Python int too large to convert to C int")
+    return value
+
+
+def _bytes(fragment):
+    """The fragment as a flat uint8 array (no copy)."""
+    return np.frombuffer(fragment, dtype=np.uint8)
+
+
+def _samples(fragment, size):
+    """Signed raw samples of ``fragment`` as int32 (GETRAWSAMPLE)."""
+    raw = _bytes(fragment)
+    if size != 3:
+        return raw.view(_DTYPES[size]).astype(np.int32)
+    b = raw.reshape(-1, 3).astype(np.int32)
+    if _LITTLE:
+        v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
     else:
-        raise ValueError("Unsupported sample size")
-
-def _set_sample(size, data, offset, value):
-    if size == 1:
-        struct.pack_into('B', data, offset, value)
-    elif size == 2:
-        struct.pack_into('h', data, offset, value)
-    elif size == 4:
-        struct.pack_into('i', data, offset, value)
+        v = b[:, 2] | (b[:, 1] << 8) | (b[:, 0] << 16)
+    return (v ^ 0x800000) - 0x800000
+
+
+def _pack(values, size):
+    """Store integer ``values`` as ``size``-byte samples, truncating to the
+    width the way the C ``SETINTX`` casts do."""
+    values = np.asarray(values, dtype=np.int64)
+    if size != 3:
+        return values.astype(_DTYPES[size]).tobytes()
+    v = values & 0xFFFFFF
+    out = np.empty((v.size, 3), dtype=np.uint8)
+    lo, mid, hi = (0, 1, 2) if _LITTLE else (2, 1, 0)
+    out[:, lo] = v & 0xFF
+    out[:, mid] = (v >> 8) & 0xFF
+    out[:, hi] = (v >> 16) & 0xFF
+    return out.tobytes()
+
+
+def _samples32(fragment, size):
+    """Samples scaled to 32 bits (GETSAMPLE32), as int64."""
+    return _samples(fragment, size).astype(np.int64) << (32 - 8 * size)
+
+
+def _pack32(values, size):
+    """Inverse of :func:`_samples32` (SETSAMPLE32: arithmetic shift)."""
+    return _pack(np.asarray(values, dtype=np.int64) >> (32 - 8 * size), size)
+
+
+def _fbound(values, size):
+    """C ``fbound``: clip to the sample range, round towards -inf, cast.
+
+    NaN casts to INT_MIN, as ``(int)NAN`` does on x86.
+    """
+    maxval = float(_MAXVALS[size])
+    minval = float(_MINVALS[size])
+    v = np.where(values > maxval, maxval, np.where(values < minval + 1.0, minval, values))
+    v = np.floor(v)
+    nan = np.isnan(v)
+    if nan.any():
+        v[nan] = _INT_MIN
+    return v.astype(np.int64)
+
+
+def _c_double_sum(values, max_abs):
+    """Sum ``values`` exactly as ``double sum = 0; for (...) sum += v;``.
+
+    ``values`` holds integers (int64, or float64 that are exact
+    integers); ``max_abs`` bounds their magnitude.
+    """
+    n = values.size
+    if n * max_abs < _EXACT:
+        return float(int(values.sum(dtype=np.int64)))
+    total = 0.0
+    for start in range(0, n, _CHUNK):
+        chunk = values[start:start + _CHUNK].astype(np.float64)
+        chunk[0] += total
+        total = float(np.add.accumulate(chunk)[-1])
+    return total
+
+
+def _sequential_fsum(values):
+    """In-order float64 sum of an arbitrary float64 array."""
+    total = 0.0
+    for start in range(0, values.size, _CHUNK):
+        chunk = np.array(values[start:start + _CHUNK], dtype=np.float64)
+        chunk[0] += total
+        total = float(np.add.accumulate(chunk)[-1])
+    return total
+
+
+# ---------------------------------------------------------------------------
+# Measurements
+# ---------------------------------------------------------------------------
+
+def getsample(fragment, width, index):
+    """Return the value of sample ``index`` from the fragment."""
+    _check_parameters(len(memoryview(fragment).cast('B')), width)
+    n = len(_bytes(fragment)) // width
+    if index < 0 or index >= n:
+        raise error("Index out of range")
+    return int(_samples(bytes(_bytes(fragment)[index * width:(index + 1) * width]), width)[0])
+
+
+def max(fragment, width):
+    """Maximum of the absolute values of all samples."""
+    _check_parameters(len(_bytes(fragment)), width)
+    s = _samples(fragment, width)
+    if s.size == 0:
+        return 0
+    return int(builtins.max(int(s.max()), -int(s.min()), 0))
+
+
+def minmax(fragment, width):
+    """``(minimum, maximum)`` of all samples."""
+    _check_parameters(len(_bytes(fragment)), width)
+    s = _samples(fragment, width)
+    if s.size == 0:
+        return (_INT_MAX, _INT_MIN)
+    return (int(s.min()), int(s.max()))
+
+
+def min(fragment, width):
+    """Minimum sample value (not in stdlib audioop; kept for callers of
+    earlier versions of this module)."""
+    return minmax(fragment, width)[0]
+
+
+def avg(fragment, width):
+    """Average of all samples, rounded towards minus infinity."""
+    _check_parameters(len(_bytes(fragment)), width)
+    s = _samples(fragment, width).astype(np.int64)
+    if s.size == 0:
+        return 0
+    max_abs = builtins.max(int(s.max()), -int(s.min()))
+    total = _c_double_sum(s, max_abs)
+    return int(math.floor(total / float(s.size)))
+
+
+def rms(fragment, width):
+    """Root-mean-square of the fragment, truncated to an integer."""
+    _check_parameters(len(_bytes(fragment)), width)
+    s = _samples(fragment, width).astype(np.int64)
+    if s.size == 0:
+        return 0
+    max_abs = builtins.max(int(s.max()), -int(s.min()))
+    max_sq = max_abs * max_abs
+    if max_sq < _EXACT:
+        # Every square is exact in a double: sum them as integers.
+        total = _c_double_sum(s * s, max_sq)
     else:
-        raise ValueError("Unsupported sample size")
-
-def findmax(data, size):
-    """Find the maximum absolute value in the data"""
-    _check_parameters(len(data), size)
-    max_val = 0
-    for i in range(0, len(data), size):
-        sample = abs(_get_sample(size, data, i))
-        if sample > max_val:
-            max_val = sample
-    return max_val
-
-def getsample(data, size, index):
-    """Return a single sample"""
-    _check_parameters(len(data), size)
-    return _get_sample(size, data, index * size)
-
-def max(data, size):
-    """Return the maximum value in the data"""
-    return findmax(data, size)
-
-def min(data, size):
-    """Return the minimum value in the data"""
-    _check_parameters(len(data), size)
-    min_val = 0
-    for i in range(0, len(data), size):
-        sample = _get_sample(size, data, i)
-        if sample < min_val:
-            min_val = sample
-    return min_val
-
-def avg(data, size):
-    """Return the average value in the data"""
-    _check_parameters(len(data), size)
-    total = 0
-    count = 0
-    for i in range(0, len(data), size):
-        total += _get_sample(size, data, i)
-        count += 1
-    return total // count if count > 0 else 0
-
-def rms(data, size):
-    """Return the root-mean-square of the data"""
-    _check_parameters(len(data), size)
-    total = 0
-    count = 0
-    for i in range(0, len(data), size):
-        sample = _get_sample(size, data, i)
-        total += sample * sample
-        count += 1
-    if count == 0:
+        f = s.astype(np.float64)
+        total = _sequential_fsum(f * f)
+    return int(math.sqrt(total / float(s.size)))
+
+
+def _extremes(fragment, width):
+    """Local extremes as the C peak-to-peak loops see them."""
+    s = _samples(fragment, width).astype(np.int64)
+    # Runs of equal samples are skipped (prevval only moves on change).
+    v = s[np.concatenate(([True], s[1:] != s[:-1]))]
+    if v.size < 3:
+        return v[:0]
+    down = v[1:] < v[:-1]
+    turn = down[1:] != down[:-1]
+    return v[1:-1][turn]
+
+
+def avgpp(fragment, width):
+    """Average of the peak-to-peak values between local extremes."""
+    _check_parameters(len(_bytes(fragment)), width)
+    if len(_bytes(fragment)) <= width:
         return 0
-    return int((total // count) ** 0.5)
-
-def cross(data, size):
-    """Return the number of zero crossings"""
-    _check_parameters(len(data), size)
-    crossings = 0
-    last_sample = 0
-    for i in range(0, len(data), size):
-        sample = _get_sample(size, data, i)
-        if last_sample <= 0 and sample > 0:
-            crossings += 1
-        last_sample = sample
-    return crossings
-
-def add(data1, data2, size):
-    """Add two audio fragments"""
-    _check_parameters(len(data1), size)
-    _check_parameters(len(data2), size)
-    if len(data1) != len(data2):
-        raise ValueError("Input fragments must be of the same length")
-
-    result = bytearray(len(data1))
-    for i in range(0, len(data1), size):
-        sample1 = _get_sample(size, data1, i)
-        sample2 = _get_sample(size, data2, i)
-        _set_sample(size, result, i, sample1 + sample2)
-    return bytes(result)
-
-def mul(data, size, factor):
-    """Multiply an audio fragment by a factor"""
-    _check_parameters(len(data), size)
-    result = bytearray(len(data))
-    for i in range(0, len(data), size):
-        sample = _get_sample(size, data, i)
-        _set_sample(size, result, i, int(sample * factor))
-    return bytes(result)
-
-def reverse(data, size):
-    """Reverse an audio fragment"""
-    _check_parameters(len(data), size)
-    result = bytearray(len(data))
-    for i in range(0, len(data), size):
-        sample = _get_sample(size, data, i)
-        _set_sample(size, result, len(data) - i - size, sample)
-    return bytes(result)
-
-def tomono(data, size, left_factor, right_factor):
-    """Convert stereo to mono"""
-    _check_parameters(len(data), size)
-    if size % 2 != 0:
-        raise ValueError("Stereo samples must be even-sized")
-
-    sample_size = size // 2
-    result = bytearray(len(data) // 2)
-
-    for i in range(0, len(data), size):
-        left = _get_sample(sample_size, data, i)
-        right = _get_sample(sample_size, data, i + sample_size)
-        mono = int(left * left_factor + right * right_factor)
-        _set_sample(sample_size, result, i // 2, mono)
-
-    return bytes(result)
-
-def tostereo(data, size, left_factor, right_factor):
-    """Convert mono to stereo"""
-    _check_parameters(len(data), size)
-    result = bytearray(len(data) * 2)
-
-    for i in range(0, len(data), size):
-        sample = _get_sample(size, data, i)
-        _set_sample(size, result, i * 2, int(sample * left_factor))
-        _set_sample(size, result, i * 2 + size, int(sample * right_factor))
-
-    return bytes(result)
-
-def lin2lin(data, size, new_size):
-    """Convert sample width"""
-    _check_parameters(len(data), size)
-    _check_parameters(len(data), new_size)
-
-    if size == new_size:
-        return data
-
-    result = bytearray((len(data) // size) * new_size)
-
-    for i in range(0, len(data), size):
-        sample = _get_sample(size, data, i)
-        _set_sample(new_size, result, (i // size) * new_size, sample)
-
-    return bytes(result)
-
-def ratecv(data, size, nchannels, inrate, outrate, state=None, weightA=1, weightB=0):
-    """Convert sample rate"""
-    _check_parameters(len(data), size)
-
-    # Simple implementation - just return the data unchanged
-    # In a real implementation, this would resample the audio
-    return data, state
-
-# Add any other missing functions that pydub might need
-def bias(data, size, bias):
-    """Add bias to samples"""
-    _check_parameters(len(data), size)
-    result = bytearray(len(data))
-    for i in range(0, len(data), size):
-        sample = _get_sample(size, data, i)
-        _set_sample(size, result, i, sample + bias)
-    return bytes(result)
+    e = _extremes(fragment, width)
+    if e.size < 2:
+        return 0
+    diffs = np.abs(np.diff(e))
+    total = _c_double_sum(diffs, int(diffs.max()))
+    return int(total / float(diffs.size))
+
+
+def maxpp(fragment, width):
+    """Maximum peak-to-peak value between local extremes."""
+    _check_parameters(len(_bytes(fragment)), width)
+    if len(_bytes(fragment)) <= width:
+        return 0
+    e = _extremes(fragment, width)
+    if e.size < 2:
+        return 0
+    return int(np.abs(np.diff(e)).max())
+
+
+def cross(fragment, width):
+    """Number of zero crossings (-1 for an empty fragment)."""
+    _check_parameters(len(_bytes(fragment)), width)
+    s = _samples(fragment, width)
+    if s.size == 0:
+        return -1
+    neg = s < 0
+    return int(np.count_nonzero(neg[1:] != neg[:-1]))
+
+
+def _even_int16(fragment):
+    raw = _bytes(fragment)
+    if len(raw) & 1:
+        raise error("Strings should be even-sized")
+    return raw.view(np.dtype('=i2')).astype(np.int64)
+
+
+def findfactor(fragment, reference):
+    """Factor F such that ``rms(add(fragment, mul(reference, -F)))`` is
+    minimal (16-bit samples)."""
+    a = _even_int16(fragment)
+    r = _even_int16(reference)
+    if a.size != r.size:
+        raise error("Samples should be same size")
+    sum_ri_2 = _c_double_sum(r * r, 1 << 30)
+    sum_aij_ri = _c_double_sum(a * r, 1 << 30)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(sum_aij_ri) / np.float64(sum_ri_2))
+
+
+def findfit(fragment, reference):
+    """``(offset, factor)`` of the best match of ``reference`` in
+    ``fragment`` (16-bit samples).
+
+    Window sums are exact integers, matching the C loop while its
+    running sums stay below 2**53.
+    """
+    a = _even_int16(fragment)
+    r = _even_int16(reference)
+    len1, len2 = a.size, r.size
+    if len1 < len2:
+        raise error("First sample should be longer")
+    sum_ri_2 = float(int((r * r).sum()))
+    sq = np.concatenate(([0], np.cumsum(a * a)))
+    sum_aij_2 = (sq[len2:] - sq[:len1 - len2 + 1]).astype(np.float64)
+    if len2:
+        sum_aij_ri = np.correlate(a, r, mode='valid').astype(np.float64)
+    else:
+        sum_aij_ri = np.zeros(len1 + 1, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = (sum_ri_2 * sum_aij_2 - sum_aij_ri * sum_aij_ri) / sum_aij_2
+        if np.isnan(result[0]):
+            best_j = 0
+        else:
+            best_j = int(np.argmin(np.where(np.isnan(result), np.inf, result)))
+        factor = float(np.float64(sum_aij_ri[best_j]) / np.float64(sum_ri_2))
+    return (best_j, factor)
+
+
+def findmax(fragment, length):
+    """Offset of the ``length``-sample window with the most energy
+    (16-bit samples)."""
+    a = _even_int16(fragment)
+    if length < 0 or a.size < length:
+        raise error("Input sample should be longer")
+    sq = np.concatenate(([0], np.cumsum(a * a)))
+    window = sq[length:] - sq[:a.size - length + 1]
+    return int(np.argmax(window))
+
+
+# ---------------------------------------------------------------------------
+# Transformations
+# ---------------------------------------------------------------------------
+
+def add(fragment1, fragment2, width):
+    """Sample-wise sum of two fragments, clipped to the sample range."""
+    _check_parameters(len(_bytes(fragment1)), width)
+    if len(_bytes(fragment1)) != len(_bytes(fragment2)):
+        raise error("Lengths should be the same")
+    s = _samples(fragment1, width).astype(np.int64) + _samples(fragment2, width)
+    return _pack(np.clip(s, _MINVALS[width], _MAXVALS[width]), width)
+
+
+def mul(fragment, width, factor):
+    """Multiply every sample by ``factor`` (clipped, floored)."""
+    _check_parameters(len(_bytes(fragment)), width)
+    s = _samples(fragment, width).astype(np.float64)
+    return _pack(_fbound(s * float(factor), width), width)
+
+
+def bias(fragment, width, bias):
+    """Add ``bias`` to every sample, wrapping around on overflow."""
+    _check_parameters(len(_bytes(fragment)), width)
+    bias = _c_int(bias)
+    mask = (1 << (8 * width)) - 1
+    s = _samples(fragment, width).astype(np.int64)
+    return _pack((s + bias) & mask, width)
+
+
+def reverse(fragment, width):
+    """Reverse the order of the samples."""
+    _check_parameters(len(_bytes(fragment)), width)
+    return _bytes(fragment).reshape(-1, width)[::-1].tobytes()
+
+
+def byteswap(fragment, width):
+    """Swap the byte order of every sample."""
+    _check_parameters(len(_bytes(fragment)), width)
+    return _bytes(fragment).reshape(-1, width)[:, ::-1].tobytes()
+
+
+def tomono(fragment, width, lfactor, rfactor):
+    """Mix a stereo fragment down to mono."""
+    length = len(_bytes(fragment))
+    _check_parameters(length, width)
+    if (length // width) & 1:
+        raise error("not a whole number of frames")
+    s = _samples(fragment, width).astype(np.float64).reshape(-1, 2)
+    mixed = s[:, 0] * float(lfactor) + s[:, 1] * float(rfactor)
+    return _pack(_fbound(mixed, width), width)
+
+
+def tostereo(fragment, width, lfactor, rfactor):
+    """Make a stereo fragment from a mono one."""
+    _check_parameters(len(_bytes(fragment)), width)
+    s = _samples(fragment, width).astype(np.float64)
+    out = np.empty((s.size, 2), dtype=np.int64)
+    out[:, 0] = _fbound(s * float(lfactor), width)
+    out[:, 1] = _fbound(s * float(rfactor), width)
+    return _pack(out.reshape(-1), width)
+
+
+def lin2lin(fragment, width, newwidth):
+    """Convert samples between 1-, 2-, 3- and 4-byte formats."""
+    _check_parameters(len(_bytes(fragment)), width)
+    _check_size(newwidth)
+    return _pack32(_samples32(fragment, width), newwidth)
+
+
+def ratecv(fragment, width, nchannels, inrate, outrate, state,
+           weightA=1, weightB=0):
+    """Convert the frame rate of the fragment (port of audioop.ratecv)."""
+    _check_size(width)
+    nchannels = _c_int(nchannels)
+    if nchannels < 1:
+        raise error("# of channels should be >= 1")
+    if width > _INT_MAX // nchannels:
+        raise OverflowError("width * nchannels too big for a C int")
+    bytes_per_frame = width * nchannels
+    weightA, weightB = _c_int(weightA), _c_int(weightB)
+    if weightA < 1 or weightB < 0:
+        raise error("weightA should be >= 1, weightB should be >= 0")
+    raw = _bytes(fragment)
+    if len(raw) % bytes_per_frame != 0:
+        raise error("not a whole number of frames")
+    inrate, outrate = _c_int(inrate), _c_int(outrate)
+    if inrate <= 0 or outrate <= 0:
+        raise error("sampling rate not > 0")
+    d = math.gcd(inrate, outrate)
+    inrate //= d
+    outrate //= d
+    d = math.gcd(weightA, weightB)
+    weightA //= d
+    weightB //= d
+
+    nframes = len(raw) // bytes_per_frame
+    if state is None:
+        d = -outrate
+        prev_i = [0] * nchannels
+        cur_i = [0] * nchannels
+    else:
+        if not isinstance(state, tuple):
+            raise TypeError("state must be a tuple or None")
+        try:
+            d, samps = state
+            d = _c_int(d)
+        except (TypeError, ValueError):
+            raise TypeError("ratecv(): illegal state argument")
+        if not isinstance(samps, tuple):
+            raise TypeError("ratecv(): illegal state argument")
+        if len(samps) != nchannels:
+            raise error("illegal state argument")
+        prev_i, cur_i = [], []
+        for channel in samps:
+            if not isinstance(channel, tuple) or len(channel) != 2:
+                raise TypeError("ratecv(): illegal state argument")
+            prev_i.append(_c_int(channel[0]))
+            cur_i.append(_c_int(channel[1]))
+
+    frames = _samples32(fragment, width).reshape(nframes, nchannels)
+    if weightB and nframes:
+        # Smoothing filter: each output feeds the next, so run it in order.
+        fa, fb = float(weightA), float(weightB)
+        den = fa + fb
+        filtered = np.empty_like(frames)
+        prev = list(cur_i)
+        rows = frames.tolist()
+        for k in range(nframes):
+            row = rows[k]
+            for chan in range(nchannels):
+                prev[chan] = int((fa * row[chan] + fb * prev[chan]) / den)
+            filtered[k] = prev
+        frames = filtered
+
+    # ext[c] is the "prev" sample after c frames consumed, ext[c + 1] "cur".
+    ext = np.empty((nframes + 2, nchannels), dtype=np.int64)
+    ext[0] = prev_i
+    ext[1] = cur_i
+    ext[2:] = frames
+
+    # Output m is emitted after c_m = max(0, ceil((m*inrate - d)/outrate))
+    # frames were consumed; outputs continue while c_m <= nframes.
+    budget = nframes * outrate + d
+    n_out = budget // inrate + 1 if budget >= 0 else 0
+    m = np.arange(n_out, dtype=np.int64)
+    consumed = np.maximum(0, -((d - m * inrate) // outrate))
+    dm = (d + consumed * outrate - m * inrate).astype(np.float64)[:, None]
+    prev = ext[consumed].astype(np.float64)
+    cur = ext[consumed + 1].astype(np.float64)
+    out = np.trunc((prev * dm + cur * (outrate - dm)) / float(outrate)).astype(np.int64)
+
+    d_final = d + nframes * outrate - n_out * inrate
+    new_state = (int(d_final),
+                 tuple((int(p), int(c)) for p, c in zip(ext[nframes].tolist(),
+                                                          ext[nframes + 1].tolist())))
+    return (_pack32(out.reshape(-1), width), new_state)
+
+
+# ---------------------------------------------------------------------------
+# u-law / A-law
+# ---------------------------------------------------------------------------
+
+_SEG_UEND = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF], dtype=np.int64)
+_SEG_AEND = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF], dtype=np.int64)
+_ULAW_BIAS = 0x84
+_ULAW_CLIP = 8159
+
+
+def _ulaw_table():
+    u = ~np.arange(256, dtype=np.int64) & 0xFF
+    t = (((u & 0x0F) << 3) + _ULAW_BIAS) << ((u & 0x70) >> 4)
+    return np.where(u & 0x80, _ULAW_BIAS - t, t - _ULAW_BIAS)
+
+
+def _alaw_table():
+    a = np.arange(256, dtype=np.int64) ^ 0x55
+    t = (a & 0x0F) << 4
+    seg = (a & 0x70) >> 4
+    t = np.where(seg == 0, t + 8, t + 0x108)
+    t = np.where(seg > 1, t << np.maximum(seg - 1, 0), t)
+    return np.where(a & 0x80, t, -t)
+
+
+_ULAW2LIN = _ulaw_table()
+_ALAW2LIN = _alaw_table()
+
+
+def lin2ulaw(fragment, width):
+    """Convert samples to 8-bit u-law."""
+    _check_parameters(len(_bytes(fragment)), width)
+    pcm = _samples32(fragment, width) >> 18
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    mag = np.minimum(np.abs(pcm), _ULAW_CLIP) + (_ULAW_BIAS >> 2)
+    seg = np.searchsorted(_SEG_UEND, mag, side='left')
+    uval = (seg << 4) | ((mag >> (np.minimum(seg, 7) + 1)) & 0xF)
+    out = np.where(seg >= 8, 0x7F ^ mask, uval ^ mask)
+    return out.astype(np.uint8).tobytes()
+
+
+def ulaw2lin(fragment, width):
+    """Convert 8-bit u-law to linear samples of ``width`` bytes."""
+    _check_size(width)
+    return _pack32(_ULAW2LIN[_bytes(fragment)] << 16, width)
+
+
+def lin2alaw(fragment, width):
+    """Convert samples to 8-bit A-law."""
+    _check_parameters(len(_bytes(fragment)), width)
+    pcm = _samples32(fragment, width) >> 19
+    mask = np.where(pcm >= 0, 0xD5, 0x55)
+    mag = np.where(pcm >= 0, pcm, -pcm - 1)
+    seg = np.searchsorted(_SEG_AEND, mag, side='left')
+    shift = np.where(seg < 2, 1, np.minimum(seg, 7))
+    aval = (seg << 4) | ((mag >> shift) & 0xF)
+    out = np.where(seg >= 8, 0x7F ^ mask, aval ^ mask)
+    return out.astype(np.uint8).tobytes()
+
+
+def alaw2lin(fragment, width):
+    """Convert 8-bit A-law to linear samples of ``width`` bytes."""
+    _check_size(width)
+    return _pack32(_ALAW2LIN[_bytes(fragment)] << 16, width)
+
+
+# ---------------------------------------------------------------------------
+# IMA ADPCM (sequential: every step depends on the previous one)
+# ---------------------------------------------------------------------------
+
+_INDEX_TABLE = (-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8)
+_STEPSIZE_TABLE = (
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767,
+)
+
+
+def _adpcm_state(state):
+    if state is None:
+        return 0, 0
+    if not isinstance(state, tuple):
+        raise TypeError("state must be a tuple or None")
+    if len(state) != 2:
+        raise TypeError(f"function takes exactly 2 arguments ({len(state)} given)")
+    valpred, index = _c_int(state[0]), _c_int(state[1])
+    if valpred >= 0x8000 or valpred < -0x8000 or not 0 <= index < len(_STEPSIZE_TABLE):
+        raise ValueError("bad state")
+    return valpred, index
+
+
+def lin2adpcm(fragment, width, state):
+    """Convert samples to 4-bit Intel/DVI ADPCM."""
+    _check_parameters(len(_bytes(fragment)), width)
+    valpred, index = _adpcm_state(state)
+    samples = (_samples32(fragment, width) >> 16).tolist()
+    out = bytearray(len(samples) // 2)
+    step = _STEPSIZE_TABLE[index]
+    outputbuffer = 0
+    bufferstep = True
+    pos = 0
+    for val in samples:
+        if val < valpred:
+            diff = valpred - val
+            sign = 8
+        else:
+            diff = val - valpred
+            sign = 0
+        delta = 0
+        vpdiff = step >> 3
+        if diff >= step:
+            delta = 4
+            diff -= step
+            vpdiff += step
+        step >>= 1
+        if diff >= step:
+            delta |= 2
+            diff -= step
+            vpdiff += step
+        step >>= 1
+        if diff >= step:
+            delta |= 1
+            vpdiff += step
+        if sign:
+            valpred -= vpdiff
+        else:
+            valpred += vpdiff
+        if valpred > 32767:
+            valpred = 32767
+        elif valpred < -32768:
+            valpred = -32768
+        delta |= sign
+        index += _INDEX_TABLE[delta]
+        if index < 0:
+            index = 0
+        elif index > 88:
+            index = 88
+        step = _STEPSIZE_TABLE[index]
+        if bufferstep:
+            outputbuffer = (delta << 4) & 0xF0
+        else:
+            out[pos] = (delta & 0x0F) | outputbuffer
+            pos += 1
+        bufferstep = not bufferstep
+    return (bytes(out), (valpred, index))
+
+
+def adpcm2lin(fragment, width, state):
+    """Decode 4-bit Intel/DVI ADPCM to linear samples."""
+    _check_size(width)
+    valpred, index = _adpcm_state(state)
+    data = bytes(_bytes(fragment))
+    out = np.empty(len(data) * 2, dtype=np.int64)
+    step = _STEPSIZE_TABLE[index]
+    k = 0
+    for byte in data:
+        for delta in ((byte >> 4) & 0xF, byte & 0xF):
+            index += _INDEX_TABLE[delta]
+            if index < 0:
+                index = 0
+            elif index > 88:
+                index = 88
+            sign = delta & 8
+            delta &= 7
+            vpdiff = step >> 3
+            if delta & 4:
+                vpdiff += step
+            if delta & 2:
+                vpdiff += step >> 1
+            if delta & 1:
+                vpdiff += step >> 2
+            if sign:
+                valpred -= vpdiff
+            else:
+                valpred += vpdiff
+            if valpred > 32767:
+                valpred = 32767
+            elif valpred < -32768:
+                valpred = -32768
+            step = _STEPSIZE_TABLE[index]
+            out[k] = valpred
+            k += 1
+    return (_pack32(out << 16, width), (valpred, index))
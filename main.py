@@ -15,9 +15,11 @@ import subprocess
 import time
 import concurrent.futures
 import hashlib
+import multiprocessing
 import re
 import tempfile
 import atexit
+from typing import NamedTuple
 import arabic_reshaper
 from bidi.algorithm import get_display
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
@@ -103,7 +105,31 @@ from quran_reels.services.background import (
     init_background_rotator,
     get_next_background,
 )
+from quran_reels.services.audio_index import get_audio_index, probe_duration
+from quran_reels.services.fetch import get_fetch_engine
+from quran_reels.services.bg_index import get_background_index
+from quran_reels.services.bg_cache import PREPROCESS_FPS, get_bg_cache, variant_name
+from quran_reels.services.bg_ingest import get_bg_ingestor
+from quran_reels.services.corpus import CORPUS_FILENAME, get_corpus
+from quran_reels.services.layout import (
+    compute_layout,
+    fontsize_for_wordcount,
+    get_layout_index,
+    layout_key,
+)
+from quran_reels.services.prefetch import get_prefetcher
+from quran_reels.services.text_store import get_ayah_texts, get_text_store
+from quran_reels.services.timeline import (
+    background_timeline,
+    frame_count,
+    overlay_filters,
+    snap_duration,
+    write_timeline_list,
+)
+from quran_reels.utils.breaker import get_download_breaker
+from quran_reels.utils.fileio import link_or_copy
 from quran_reels.utils.progress import current_progress
+from quran_reels.utils.singleflight import singleflight_stats
 
 # =============================================================================
 # STEP 1: PATH RESOLUTION & DIRECTORY SETUP
@@ -158,6 +184,15 @@ logging.info(f"Audio cache directory: {AUDIO_CACHE_DIR}")
 AUDIO_CACHE_MAX_SIZE_MB = _env("QURAN_AUDIO_CACHE_MAX_SIZE_MB", 500, int)  # Maximum cache size in MB
 AUDIO_CACHE_MAX_FILES = _env("QURAN_AUDIO_CACHE_MAX_FILES", 1000, int)    # Maximum number of files
 
+# Loudness matching: every recitation is brought to this EBU R128
+# integrated loudness with a single volume filter (the measurement is
+# cached per file in the audio index).
+LOUDNESS_NORMALIZE = _env("QURAN_LOUDNESS_NORMALIZE", True,
+                          lambda s: str(s).lower() in ("1", "true", "yes", "on"))
+LOUDNESS_TARGET_LUFS = _env("QURAN_LOUDNESS_TARGET_LUFS", -16.0, float)
+LOUDNESS_MAX_GAIN_DB = 12.0      # never boost / cut a file by more than this
+LOUDNESS_PEAK_CEILING_DB = -1.0  # boosts stop where the true peak would pass this
+
 def get_cached_audio_path(reciter_id, surah, ayah):
     """Get cached audio file path"""
     fn = f'{surah:03d}{ayah:03d}.mp3'
@@ -198,7 +233,7 @@ class JobContext:
     collide with another build.
     """
 
-    __slots__ = ("job_id", "created_at")
+    __slots__ = ("job_id", "created_at", "segment_durations", "segment_audio", "canvas")
 
     def __init__(self, job_id: str | None = None):
         # 8 hex chars = 32 bits = 4 billion possible ids; more than
@@ -206,6 +241,16 @@ class JobContext:
         # within a single process lifetime.
         self.job_id = job_id or uuid.uuid4().hex[:8]
         self.created_at = time.time()
+        # segment path -> duration (s) as passed to the segment builder,
+        # so the concat step does not have to ffprobe each segment back.
+        self.segment_durations: dict = {}
+        # segment path -> (audio source path, atempo factor, gain in dB).
+        # Segments are video-only; the audio timeline is rendered once
+        # from these by build_audio_track and muxed in at the final pass.
+        self.segment_audio: dict = {}
+        # Canvas the segments are composited at (None: the full output
+        # size); set by build_video from the quality preset.
+        self.canvas = None
 
     # ---- per-ayah paths ----
 
@@ -213,16 +258,12 @@ class JobContext:
         """Per-ayah downloaded/reciter-speed-not-applied audio."""
         return os.path.join(TEMP_DIR, f"{self.job_id}_audio_{idx:03d}.mp3")
 
-    def sped_path(self, idx: int) -> str:
-        """Per-ayah audio after the reciter_speed atempo pre-pass."""
-        return os.path.join(TEMP_DIR, f"{self.job_id}_audio_{idx:03d}_sped.mp3")
-
     def text_png_path(self, idx: int) -> str:
         """Per-ayah rendered Arabic text PNG."""
         return os.path.join(TEMP_DIR, f"{self.job_id}_text_{idx:03d}.png")
 
     def segment_path(self, idx: int) -> str:
-        """Per-ayah muxed video segment (bg + text + audio)."""
+        """Per-ayah video-only segment (bg + text; audio is muxed at the end)."""
         return os.path.join(TEMP_DIR, f"{self.job_id}_segment_{idx:03d}.mp4")
 
     # ---- Bismillah (single segment, ayah_num=0) ----
@@ -230,9 +271,6 @@ class JobContext:
     def bismillah_text_png(self) -> str:
         return os.path.join(TEMP_DIR, f"{self.job_id}_text_000_bismillah.png")
 
-    def bismillah_audio(self) -> str:
-        return os.path.join(TEMP_DIR, f"{self.job_id}_audio_000_bismillah.mp3")
-
     def bismillah_segment(self) -> str:
         return os.path.join(TEMP_DIR, f"{self.job_id}_segment_000_bismillah.mp4")
 
@@ -249,6 +287,14 @@ class JobContext:
     def chunk_video_path(self, ci: int) -> str:
         return os.path.join(TEMP_DIR, f"{self.job_id}_chunk_{ci:03d}_{int(time.time() * 1000)}.mp4")
 
+    def timeline_list_path(self) -> str:
+        """Concat demuxer list of the continuous-timeline background."""
+        return os.path.join(TEMP_DIR, f"{self.job_id}_timeline_{int(time.time() * 1000)}.txt")
+
+    def audio_track_path(self) -> str:
+        """The whole video's audio timeline, AAC-encoded once."""
+        return os.path.join(TEMP_DIR, f"{self.job_id}_audio_track.m4a")
+
     def temp_output_path(self, ascii_name: str) -> str:
         """In-progress final mp4 in TEMP_DIR (gets renamed/moved to
         ``outputs/video/`` after the crossfade/merge step)."""
@@ -296,7 +342,6 @@ def start_new_job() -> JobContext:
     guarded by a global lock so two threads can't race to reset it
     mid-build.
     """
-    global _circuit_breaker_failures, _circuit_breaker_last_failure
     ctx = JobContext()
     _job_local.ctx = ctx
     with _current_job_lock:
@@ -309,8 +354,7 @@ def start_new_job() -> JobContext:
         # breaker in "open" state and the next build is rejected for
         # the next 60 s even though it may target a different reciter
         # / network / etc.
-        _circuit_breaker_failures = 0
-        _circuit_breaker_last_failure = 0
+        get_download_breaker().reset()
     logging.info(f"Started new job: job_id={ctx.job_id}")
     return ctx
 
@@ -406,7 +450,7 @@ def _premerge_chunks(chunk_groups, segment_results, seg_durations):
         cmd = [
             FFMPEG_EXE, '-y', '-f', 'concat', '-safe', '0', '-i', list_path,
             '-c:v', 'libx264', '-preset', 'ultrafast', '-threads', '4',
-            '-c:a', 'aac', '-b:a', '192k',
+            '-an',
             '-movflags', '+faststart',
             out_path,
         ]
@@ -421,6 +465,84 @@ def _premerge_chunks(chunk_groups, segment_results, seg_durations):
     return chunk_paths, chunk_durations
 
 
+# Audio source that stands for silence: rendered in-graph by ffmpeg's
+# ``anullsrc`` (44.1 kHz stereo, like the downloaded recitations) instead
+# of an mp3 written to disk first.
+SILENT_AUDIO = 'lavfi:anullsrc'
+
+
+def audio_input_args(audio_source, duration_sec):
+    """ffmpeg input arguments for an audio source path or ``SILENT_AUDIO``."""
+    if audio_source == SILENT_AUDIO:
+        return ['-f', 'lavfi', '-t', f'{duration_sec:.3f}',
+                '-i', 'anullsrc=channel_layout=stereo:sample_rate=44100']
+    return ['-i', audio_source]
+
+
+def clamp_reciter_tempo(reciter_speed):
+    """ffmpeg ``atempo`` factor for a reciter_speed value.
+
+    atempo is limited to [0.5, 2.0] per instance, so values outside that
+    range are clamped; ``None`` / 0 mean normal speed.
+    """
+    if not reciter_speed:
+        return 1.0
+    return max(0.5, min(2.0, float(reciter_speed)))
+
+
+def build_audio_track(segment_results, seg_durations, chunk_groups, xfade_d, output_path):
+    """Render the whole video's audio timeline in one ffmpeg pass.
+
+    Segments are video-only, so the recitation is decoded from the source
+    mp3s (plus the Bismillah silence) exactly once and encoded to AAC
+    exactly once, here; the final pass muxes the result with ``-c:a copy``.
+
+    Each source is tempo-adjusted, gain-matched (see
+    :func:`get_loudness_gain_db`) and padded / trimmed to its segment's
+    duration, sources inside a chunk are joined with hard cuts, and
+    consecutive chunks are joined with ``acrossfade`` of ``xfade_d`` —
+    mirroring the video xfade chain so audio and picture stay aligned.
+    ``chunk_groups`` is the output of :func:`_split_into_chunks`
+    (``[list(range(n))]`` for a plain concat).
+    """
+    job = current_job()
+    inputs = []
+    parts = []
+    for i, (_, seg_path) in enumerate(segment_results):
+        audio_path, tempo, gain_db = job.segment_audio[seg_path]
+        inputs.extend(audio_input_args(audio_path, seg_durations[i]))
+        chain = f"[{i}:a]aformat=sample_rates=44100:channel_layouts=stereo"
+        if tempo and abs(tempo - 1.0) > 1e-6:
+            chain += f",atempo={tempo:.3f}"
+        if abs(gain_db) >= 0.05:
+            chain += f",volume={gain_db:.2f}dB"
+        chain += f",apad,atrim=duration={seg_durations[i]:.6f},asetpts=PTS-STARTPTS[s{i}]"
+        parts.append(chain)
+    for ci, chunk in enumerate(chunk_groups):
+        if len(chunk) == 1:
+            parts.append(f"[s{chunk[0]}]anull[c{ci}]")
+        else:
+            parts.append("".join(f"[s{i}]" for i in chunk)
+                         + f"concat=n={len(chunk)}:v=0:a=1[c{ci}]")
+    last = "c0"
+    for ci in range(1, len(chunk_groups)):
+        parts.append(f"[{last}][c{ci}]acrossfade=d={xfade_d}[x{ci}]")
+        last = f"x{ci}"
+
+    cmd = [FFMPEG_EXE, '-y', '-hide_banner', '-loglevel', 'error'] + inputs + [
+        '-filter_complex', ';'.join(parts),
+        '-map', f'[{last}]',
+        '-c:a', 'aac', '-b:a', '192k',
+        output_path,
+    ]
+    res = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+    if res.returncode != 0 or not os.path.exists(output_path):
+        raise RuntimeError(f"Audio track render failed: {res.stderr.strip()}")
+    logging.info(f"Audio track rendered: {len(segment_results)} sources, "
+                 f"{len(chunk_groups)} chunk(s) -> {output_path}")
+    return output_path
+
+
 # Default audio length used when an ayah is not yet in the cache and the
 # target_duration_seconds cap is being estimated.  Conservative — actual
 # recitation is usually shorter.
@@ -430,59 +552,66 @@ _AYAH_DURATION_ESTIMATE_SEC = 5.0
 def _estimate_ayah_duration(reciter_id, surah, ayah):
     """Return the cached audio duration of one ayah, or a default if
     not yet cached.  Used to pre-compute the target_duration_seconds cap
-    before the parallel download pool opens.
+    before the parallel download pool opens.  Reads the persistent audio
+    index, so a warm 50-ayah cap check spawns no processes.
     """
-    p = get_cached_audio_path(reciter_id, surah, ayah)
-    if os.path.exists(p) and os.path.getsize(p) > 1000:
-        try:
-            return get_audio_duration_ffprobe(p)
-        except Exception:
-            pass
-    return _AYAH_DURATION_ESTIMATE_SEC
+    d = get_cached_audio_duration(reciter_id, surah, ayah)
+    return d if d else _AYAH_DURATION_ESTIMATE_SEC
 
-def cleanup_audio_cache():
-    """Clean audio cache if it exceeds limits"""
+
+def get_cached_audio_duration(reciter_id, surah, ayah):
+    """Duration of the cached mp3 for one ayah from the audio index, or
+    ``None`` if the ayah is not cached."""
+    p = get_cached_audio_path(reciter_id, surah, ayah)
+    if not (os.path.exists(p) and os.path.getsize(p) > 1000):
+        return None
     try:
-        # Get all audio files
-        audio_files = []
-        for root, dirs, files in os.walk(AUDIO_CACHE_DIR):
-            for file in files:
-                if file.endswith('.mp3'):
-                    file_path = os.path.join(root, file)
-                    stat = os.stat(file_path)
-                    audio_files.append((file_path, stat.st_size, stat.st_mtime))
-
-        # Sort by last accessed time (LRU)
-        audio_files.sort(key=lambda x: x[2])
-
-        # Check size limit
-        total_size = sum(size for _, size, _ in audio_files) / (1024 * 1024)  # MB
-
-        # Remove oldest files if limits exceeded
-        files_to_remove = []
-        if total_size > AUDIO_CACHE_MAX_SIZE_MB or len(audio_files) > AUDIO_CACHE_MAX_FILES:
-            excess_size = total_size - AUDIO_CACHE_MAX_SIZE_MB
-            excess_files = len(audio_files) - AUDIO_CACHE_MAX_FILES
-
-            for file_path, size, _ in audio_files:
-                if excess_size > 0 or excess_files > 0:
-                    files_to_remove.append(file_path)
-                    excess_size -= size / (1024 * 1024)
-                    excess_files -= 1
-                else:
-                    break
+        return get_audio_index().duration(reciter_id, surah, ayah, p)
+    except Exception as e:
+        logging.debug(f"Audio index lookup failed for {surah}:{ayah}: {e}")
+        return None
 
-        # Remove files
-        for file_path in files_to_remove:
-            try:
-                os.remove(file_path)
-                logging.debug(f"Removed old cache file: {os.path.basename(file_path)}")
-            except:
-                pass
+def get_loudness_gain_db(reciter_id, surah, ayah):
+    """Gain (dB) that brings the cached recitation of one ayah to
+    ``LOUDNESS_TARGET_LUFS``.
+
+    Uses the EBU R128 measurement cached in the audio index (one ffmpeg
+    ``ebur128`` pass the first time a file is used).  Boosts are capped
+    so the true peak stays under ``LOUDNESS_PEAK_CEILING_DB``; silent or
+    unmeasurable files, and ``QURAN_LOUDNESS_NORMALIZE=false``, get 0.
+    """
+    if not LOUDNESS_NORMALIZE:
+        return 0.0
+    p = get_cached_audio_path(reciter_id, surah, ayah)
+    try:
+        measured = get_audio_index().loudness(reciter_id, surah, ayah, p)
+    except Exception as e:
+        logging.debug(f"Loudness lookup failed for {surah}:{ayah}: {e}")
+        return 0.0
+    if measured is None:
+        return 0.0
+    loudness, peak = measured
+    if loudness <= -70.0:
+        return 0.0
+    gain = LOUDNESS_TARGET_LUFS - loudness
+    gain = min(gain, LOUDNESS_PEAK_CEILING_DB - peak)
+    return max(-LOUDNESS_MAX_GAIN_DB, min(LOUDNESS_MAX_GAIN_DB, gain))
 
-        if files_to_remove:
-            logging.info(f"Cleaned {len(files_to_remove)} old audio cache files")
+def cleanup_audio_cache():
+    """Sync the audio cache index with disk and enforce the size limits.
 
+    Runs once at startup.  While the server is up, limits are enforced
+    incrementally by the index on every cache fill (see
+    ``quran_reels.services.audio_index``), so this full walk is only
+    needed to pick up files added or removed outside the index.
+    """
+    try:
+        index = get_audio_index()
+        index.reconcile()
+        evicted = index.enforce_limits()
+        if evicted:
+            logging.info(f"Cleaned {evicted} old audio cache files")
+        logging.info(f"Audio cache: {index.stats()}")
     except Exception as e:
         logging.warning(f"Audio cache cleanup failed: {e}")
 
@@ -541,6 +670,12 @@ if not FFPROBE_EXE and FFMPEG_EXE:
 
 VISION_DIR = _env("QURAN_VISION_DIR", os.path.join(BUNDLE_DIR, "vision"))
 UI_PATH = _env("QURAN_UI_PATH", os.path.join(BUNDLE_DIR, "UI.html"))
+# Offline Uthmani text corpus (see quran_reels.services.corpus); without
+# it ayah text is fetched from api.alquran.cloud.
+CORPUS_PATH = _env("QURAN_CORPUS_PATH", os.path.join(BUNDLE_DIR, "data", CORPUS_FILENAME))
+# Persistent ayah text store shared by every process (see
+# quran_reels.services.text_store).
+TEXT_CACHE_PATH = _env("QURAN_TEXT_CACHE_PATH", os.path.join(EXEC_DIR, "cache", "text.sqlite3"))
 
 OUT_DIR = _env("QURAN_OUT_DIR", os.path.join(EXEC_DIR, "outputs"))
 VIDEO_DIR = os.path.join(OUT_DIR, "video")
@@ -1313,6 +1448,63 @@ def render_arabic_to_pil_image(text, fontsize=80, color='#FFFFFF',
 TARGET_W = _env("QURAN_TARGET_W", 1080, int)
 TARGET_H = _env("QURAN_TARGET_H", 1920, int)
 
+
+class Canvas(NamedTuple):
+    """Resolution and frame rate a build composites at."""
+    width: int
+    height: int
+    fps: int
+
+    @property
+    def scale(self):
+        """Size relative to the output (TARGET_W); text is drawn at this scale."""
+        return self.width / TARGET_W
+
+
+FULL_CANVAS = Canvas(TARGET_W, TARGET_H, PREPROCESS_FPS)
+
+# Proxy tier: previews and the qualities listed in QURAN_PROXY_QUALITIES
+# decode backgrounds, render text and overlay at this size, a quarter of
+# the pixels, and are upscaled to TARGET_W x TARGET_H only by the final
+# encode (previews are not upscaled at all).
+BG_PROXY = _env("QURAN_BG_PROXY", True,
+                lambda s: str(s).lower() in ("1", "true", "yes", "on"))
+PROXY_CANVAS = Canvas(_env("QURAN_PROXY_W", TARGET_W // 2, int),
+                      _env("QURAN_PROXY_H", TARGET_H // 2, int),
+                      _env("QURAN_PROXY_FPS", 24, int))
+PROXY_QUALITIES = frozenset(
+    q.strip() for q in _env("QURAN_PROXY_QUALITIES", "low").split(",") if q.strip())
+
+# Preprocessed-background tiers kept by background ingestion, as
+# (width, height, fps); the first is the one the rotator waits for.
+BG_TIERS = [tuple(FULL_CANVAS)] + ([tuple(PROXY_CANVAS)] if BG_PROXY else [])
+
+
+def canvas_for_quality(quality):
+    """The canvas a build at ``quality`` composites at."""
+    if BG_PROXY and quality in PROXY_QUALITIES:
+        return PROXY_CANVAS
+    return FULL_CANVAS
+
+# Background ingestion: new videos in VISION_DIR are preprocessed by a
+# low-priority process pool before the rotator offers them to a build.
+BG_INGEST = _env("QURAN_BG_INGEST", True,
+                 lambda s: str(s).lower() in ("1", "true", "yes", "on"))
+BG_INGEST_WORKERS = _env("QURAN_BG_INGEST_WORKERS", 1, int)
+
+# Continuous-timeline mode is opt-in: enabled by QURAN_CONTINUOUS_TIMELINE or
+# a per-request ``continuousTimeline: true``, it renders the whole video in
+# one ffmpeg pass (see build_timeline_ffmpeg).  It only takes effect when the
+# template has no crossfades; other builds render segment by segment.
+CONTINUOUS_TIMELINE = _env("QURAN_CONTINUOUS_TIMELINE", False,
+                           lambda s: str(s).lower() in ("1", "true", "yes", "on"))
+
+# Segments read backgrounds as keyframe-aligned clips from a random
+# offset (see quran_reels.services.bg_cache) instead of looping each
+# file from its first frame.
+BG_CLIPS = _env("QURAN_BG_CLIPS", True,
+                lambda s: str(s).lower() in ("1", "true", "yes", "on"))
+
 # =============================================================================
 # STEP 10: IMPORTS FOR VIDEO PROCESSING
 # =============================================================================
@@ -1322,8 +1514,6 @@ TARGET_H = _env("QURAN_TARGET_H", 1920, int)
 # is left on disk in case a future dependency reintroduces the need.)
 
 import numpy as np
-import requests as http_requests
-from urllib3.util.retry import Retry
 from urllib3 import disable_warnings
 disable_warnings()  # Disable SSL warnings
 import shutil
@@ -1392,9 +1582,6 @@ def update_ayah_progress(current, total, stage='processing'):
 # STEP 11: UTILITY FUNCTIONS
 # =============================================================================
 
-# Cache for ayah texts (avoid duplicate API calls)
-AYAH_TEXT_CACHE = {}
-
 def get_audio_duration_ffprobe(audio_path):
     """Get audio duration using ffprobe"""
     exe = FFPROBE_EXE or "ffprobe"
@@ -1406,41 +1593,38 @@ def get_audio_duration_ffprobe(audio_path):
     out = subprocess.run(cmd, capture_output=True, text=True, timeout=10, check=True)
     return float(out.stdout.strip())
 
+def get_audio_duration(audio_path):
+    """Get mp3 duration in-process (frame / Xing header parse), falling
+    back to ffprobe for anything the parser cannot read."""
+    return probe_duration(audio_path)
+
 # =============================================================================
 # STEP 12: DATA FETCHING (ENHANCED WITH RETRY & CIRCUIT BREAKER)
 # =============================================================================
 
-# Circuit breaker state
-_circuit_breaker_failures = 0
-_circuit_breaker_last_failure = 0
-_circuit_breaker_threshold = 5
-_circuit_breaker_timeout = 60  # seconds
+# Circuit breaker state lives in quran_reels.utils.breaker, shared with
+# the fetch engine; these wrappers keep the old entry points.
 
 def is_circuit_breaker_open():
     """Check if circuit breaker is open"""
-    global _circuit_breaker_failures, _circuit_breaker_last_failure
-
-    if _circuit_breaker_failures >= _circuit_breaker_threshold:
-        # Check if timeout has passed
-        if time.time() - _circuit_breaker_last_failure > _circuit_breaker_timeout:
-            _circuit_breaker_failures = 0  # Reset
-            return False
-        return True
-    return False
+    return get_download_breaker().is_open()
 
 def record_download_success():
     """Record successful download"""
-    global _circuit_breaker_failures
-    _circuit_breaker_failures = 0
+    get_download_breaker().record_success()
 
 def record_download_failure():
-    """Record download failure"""
-    global _circuit_breaker_failures, _circuit_breaker_last_failure
-    _circuit_breaker_failures += 1
-    _circuit_breaker_last_failure = time.time()
+    """Record one ayah whose mirrors all failed"""
+    get_download_breaker().record_failure()
 
 def download_audio(reciter_id, surah, ayah, idx):
-    """Download audio for one ayah with enhanced retry logic and circuit breaker"""
+    """Download audio for one ayah with mirror fallback and circuit breaker.
+
+    Cache misses are filled through the shared fetch engine
+    (``quran_reels.services.fetch``) so mirror fallback, retries and
+    back-off are async and count against the same per-host limits as
+    every other download in the process.
+    """
     fn = f'{surah:03d}{ayah:03d}.mp3'
 
     # Check circuit breaker first
@@ -1452,307 +1636,160 @@ def download_audio(reciter_id, surah, ayah, idx):
 
     if os.path.exists(cached_path) and os.path.getsize(cached_path) > 1000:
         logging.debug(f"Using cached audio: {fn}")
-        # Copy to temp directory for processing (job-scoped filename)
-        out = current_job().audio_path(idx)
-        shutil.copy2(cached_path, out)
-        return out
-
-    # Try multiple sources with different domains
-    sources = [
-        f'https://everyayah.com/data/{reciter_id}/{fn}',
-        f'https://download.quranicaudio.com/quran/{reciter_id}/{fn}',
-        f'https://www.everyayah.com/data/{reciter_id}/{fn}',
-        f'https://mp3.quranicaudio.com/quran/{reciter_id}/{fn}'
-    ]
-
-    out = current_job().audio_path(idx)
-
-    # Enhanced session with better retry strategy
-    session = http_requests.Session()
-    retry_strategy = Retry(
-        total=5,  # Increased retries
-        backoff_factor=2,  # Exponential backoff
-        status_forcelist=[429, 500, 502, 503, 504, 408],  # Include timeout
-        allowed_methods=["GET"]
-    )
-    adapter = http_requests.adapters.HTTPAdapter(max_retries=retry_strategy)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-
-    for attempt, url in enumerate(sources, 1):
         try:
-            logging.debug(f"Downloading audio from source {attempt}: {url}")
-
-            # Add exponential delay between attempts
-            if attempt > 1:
-                delay = min(2 ** (attempt - 2), 10)  # Max 10 seconds
-                time.sleep(delay)
-                logging.debug(f"Retry delay: {delay}s")
-
-            r = session.get(url, timeout=30)  # Longer timeout
-            r.raise_for_status()
-
-            with open(out, 'wb') as f:
-                f.write(r.content)
-
-            # Verify file has content
-            if os.path.getsize(out) < 1000:
-                raise ValueError(f"Audio file too small: {os.path.getsize(out)} bytes")
-
-            logging.debug(f"Audio downloaded: {fn} ({os.path.getsize(out)} bytes)")
-
-            # Save to cache (the downloaded file as-is)
-            try:
-                os.makedirs(os.path.dirname(cached_path), exist_ok=True)
-                shutil.copy2(out, cached_path)
-                logging.debug(f"Audio cached: {cached_path}")
-            except Exception as e:
-                logging.warning(f"Failed to cache audio: {e}")
-
-            # ✅ NO TRIMMING AT ALL - Keep original Quran recitation intact
-            record_download_success()
-            return out
-
+            get_audio_index().touch(reciter_id, surah, ayah)
         except Exception as e:
-            logging.warning(f"Source {attempt} failed: {e}")
-            record_download_failure()
-
-            if attempt < len(sources):
-                continue
-            else:
-                # All sources failed - check if circuit breaker should open
-                if _circuit_breaker_failures >= _circuit_breaker_threshold:
-                    logging.error("Circuit breaker opened due to consecutive failures")
-
-                raise RuntimeError(f"Failed to download audio for {surah}:{ayah} from all sources")
+            logging.debug(f"Audio index touch failed for {fn}: {e}")
+    else:
+        engine = get_fetch_engine()
+        res = engine.submit(engine.fetch_audio(reciter_id, surah, ayah)).result()
+        if not res.ok:
+            # All sources failed (the engine counts it on the breaker)
+            raise RuntimeError(f"Failed to download audio for {surah}:{ayah} from all sources")
+        logging.debug(f"Audio downloaded: {fn} ({os.path.getsize(cached_path)} bytes)")
+
+    # Stage into the temp directory for processing (job-scoped filename)
+    # by hardlink / reflink — no byte copy on the common path.  The link
+    # also pins the inode, so evicting the cache entry mid-build is safe.
+    # ✅ NO TRIMMING AT ALL - Keep original Quran recitation intact
+    out = current_job().audio_path(idx)
+    method = link_or_copy(cached_path, out)
+    logging.debug(f"Staged {fn} into job temp via {method}")
+    return out
 
 def download_audio_parallel(reciter_id, ayah_list, max_workers=4):
-    """Download multiple audio files in parallel with rate limiting"""
-    import concurrent.futures
-    import threading
-
+    """Download multiple audio files concurrently through the fetch engine.
+
+    Every ayah is fetched at once on the shared asyncio engine
+    (``quran_reels.services.fetch``), which enforces the per-host
+    concurrency and token-bucket limits — no thread sleeps to rate-limit.
+    The filled cache entries are then staged into the job's temp dir via
+    ``download_audio`` (a cache hit).  ``max_workers`` is kept for API
+    compatibility; concurrency is governed by the per-host limits.
+    """
     results = {}
-    download_lock = threading.Lock()
-    last_download_time = 0
-    min_delay = 0.5  # Minimum delay between downloads to respect rate limits
-
-    def download_with_delay(args):
-        nonlocal last_download_time
-
-        reciter_id, surah, ayah, idx = args
-
-        # Rate limiting
-        with download_lock:
-            nonlocal last_download_time
-            current_time = time.time()
-            if current_time - last_download_time < min_delay:
-                time.sleep(min_delay - (current_time - last_download_time))
-            last_download_time = time.time()
-
-        try:
-            audio_path = download_audio(reciter_id, surah, ayah, idx)
-            return (ayah, audio_path, None)
-        except Exception as e:
-            return (ayah, None, str(e))
-
-    # Prepare arguments
-    download_args = [(reciter_id, ayah['surah'], ayah['ayah'], ayah['idx'])
-                     for ayah in ayah_list]
-
-    # Download in parallel
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_ayah = {executor.submit(download_with_delay, args): args for args in download_args}
-
-        for future in concurrent.futures.as_completed(future_to_ayah):
-            ayah, audio_path, error = future.result()
-            if error:
-                logging.error(f"Failed to download ayah {ayah}: {error}")
-                results[ayah] = {'error': error}
-            else:
-                results[ayah] = {'path': audio_path}
-                logging.debug(f"Downloaded ayah {ayah} in parallel")
+    by_ayah = {a['ayah']: a for a in ayah_list}
+    engine = get_fetch_engine()
+
+    # Group by surah so each call is one fetch_build fan-out.
+    surahs = sorted({a['surah'] for a in ayah_list})
+    for surah in surahs:
+        ayahs = [a['ayah'] for a in ayah_list if a['surah'] == surah]
+        queue_, _ = engine.fetch_build(reciter_id, surah, ayahs, with_text=False)
+        for res in iter(queue_.get, None):
+            if not res.ok:
+                logging.error(f"Failed to download ayah {res.ayah}: {res.error}")
+                results[res.ayah] = {'error': res.error}
+                continue
+            try:
+                path = download_audio(reciter_id, surah, res.ayah, by_ayah[res.ayah]['idx'])
+                results[res.ayah] = {'path': path}
+                logging.debug(f"Downloaded ayah {res.ayah} in parallel")
+            except Exception as e:
+                logging.error(f"Failed to download ayah {res.ayah}: {e}")
+                results[res.ayah] = {'error': str(e)}
 
     return results
 
-def get_ayah_text(surah, ayah):
-    """Fetch ayah text from API with cache"""
-    cache_key = f"{surah}:{ayah}"
 
-    # Check cache first
-    if cache_key in AYAH_TEXT_CACHE:
-        logging.debug(f"Using cached text for {cache_key}")
-        return AYAH_TEXT_CACHE[cache_key]
+def prefetch_build_inputs(reciter_id, surah, start_ayah, last_ayah):
+    """Fetch all audio and text of a build up front, concurrently.
 
-    try:
-        resp = http_requests.get(
-            f'https://api.alquran.cloud/v1/ayah/{surah}:{ayah}/quran-uthmani',
-            timeout=10
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        text = data['data']['text'].replace('\ufeff', '').replace('\u200b', '').strip()
+    Fills the audio cache, and the text store with the whole surah (one
+    request, skipped when the offline corpus or the store already has
+    it), so the per-ayah workers only see cache hits.  Failures are
+    logged and left to ``download_audio`` / ``get_ayah_texts``, which
+    retry on their own.  Returns ``(n_ok, n_failed)``.
+    """
+    engine = get_fetch_engine()
+    store = get_text_store()
+    results, _ = engine.fetch_build(
+        reciter_id, surah, range(start_ayah, last_ayah + 1),
+        with_text=get_corpus() is None and not store.has_surah(surah),
+    )
+    n_ok = n_failed = 0
+    for res in iter(results.get, None):
+        if not res.ok:
+            n_failed += 1
+            logging.warning(f"Prefetch {res.kind} {res.surah}:{res.ayah} failed: {res.error}")
+            continue
+        n_ok += 1
+        if res.kind == 'text':
+            store.put_surah(res.surah, res.texts)
+    return n_ok, n_failed
 
-        if not text or len(text) < 5:
-            raise ValueError(f"Ayah text too short: {text}")
 
-        # Cache the result
-        AYAH_TEXT_CACHE[cache_key] = text
-        return text
-    except Exception as e:
-        logging.debug(f"Text fetch failed, retrying once: {e}")
-        # One retry
-        resp = http_requests.get(
-            f'https://api.alquran.cloud/v1/ayah/{surah}:{ayah}/quran-uthmani',
-            timeout=10
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        text = data['data']['text'].replace('\ufeff', '').replace('\u200b', '').strip()
-        AYAH_TEXT_CACHE[cache_key] = text
-        return text
+def get_ayah_text(surah, ayah):
+    """Text of one ayah: offline corpus, else the persistent text store
+    (which fetches the whole surah on a miss)."""
+    return get_ayah_texts(surah, ayah, ayah)[ayah]
 
 # =============================================================================
 # STEP 13: BACKGROUND HANDLING (CACHED)
 # =============================================================================
 
-BG_CACHE = {}
-
 def init_bg_cache():
-    """Scan background folders once at startup"""
-    global BG_CACHE
-    styles = ['nature', 'islamic', 'masjid', 'night']  # Removed 'colorful'
-
-    for style in styles:
-        style_dir = os.path.join(VISION_DIR, style)
-        files = []
-
-        # Check if style folder exists
-        if os.path.isdir(style_dir):
-            files = [f for f in os.listdir(style_dir) if f.endswith('.mp4')]
-            logging.debug(f"Found {len(files)} files in {style_dir}/")
-        else:
-            # Fallback: try old pattern-based naming in main vision folder
-            pattern = f"{style}_part"
-            space_pattern = pattern.replace('_', ' ')
-            files = [f for f in os.listdir(VISION_DIR)
-                     if (f.startswith(pattern) or f.startswith(space_pattern))
-                     and f.endswith('.mp4')]
-            if files:
-                logging.debug(f"Fallback: Found {len(files)} files with pattern '{pattern}' in main folder")
+    """Scan (and probe) the background library once at startup.
 
-        BG_CACHE[style] = files
-        BG_CACHE[f"{style}_part"] = files  # Also store by pattern for fallback
-
-    logging.debug(f"BG cache initialized: {len(BG_CACHE)} styles")
+    The scan is kept as an immutable snapshot by
+    :mod:`quran_reels.services.bg_index` and refreshed only when a
+    directory in the library changes.
+    """
+    snap = get_background_index().refresh()
+    logging.debug(f"BG index initialized: {len(snap.by_path)} videos, "
+                  f"{len(snap.styles)} style folders")
 
 # NOTE: init_bg_cache() is called inside the __main__ block (bottom of file)
 # so it runs after all other definitions are in place.
 
 def pick_bg(style='nature', count=1):
     """Select background video(s) from style-specific folders"""
-    init_bg_cache() # Refresh list of available files
-
-    files = BG_CACHE.get(style, [])
+    snap = get_background_index().snapshot()
+    files = snap.paths(style)
 
     # Fallback to nature if style has no files
     if not files:
-        files = BG_CACHE.get('nature', [])
+        files = snap.paths('nature')
 
     if not files:
         raise ValueError(f"No background videos found for style '{style}' or 'nature'")
 
     if count == 1:
-        # Return full path to the selected file
-        selected_file = random.choice(files)
-        style_dir = os.path.join(VISION_DIR, style)
+        return random.choice(files)
+    return random.sample(files, min(count, len(files)))
 
-        # Check if style folder exists, fallback to main vision folder
-        if os.path.isdir(style_dir):
-            return os.path.join(style_dir, selected_file)
-        else:
-            return os.path.join(VISION_DIR, selected_file)
-    else:
-        selected = random.sample(files, min(count, len(files)))
-        style_dir = os.path.join(VISION_DIR, style)
+# Background preparation started ahead of need (see process_single_ayah_ffmpeg).
+_BG_PREP_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix='bg-prep')
 
-        if os.path.isdir(style_dir):
-            return [os.path.join(style_dir, f) for f in selected]
-        else:
-            return [os.path.join(VISION_DIR, f) for f in selected]
 
-def get_preprocessed_bg(bg_path, target_w=TARGET_W, target_h=TARGET_H):
-    """Get or create preprocessed background video (cached)"""
-    os.makedirs(BG_CACHE_DIR, exist_ok=True)
-    base = os.path.splitext(os.path.basename(bg_path))[0]
-    cached_path = os.path.join(BG_CACHE_DIR, f"{base}_{target_w}x{target_h}.mp4")
+def get_preprocessed_bg(bg_path, target_w=TARGET_W, target_h=TARGET_H, fps=PREPROCESS_FPS):
+    """Get or create preprocessed background video (cached).
 
-    if os.path.isfile(cached_path):
-        # Check if file is valid (not 0 or too small, which indicates corruption)
-        if os.path.getsize(cached_path) > 5000:  # At least 5KB
-            # Additional validation: try to read the file with FFprobe
-            try:
-                result = subprocess.run([
-                    FFPROBE_EXE,
-                    '-v', 'error',
-                    '-show_format',
-                    '-show_streams',
-                    cached_path
-                ], capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    logging.debug(f"Using cached background: {os.path.basename(cached_path)}")
-                    return cached_path
-                else:
-                    logging.warning(f"Corrupted cache file (FFprobe failed): {cached_path}")
-            except Exception as e:
-                logging.warning(f"Cache validation failed: {e}")
-
-            # Remove corrupted file
-            try:
-                os.remove(cached_path)
-                logging.info(f"Removed corrupted cache file: {cached_path}")
-            except:
-                pass
-        else:
-            logging.warning(f"Cache file too small: {cached_path}")
-            try:
-                os.remove(cached_path)
-            except:
-                pass
+    See :mod:`quran_reels.services.bg_cache`: entries are keyed by the
+    source video and tier (size and fps) and validated against their
+    manifest with a ``stat``.
+    """
+    cached = get_bg_cache().get(bg_path, target_w, target_h, fps)
+    if cached != bg_path:
+        get_background_index().mark_prepared(bg_path, variant_name(target_w, target_h, fps))
+    return cached
 
-    # Normalize BG to avoid FFmpeg concat/filter issues (fps/pix_fmt/scale)
-    logging.info(f"Preprocessing background: {os.path.basename(bg_path)}")
-    vf = f"scale={target_w}:{target_h}:force_original_aspect_ratio=increase,crop={target_w}:{target_h},fps=30,format=yuv420p"
-    cmd = [
-        FFMPEG_EXE, "-y", "-i", bg_path,
-        "-vf", vf, "-an",
-        "-r", "30",
-        "-c:v", "libx264",
-        "-preset", "ultrafast", "-crf", "32", "-threads", "4",
-        "-pix_fmt", "yuv420p",
-        cached_path
-    ]
 
-    try:
-        logging.info(f"Running FFmpeg preprocessing: {' '.join(cmd[:8])}...")
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=120)
+def background_input_args(bg_path, duration, list_path):
+    """FFmpeg input args for ``duration`` seconds of a preprocessed background.
 
-        # Verify the output file was created successfully
-        if os.path.exists(cached_path) and os.path.getsize(cached_path) > 5000:
-            logging.info(f"Background cached successfully: {os.path.basename(cached_path)}")
-            return cached_path
-        else:
-            logging.error(f"FFmpeg output file invalid: {cached_path}")
-            return bg_path  # Fallback to original
+    Uses the entry's keyframe-aligned clip library when it has one: the
+    clips covering ``duration`` from a random clip, as a concat list
+    written to ``list_path``.  Returns ``(args, list_path)``, or the old
+    ``-stream_loop -1`` input and ``None`` for a file without clips (e.g.
+    the original video after a failed transcode).
+    """
+    clips = get_bg_cache().clips(bg_path) if BG_CLIPS else None
+    if clips is None:
+        return ["-stream_loop", "-1", "-i", bg_path], None
+    clips.write_concat_list(list_path, duration, start=random.randrange(len(clips.clips)))
+    return ["-f", "concat", "-safe", "0", "-i", list_path], list_path
 
-    except subprocess.TimeoutExpired:
-        logging.warning(f"Background preprocessing timeout, using original: {os.path.basename(bg_path)}")
-        return bg_path  # Fallback to original
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Background preprocessing failed: {e.stderr}")
-        return bg_path  # Fallback to original
-    except Exception as e:
-        logging.error(f"Unexpected error in preprocessing: {e}")
-        return bg_path  # Fallback to original
 
 # =============================================================================
 # STEP 13.5: DYNAMIC TEXT COLOR ANALYZER  (refactored — see quran_reels.services.contrast)
@@ -1801,26 +1838,62 @@ def _supersample_for_quality(quality):
     return {'low': 2, 'medium': 2, 'high': 4}.get(quality, 2)
 
 
-def _fontsize_for_wordcount(word_count, size_mult):
-    if word_count > 60:
-        return int(50 * size_mult), 7
-    if word_count > 40:
-        return int(60 * size_mult), 6
-    if word_count > 25:
-        return int(70 * size_mult), 5
-    if word_count > 15:
-        return int(80 * size_mult), 4
-    return int(95 * size_mult), 3
+def _rendering_font_tuning_mult(font_path, text):
+    """``size_mult`` tuning the shaping renderer will apply for ``text``
+    drawn with ``font_path`` (after its coverage fallback); 1.0 when the
+    legacy PIL path will be used."""
+    if not (font_path and os.path.exists(font_path)):
+        return 1.0
+    try:
+        from quran_reels.services.shaping import select_rendering_font
+    except ImportError:
+        return 1.0
+    chosen_path = select_rendering_font(font_path, text)[0]
+    return _get_font_tuning(chosen_path).get("size_mult", 1.0)
+
+
+def _text_width(scale=1.0):
+    """Width of the text block on a canvas at ``scale``."""
+    return int(round((TARGET_W - 160) * scale))
+
+
+def get_text_layout(arabic_text, template, selected_font=None, quality='medium', ref=None,
+                    scale=1.0):
+    """Geometry of the text card ``render_text_to_png`` will produce.
+
+    Computed analytically (no rendering) and, when ``ref`` names the
+    text (``"surah:ayah"``), kept in the layout index so later builds
+    with the same template / font / quality skip even that.  ``scale``
+    is the build canvas's (0.5 on the proxy tier).
+    """
+    template_config = TEMPLATES.get(template, TEMPLATES['normal'])
+    font_path, font_name = _resolve_template_font(template_config, selected_font)
+    text_width = _text_width(scale)
+    key = layout_key(ref, template, font_name, quality, text_width) if ref else None
+    index = get_layout_index() if key else None
+    if index is not None:
+        layout = index.get(key)
+        if layout is not None:
+            return layout
+    layout = compute_layout(arabic_text, template_config['font_size_mult'] * scale, text_width,
+                            tuning_mult=_rendering_font_tuning_mult(font_path, arabic_text))
+    if index is not None:
+        index.put(key, layout)
+    return layout
 
 
 def render_text_to_png(arabic_text, template, output_png_path, selected_font=None,
-                       quality='medium', text_color=None, stroke_color=None):
+                       quality='medium', text_color=None, stroke_color=None, layout=None,
+                       scale=1.0):
     """
     Render Arabic text to PNG using the unified, broadcast-grade renderer.
 
     Honours per-template font + glow settings and the quality preset's supersample.
     Pass `text_color` / `stroke_color` to override the template's defaults
     (used for dynamic contrast-based coloring from get_contrasting_text_color).
+    `layout` is the text's :class:`TextLayout` from get_text_layout, if
+    the caller already has it.  `scale` is the build canvas's; font size,
+    stroke, shadow and glow shrink with it on the proxy tier.
     """
     template_config = TEMPLATES.get(template, TEMPLATES['normal'])
 
@@ -1828,9 +1901,12 @@ def render_text_to_png(arabic_text, template, output_png_path, selected_font=Non
     font_path, font_name = _resolve_template_font(template_config, selected_font)
 
     # Word-count aware font sizing
-    word_count = len(arabic_text.split())
-    size_mult = template_config['font_size_mult']
-    fontsize, per_line = _fontsize_for_wordcount(word_count, size_mult)
+    if layout is None:
+        word_count = len(arabic_text.split())
+        fontsize, per_line = fontsize_for_wordcount(
+            word_count, template_config['font_size_mult'] * scale)
+    else:
+        fontsize, per_line = layout.fontsize, layout.per_line
 
     # Fill color: override -> template's text_color (hex or name like 'gold')
     if text_color is None:
@@ -1844,7 +1920,7 @@ def render_text_to_png(arabic_text, template, output_png_path, selected_font=Non
 
     # Glow (e.g. ramadan template)
     glow_color = template_config.get('glow_color')
-    glow_radius = template_config.get('glow_radius', 6)
+    glow_radius = template_config.get('glow_radius', 6) * scale
 
     # Render
     img = render_arabic_to_pil_image(
@@ -1852,13 +1928,13 @@ def render_text_to_png(arabic_text, template, output_png_path, selected_font=Non
         fontsize=fontsize,
         color=text_color,
         stroke_color=stroke_color,
-        stroke_width=3,
+        stroke_width=max(1, round(3 * scale)),
         words_per_line=per_line,
-        target_width=TARGET_W - 160,
+        target_width=_text_width(scale),
         font_path=font_path,
         supersample=_supersample_for_quality(quality),
         shadow=True,
-        shadow_offset=4,
+        shadow_offset=max(1, round(4 * scale)),
         shadow_color='#00000080',
         glow_color=glow_color,
         glow_radius=glow_radius,
@@ -1878,7 +1954,8 @@ def render_text_to_png(arabic_text, template, output_png_path, selected_font=Non
 # =============================================================================
 
 def build_segment_ffmpeg(bg_paths, text_png_path, audio_path, duration_sec, output_path,
-                        show_text=True, text_animation_filter=None, is_last=True):
+                        show_text=True, text_animation_filter=None, is_last=True,
+                        canvas=None):
     """Build one video segment with FFmpeg, optionally with text animation.
 
     Phase 2 additions:
@@ -1889,7 +1966,18 @@ def build_segment_ffmpeg(bg_paths, text_png_path, audio_path, duration_sec, outp
         so the cut to the next segment (or end of video) is soft, not a
         hard jump.  The last segment skips the outro fade to avoid a fade
         to black at the very end of the video.
+
+    ``audio_path=None`` builds a video-only segment — what build_video
+    uses, since the whole audio track is rendered once by
+    build_audio_track.  ``audio_path=SILENT_AUDIO`` muxes in-graph silence
+    of ``duration_sec``.  reciter_speed is applied by build_audio_track
+    only; ``duration_sec`` is the post-tempo duration.
+
+    ``canvas`` is the build's :class:`Canvas` (default: the full output
+    size); the segment is composited and encoded at its size and frame
+    rate, from the matching tier of preprocessed backgrounds.
     """
+    canvas = canvas or FULL_CANVAS
     # Verify all input files exist and have content
     if show_text:
         if not os.path.exists(text_png_path):
@@ -1901,17 +1989,18 @@ def build_segment_ffmpeg(bg_paths, text_png_path, audio_path, duration_sec, outp
         if not os.path.exists(text_png_path):
             raise FileNotFoundError(f"Text PNG placeholder missing: {text_png_path}")
 
-    if not os.path.exists(audio_path):
-        raise FileNotFoundError(f"Audio missing: {audio_path}")
-    if os.path.getsize(audio_path) < 1000:
-        raise ValueError(f"Audio too small: {os.path.getsize(audio_path)} bytes")
+    if audio_path is not None and audio_path != SILENT_AUDIO:
+        if not os.path.exists(audio_path):
+            raise FileNotFoundError(f"Audio missing: {audio_path}")
+        if os.path.getsize(audio_path) < 1000:
+            raise ValueError(f"Audio too small: {os.path.getsize(audio_path)} bytes")
 
     # Preprocess backgrounds
     preprocessed = []
     for p in (bg_paths if isinstance(bg_paths, (list, tuple)) else [bg_paths]):
         if not os.path.exists(p):
             raise FileNotFoundError(f"Background missing: {p}")
-        preprocessed.append(get_preprocessed_bg(p))
+        preprocessed.append(get_preprocessed_bg(p, canvas.width, canvas.height, canvas.fps))
 
     n = len(preprocessed)
     part_dur = duration_sec / n
@@ -1919,22 +2008,30 @@ def build_segment_ffmpeg(bg_paths, text_png_path, audio_path, duration_sec, outp
     if show_text:
         logging.info(f"Building segment: {n} BGs, duration={duration_sec:.2f}s, part_dur={part_dur:.2f}s, is_last={is_last}")
         logging.info(f"  Text PNG: {text_png_path} ({os.path.getsize(text_png_path)} bytes)")
-        logging.info(f"  Audio: {audio_path} ({os.path.getsize(audio_path)} bytes)")
     else:
         logging.info(f"Building segment (no text): {n} BGs, duration={duration_sec:.2f}s, part_dur={part_dur:.2f}s, is_last={is_last}")
+    if audio_path == SILENT_AUDIO:
+        logging.info(f"  Audio: in-graph silence")
+    elif audio_path is not None:
         logging.info(f"  Audio: {audio_path} ({os.path.getsize(audio_path)} bytes)")
 
     # Build FFmpeg command
     common_args = ["-y", "-hide_banner", "-loglevel", "error"]  # Changed to error for more visibility
     inputs = []
 
-    for p in preprocessed:
-        inputs.extend(["-stream_loop", "-1", "-i", p])
+    bg_lists = []
+    for i, p in enumerate(preprocessed):
+        args, list_path = background_input_args(
+            p, part_dur, f"{os.path.splitext(output_path)[0]}_bg{i}.txt")
+        inputs.extend(args)
+        if list_path:
+            bg_lists.append(list_path)
 
     if show_text:
         inputs.extend(["-loop", "1", "-i", text_png_path])
 
-    inputs.extend(["-i", audio_path])
+    if audio_path is not None:
+        inputs.extend(audio_input_args(audio_path, duration_sec))
 
     # Phase 2 (T2.5): outro fade.  0.4 s, applied to the final [v] composite
     # so the whole frame (bg + text) eases out before the next segment takes
@@ -1959,13 +2056,13 @@ def build_segment_ffmpeg(bg_paths, text_png_path, audio_path, duration_sec, outp
             if text_animation_filter:
                 # Apply animation to text before overlay
                 filt = (
-                    f"[0:v]trim=duration={duration_sec},setpts=PTS-STARTPTS,fps=30[bg];"
+                    f"[0:v]trim=duration={duration_sec},setpts=PTS-STARTPTS,fps={canvas.fps}[bg];"
                     f"[1:v]{text_animation_filter}[anim_text];"
                     f"[bg][anim_text]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2:format=auto[{last_v}]"
                 )
             else:
                 filt = (
-                    f"[0:v]trim=duration={duration_sec},setpts=PTS-STARTPTS,fps=30[bg];"
+                    f"[0:v]trim=duration={duration_sec},setpts=PTS-STARTPTS,fps={canvas.fps}[bg];"
                     f"[bg][1:v]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2:format=auto[{last_v}]"
                 )
             if outro_fade_filter:
@@ -1974,7 +2071,7 @@ def build_segment_ffmpeg(bg_paths, text_png_path, audio_path, duration_sec, outp
                 last_v = "v"
             map_args = ["-map", f"[{last_v}]", "-map", "2:a"]
         else:
-            filt = f"[0:v]trim=duration={duration_sec},setpts=PTS-STARTPTS,fps=30[{last_v}]"
+            filt = f"[0:v]trim=duration={duration_sec},setpts=PTS-STARTPTS,fps={canvas.fps}[{last_v}]"
             if outro_fade_filter:
                 filt = filt + ";" + f"[{last_v}]{outro_fade_filter}"
                 last_v = "v"
@@ -1983,7 +2080,7 @@ def build_segment_ffmpeg(bg_paths, text_png_path, audio_path, duration_sec, outp
         # Multiple BGs
         v_parts = ""
         for i in range(n):
-            v_parts += f"[{i}:v]trim=duration={part_dur},setpts=PTS-STARTPTS,fps=30[v{i}];"
+            v_parts += f"[{i}:v]trim=duration={part_dur},setpts=PTS-STARTPTS,fps={canvas.fps}[v{i}];"
         v_parts += "".join([f"[v{i}]" for i in range(n)]) + f"concat=n={n}:v=1:a=0[bg];"
 
         if show_text:
@@ -2003,12 +2100,21 @@ def build_segment_ffmpeg(bg_paths, text_png_path, audio_path, duration_sec, outp
                 last_v = "v"
             map_args = ["-map", f"[{last_v}]", "-map", f"{n}:a"]
 
+    if audio_path is None:
+        map_args = map_args[:2]
+        audio_args = ["-an"]
+    else:
+        audio_args = ["-c:a", "aac", "-b:a", "192k", "-shortest"]
+
     cmd = [FFMPEG_EXE] + common_args + inputs + [
         "-filter_complex", filt,
     ] + map_args + [
-        "-t", str(duration_sec), "-r", "30",
+        "-t", str(duration_sec), "-r", str(canvas.fps),
+        # Exactly the frames the audio track allots this segment (callers
+        # pass durations snapped to whole frames).
+        "-frames:v", str(max(1, frame_count(duration_sec, canvas.fps))),
         "-c:v", "libx264", "-preset", "ultrafast", "-threads", "4", "-pix_fmt", "yuv420p",
-        "-c:a", "aac", "-b:a", "192k", "-shortest",
+    ] + audio_args + [
         output_path
     ]
 
@@ -2043,6 +2149,12 @@ def build_segment_ffmpeg(bg_paths, text_png_path, audio_path, duration_sec, outp
         logging.error(f"FFmpeg stderr: {e.stderr}")
         logging.error(f"FFmpeg stdout: {e.stdout}")
         raise RuntimeError(f"FFmpeg failed: {e.stderr}")
+    finally:
+        for list_path in bg_lists:
+            try:
+                os.remove(list_path)
+            except OSError:
+                pass
 
     if not os.path.exists(output_path):
         raise RuntimeError(f"FFmpeg output not created: {output_path}")
@@ -2054,20 +2166,61 @@ def build_segment_ffmpeg(bg_paths, text_png_path, audio_path, duration_sec, outp
 # STEP 16: PARALLEL PROCESSING (OPTIMIZED)
 # =============================================================================
 
+class SegmentPlan(NamedTuple):
+    """Everything one segment needs once its inputs are ready: what
+    build_segment_ffmpeg renders, or the continuous timeline places at
+    its slot (see build_timeline_ffmpeg)."""
+    num: int                  # sort key: ayah number, 0 for the Bismillah
+    bg_paths: list
+    text_png: str
+    duration: float
+    segment_path: str         # output of the segment pipeline; audio key
+    show_text: bool
+    animation_filter: str | None
+    is_last: bool
+
+
+def render_segment(plan, canvas=None):
+    """Render a planned segment; returns ``(num, segment_path)``."""
+    build_segment_ffmpeg(plan.bg_paths, plan.text_png, None, plan.duration, plan.segment_path,
+                         show_text=plan.show_text, text_animation_filter=plan.animation_filter,
+                         is_last=plan.is_last, canvas=canvas)
+    return (plan.num, plan.segment_path)
+
+
 def process_single_ayah_ffmpeg(args):
     """
     Process one ayah using FFmpeg with animations and dynamic features.
     Uses BackgroundRotator to prevent video repetition.
 
+    ``args`` are as for :func:`prepare_ayah_segment`.
+    """
+    plan = prepare_ayah_segment(args)
+    job, surah, ayah, idx = args[0], args[2], args[3], args[5]
+    try:
+        result = render_segment(plan, job.canvas)
+    except Exception as e:
+        logging.error(f"❌ Error processing ayah {surah}:{ayah}: {e}")
+        raise
+    logging.info(f"✅ Segment {idx} complete: ayah {surah}:{ayah}")
+    return result
+
+
+def prepare_ayah_segment(args):
+    """
+    Prepare one ayah's segment: audio, background, text card.  Returns
+    its :class:`SegmentPlan` with the text rendered and the backgrounds
+    preprocessed.
+
     The first element of ``args`` is the :class:`JobContext` for the
     build — passed explicitly so the worker thread (which has its own
     thread-local storage) uses the *parent* build's job_id, not a
     racey global.  See ``bug.md`` Issue 2 P0 #5
     ("ThreadPool race conditions").
     """
-    (job, reciter_id, surah, ayah, idx, template, bg_style, selected_font,
-     show_text, text_animation, auto_text_color, quality, reciter_speed,
-     is_last) = args
+    (job, reciter_id, surah, ayah, arabic_text, idx, template, bg_style,
+     selected_font, show_text, text_animation, auto_text_color, quality,
+     reciter_speed, is_last) = args
 
     # Bind the parent build's JobContext to this worker thread so any
     # nested call to ``current_job()`` (e.g. inside ``download_audio``)
@@ -2076,47 +2229,58 @@ def process_single_ayah_ffmpeg(args):
     # ``current_job()`` would lazily start a *third* job mid-build,
     # splitting the build's files across two job_ids.
     _job_local.ctx = job
+    canvas = job.canvas or FULL_CANVAS
 
     try:
         # Download audio (no trimming, faster)
         audio_path = download_audio(reciter_id, surah, ayah, idx)
-        # Feature: reciter_speed — apply ffmpeg atempo to speed up / slow
-        # down the recitation without changing pitch.  Done as a separate
-        # pre-pass so the rest of the pipeline sees a normal mp3 file and
-        # doesn't need to know about tempo.  atempo is limited to [0.5,
-        # 2.0] per pass, so values outside that range are clamped.
-        if reciter_speed and reciter_speed != 1.0:
-            atempo = max(0.5, min(2.0, float(reciter_speed)))
-            sped_path = current_job().sped_path(idx)
-            cmd = [
-                FFMPEG_EXE, '-y', '-hide_banner', '-loglevel', 'error',
-                '-i', audio_path,
-                '-af', f'atempo={atempo:.3f}',
-                '-c:a', 'libmp3lame', '-b:a', '192k',
-                sped_path,
-            ]
-            res = subprocess.run(cmd, capture_output=True, text=True)
-            if res.returncode == 0 and os.path.exists(sped_path):
-                audio_path = sped_path
-                logging.debug(f"Segment {idx}: reciter_speed={reciter_speed} (atempo={atempo:.3f})")
-            else:
-                logging.warning(f"Segment {idx}: atempo pre-pass failed, using original audio: {res.stderr.strip()}")
-        duration = get_audio_duration_ffprobe(audio_path)
+        duration = get_cached_audio_duration(reciter_id, surah, ayah)
+        if not duration:
+            duration = get_audio_duration(audio_path)
+        # Feature: reciter_speed — speed up / slow down the recitation
+        # without changing pitch.  The atempo filter runs inside the
+        # audio timeline (see build_audio_track), so the segment length is
+        # simply the source length divided by tempo.
+        tempo = clamp_reciter_tempo(reciter_speed)
+        if tempo != 1.0:
+            duration = duration / tempo
+            logging.debug(f"Segment {idx}: reciter_speed={reciter_speed} (atempo={tempo:.3f})")
+        # Whole frames: the segment and its slice of the audio track are
+        # both cut to this one value, so they stay in sync across ayat.
+        duration = snap_duration(duration, canvas.fps)
         logging.debug(f"Segment {idx}: Audio duration = {duration:.2f}s")
-
-        # Fetch text (with cache)
-        arabic_text = get_ayah_text(surah, ayah)
+        gain_db = get_loudness_gain_db(reciter_id, surah, ayah)
+        if gain_db:
+            logging.debug(f"Segment {idx}: loudness gain {gain_db:+.2f} dB")
 
         # Select background using rotator to prevent repetition
-        bg_path = get_next_background(bg_style, count=1)
+        bg_path = get_next_background(bg_style, count=1, tier=canvas)
         bg_paths = bg_path if isinstance(bg_path, list) else [bg_path]
         logging.debug(f"Segment {idx}: Using background {os.path.basename(bg_paths[0])}")
 
+        # Start preparing the backgrounds (a cache hit or a transcode) now,
+        # so it runs while the text card is analysed and rendered below;
+        # build_segment_ffmpeg then finds them ready.
+        bg_prep = [_BG_PREP_POOL.submit(get_preprocessed_bg, p,
+                                        canvas.width, canvas.height, canvas.fps)
+                   for p in bg_paths if os.path.exists(p)]
+
         # Render text to PNG (job-scoped filenames so they cannot
         # collide with another build running in the same process).
         text_png = current_job().text_png_path(idx)
         segment_out = current_job().segment_path(idx)
 
+        # The card's geometry comes from the layout index, so the animation
+        # filter (zoom_in/zoom_out pad the scaled text back to the card
+        # size) is built without waiting for, or reopening, the PNG.
+        layout = None
+        if show_text:
+            layout = get_text_layout(arabic_text, template, selected_font, quality,
+                                     ref=f"{surah}:{ayah}", scale=canvas.scale)
+        animation_filter = get_ffmpeg_text_animation_filter(
+            text_animation, duration, fps=canvas.fps,
+            text_size=layout.size if layout else None)
+
         if show_text:
             # Get dynamic text color based on background
             template_config = TEMPLATES.get(template, TEMPLATES['normal'])
@@ -2124,14 +2288,16 @@ def process_single_ayah_ffmpeg(args):
 
             # Analyze background and get contrasting colors
             text_color, stroke_color = get_contrasting_text_color(
-                bg_paths[0], template_color, auto_detect=auto_text_color
+                bg_paths[0], template_color, auto_detect=auto_text_color,
+                text_height_frac=layout.height / canvas.height
             )
             logging.debug(f"Segment {idx}: Text color={text_color}, stroke={stroke_color}")
 
             # Render with custom colors (Phase 1: quality -> supersample, template font + glow)
             render_text_to_png(arabic_text, template, text_png,
                               selected_font=selected_font, quality=quality,
-                              text_color=text_color, stroke_color=stroke_color)
+                              text_color=text_color, stroke_color=stroke_color,
+                              layout=layout, scale=canvas.scale)
         else:
             # Create a transparent 1x1 pixel PNG for no-text mode
             from PIL import Image
@@ -2139,25 +2305,14 @@ def process_single_ayah_ffmpeg(args):
             transparent.save(text_png)
             logging.debug(f"Created transparent placeholder: {text_png}")
 
-        # Build segment with animation filter (Phase 2: text animation + outro fade)
-        # Pass text PNG dimensions so zoom_in/zoom_out can pad the scaled text
-        # back to the original canvas size, centered.  Slides don't need this.
-        text_size = None
-        if show_text and os.path.exists(text_png):
-            try:
-                from PIL import Image as _PILImage
-                with _PILImage.open(text_png) as _img:
-                    text_size = _img.size
-            except Exception:
-                text_size = None
-        animation_filter = get_ffmpeg_text_animation_filter(
-            text_animation, duration, text_size=text_size)
-        build_segment_ffmpeg(bg_paths, text_png, audio_path, duration, segment_out,
-                           show_text=show_text, text_animation_filter=animation_filter,
-                           is_last=is_last)
-
-        logging.info(f"✅ Segment {idx} complete: ayah {surah}:{ayah}")
-        return (ayah, segment_out)
+        # Failures surface (and are retried) in build_segment_ffmpeg.
+        concurrent.futures.wait(bg_prep)
+        # Video-only: the recitation is encoded once, for the whole video,
+        # by build_audio_track.
+        current_job().segment_durations[segment_out] = duration
+        current_job().segment_audio[segment_out] = (audio_path, tempo, gain_db)
+        return SegmentPlan(ayah, bg_paths, text_png, duration, segment_out,
+                           show_text, animation_filter, is_last)
 
     except Exception as e:
         logging.error(f"❌ Error processing ayah {surah}:{ayah}: {e}")
@@ -2170,36 +2325,23 @@ def process_single_ayah_ffmpeg(args):
 # of any surah.  Skipped for surahs in BISMILLAH_SKIP_SURAHS (Al-Fatihah,
 # At-Tawbah) per the standard recitation tradition.
 
-def _generate_silence_mp3(output_path, duration_sec, sample_rate=44100):
-    """Render ``duration_sec`` of stereo silence to an mp3 file.
-
-    Uses ffmpeg's ``anullsrc`` so no external asset is needed.  Matches the
-    sample rate / channel layout of the downloaded recitation mp3s
-    (44.1 kHz, stereo) so it can drop in next to them without re-encoding.
-    """
-    cmd = [
-        FFMPEG_EXE, '-y', '-hide_banner', '-loglevel', 'error',
-        '-f', 'lavfi',
-        '-i', f'anullsrc=channel_layout=stereo:sample_rate={sample_rate}',
-        '-t', f'{duration_sec:.3f}',
-        '-c:a', 'libmp3lame', '-b:a', '128k',
-        output_path,
-    ]
-    res = subprocess.run(cmd, capture_output=True, text=True)
-    if res.returncode != 0 or not os.path.exists(output_path):
-        raise RuntimeError(f"Silence mp3 generation failed: {res.stderr.strip()}")
-    return output_path
-
-
 def _build_bismillah_segment(template, selected_font, quality, bg_paths):
     """Build a 1.8s title-card segment for Bismillah ar-Rahman ar-Raheem.
 
     Returns ``(ayah_num, segment_path)`` with ``ayah_num=0`` so the existing
     sort-by-ayah-number logic places it before ayah 1.
     """
+    plan = _prepare_bismillah_segment(template, selected_font, quality, bg_paths)
+    result = render_segment(plan, current_job().canvas)
+    logging.info(f"✅ Bismillah title card built: {plan.segment_path}")
+    return result
+
+
+def _prepare_bismillah_segment(template, selected_font, quality, bg_paths):
+    """The Bismillah card's :class:`SegmentPlan` (``num=0``), text rendered."""
     job = current_job()
+    canvas = job.canvas or FULL_CANVAS
     bismillah_png = job.bismillah_text_png()
-    bismillah_audio = job.bismillah_audio()
     bismillah_segment = job.bismillah_segment()
 
     # 1) Render the Bismillah text using the same template-driven renderer
@@ -2211,53 +2353,157 @@ def _build_bismillah_segment(template, selected_font, quality, bg_paths):
     if bg_paths:
         first_bg = bg_paths[0]
     else:
-        bg = get_next_background(template_config['bg_style'], count=1)
+        bg = get_next_background(template_config['bg_style'], count=1, tier=canvas)
         # get_next_background returns a string for count=1 and a list for count>1
         first_bg = bg if isinstance(bg, str) else bg[0]
+    layout = get_text_layout(BISMILLAH_TEXT, template, selected_font, quality,
+                             ref='bismillah', scale=canvas.scale)
     text_color, stroke_color = get_contrasting_text_color(
-        first_bg, template_color, auto_detect=template_config.get('auto_text_color', True)
+        first_bg, template_color, auto_detect=template_config.get('auto_text_color', True),
+        text_height_frac=layout.height / canvas.height
     )
     render_text_to_png(BISMILLAH_TEXT, template, bismillah_png,
                        selected_font=selected_font, quality=quality,
-                       text_color=text_color, stroke_color=stroke_color)
+                       text_color=text_color, stroke_color=stroke_color,
+                       layout=layout, scale=canvas.scale)
 
-    # 2) Generate the silence audio track.
-    _generate_silence_mp3(bismillah_audio, BISMILLAH_DURATION_SEC)
-
-    # 3) Build the segment with a simple fade-in (no slide/zoom on a static
+    # 2) Plan the segment with a simple fade-in (no slide/zoom on a static
     #    title card) and an outro fade (is_last=False) so the crossfade
     #    into ayah 1 lands smoothly.
-    text_size = None
-    try:
-        from PIL import Image as _PILImage
-        with _PILImage.open(bismillah_png) as _img:
-            text_size = _img.size
-    except Exception:
-        text_size = None
+    duration = snap_duration(BISMILLAH_DURATION_SEC, canvas.fps)
     animation_filter = get_ffmpeg_text_animation_filter(
-        'fade_in', BISMILLAH_DURATION_SEC, text_size=text_size)
-    build_segment_ffmpeg(
-        [first_bg], bismillah_png, bismillah_audio, BISMILLAH_DURATION_SEC,
-        bismillah_segment, show_text=True,
-        text_animation_filter=animation_filter, is_last=False,
-    )
-    logging.info(f"✅ Bismillah title card built: {bismillah_segment}")
-    return (0, bismillah_segment)
+        'fade_in', duration, fps=canvas.fps, text_size=layout.size)
+    job.segment_durations[bismillah_segment] = duration
+    # Silent audio is synthesised inside the audio-track graph (anullsrc),
+    # so no silence file is rendered to disk.
+    job.segment_audio[bismillah_segment] = (SILENT_AUDIO, 1.0, 0.0)
+    return SegmentPlan(0, [first_bg], bismillah_png, duration,
+                       bismillah_segment, True, animation_filter, False)
+
+
+# =============================================================================
+# STEP 16.7: CONTINUOUS-TIMELINE BUILDER
+# =============================================================================
+# Without crossfades the video is one background timeline with text cards
+# on top, so it is rendered in a single ffmpeg pass instead of one pass per
+# segment plus a concat re-encode (see quran_reels.services.timeline).
+
+def build_timeline_ffmpeg(plans, audio_track, output_path, canvas=None, upscale_filter=None):
+    """Render the planned segments as one continuous video, in one pass.
+
+    The backgrounds of all ``plans`` (in order) are decoded once, as a
+    single concat list of clips cut at the segment boundaries; each text
+    card is overlaid, animated on its own clock, while its segment is on
+    screen; ``audio_track`` (from build_audio_track) is muxed in.  Raises
+    if a background has no clip library (e.g. a failed transcode) or
+    ffmpeg fails — the caller then renders the segments instead.
+    """
+    canvas = canvas or FULL_CANVAS
+    parts = []
+    for plan in plans:
+        part_dur = plan.duration / len(plan.bg_paths)
+        for p in plan.bg_paths:
+            cached = get_preprocessed_bg(p, canvas.width, canvas.height, canvas.fps)
+            clips = get_bg_cache().clips(cached) if BG_CLIPS else None
+            if clips is None:
+                raise RuntimeError(f"No clip library for background {os.path.basename(p)}")
+            parts.append((clips, random.randrange(len(clips.clips)), part_dur))
+
+    list_path = current_job().timeline_list_path()
+    write_timeline_list(list_path, background_timeline(parts, canvas.fps))
+
+    # Clips are concatenated with their own timestamps; renumber the frames
+    # so the cut points land exactly where the plan put them.
+    inputs = ["-f", "concat", "-safe", "0", "-i", list_path]
+    filters = [f"[0:v]setpts=N/({canvas.fps}*TB)[bg]"]
+    cards = []
+    start = 0.0
+    n_inputs = 1
+    for plan in plans:
+        if plan.show_text:
+            inputs.extend(["-loop", "1", "-framerate", str(canvas.fps),
+                           "-t", f"{plan.duration:.3f}", "-i", plan.text_png])
+            card_filter = [plan.animation_filter] if plan.animation_filter else []
+            if FEATURE_FLAGS.get('text_animations', False) and not plan.is_last:
+                # The segment pipeline's 0.4 s outro fade, on the card.
+                outro_d = min(0.4, max(0.1, plan.duration / 2))
+                outro_st = max(0.0, plan.duration - outro_d)
+                card_filter.append(f"fade=t=out:st={outro_st:.3f}:d={outro_d:.3f}:alpha=1")
+            cards.append((n_inputs, start, plan.duration, ",".join(card_filter) or None))
+            n_inputs += 1
+        start += plan.duration
+    filters.extend(overlay_filters("bg", cards, "vtext"))
+    filters.append(f"[vtext]{upscale_filter or 'null'}[outv]")
+    inputs.extend(["-i", audio_track])
+
+    cmd = [FFMPEG_EXE, "-y", "-hide_banner", "-loglevel", "error"] + inputs + [
+        "-filter_complex", ";".join(filters),
+        "-map", "[outv]", "-map", f"{n_inputs}:a",
+        "-t", f"{start:.3f}", "-r", str(canvas.fps),
+        "-c:v", "libx264", "-preset", "ultrafast", "-threads", "4", "-pix_fmt", "yuv420p",
+        "-c:a", "copy",
+        "-movflags", "+faststart",
+        output_path,
+    ]
+    try:
+        logging.info(f"Running timeline FFmpeg: {len(plans)} segments, {len(cards)} text cards, "
+                     f"{start:.2f}s")
+        subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=600)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Timeline FFmpeg failed: {e.stderr}")
+    finally:
+        try:
+            os.remove(list_path)
+        except OSError:
+            pass
+    if not os.path.exists(output_path):
+        raise RuntimeError(f"FFmpeg output not created: {output_path}")
+    logging.info(f"✅ Timeline video created: {output_path} ({os.path.getsize(output_path)} bytes)")
+    return output_path
 
 
 # =============================================================================
 # STEP 17: MAIN VIDEO BUILDER
 # =============================================================================
 
+def _finish_build(temp_output_path, output_path):
+    """Move the finished video into place and report success."""
+    # Move to final location with Arabic name
+    if os.path.exists(temp_output_path):
+        shutil.move(temp_output_path, output_path)
+
+    # Success
+    add_log('Done!')
+    update_progress(100, 'تم بنجاح!')
+    current_progress.set(is_complete=True, output_path=output_path)
+
+    if os.path.isfile(output_path):
+        size_mb = os.path.getsize(output_path) / (1024 * 1024)
+        logging.info(f"Output: {output_path} ({size_mb:.2f} MB)")
+
+    return output_path
+
+
 def build_video(reciter_id, surah, start_ayah, end_ayah=None,
                 quality='medium', format_type='reels', template='normal',
                 person_name='', selected_font='random', target_duration_seconds=None,
                 show_text=True, include_bismillah=False, reciter_speed=1.0,
-                transition_style_override=None):
+                transition_style_override=None, upscale_proxy=True,
+                continuous_timeline=None):
     """
     Main video builder - optimized and refactored.
     No clear_outputs() needed - uses temp directory.
 
+    Qualities in ``PROXY_QUALITIES`` are composited on the proxy canvas
+    (see :func:`canvas_for_quality`); the final encode upscales them to
+    ``TARGET_W`` x ``TARGET_H`` unless ``upscale_proxy`` is False
+    (previews, which are watched in the UI at a fraction of that size).
+
+    ``continuous_timeline`` (default: ``CONTINUOUS_TIMELINE``) renders the
+    whole video in one ffmpeg pass (:func:`build_timeline_ffmpeg`) when
+    the template puts no crossfade between segments; otherwise, or if
+    that pass fails, segments are rendered and concatenated as usual.
+
     Returns:
         str | None: Absolute ``output_path`` of the final mp4 on success,
         or ``None`` on failure.  The return value is purely informational —
@@ -2274,6 +2520,14 @@ def build_video(reciter_id, surah, start_ayah, end_ayah=None,
         # a previous run.
         start_new_job()
         current_progress.set(is_running=True, is_complete=False, error=None)
+        canvas = current_job().canvas = canvas_for_quality(quality)
+        # Scale filter for the final encode, when the segments are proxies.
+        upscale_filter = None
+        if upscale_proxy and canvas != FULL_CANVAS:
+            upscale_filter = f"scale={TARGET_W}:{TARGET_H}:flags=lanczos"
+        if canvas != FULL_CANVAS:
+            logging.info(f"Compositing at {canvas.width}x{canvas.height}@{canvas.fps} "
+                         f"({'upscaled at the final encode' if upscale_filter else 'not upscaled'})")
 
         # Get config
         quality_config = QUALITY_PRESETS.get(quality, QUALITY_PRESETS['medium'])
@@ -2309,7 +2563,7 @@ def build_video(reciter_id, surah, start_ayah, end_ayah=None,
         update_progress(10, f'جاري تحضير {total} آيات...')
 
         # Initialize background rotator to prevent repetition
-        init_background_rotator(bg_style)
+        init_background_rotator(bg_style, tier=canvas)
         logging.info(f"Background rotator initialized for style: {bg_style}")
 
         # OPTIMIZED: max_workers = total if <=3, else 4
@@ -2323,6 +2577,25 @@ def build_video(reciter_id, surah, start_ayah, end_ayah=None,
 
         logging.info(f"Using text animation: {text_animation}, transition: {video_transition}")
 
+        # Fetch every ayah's audio and text concurrently before anything
+        # else: on a cold cache this costs roughly one round-trip instead
+        # of one per ayah, and it lets the duration cap below read real
+        # (cached) durations instead of the 5 s estimate.
+        add_log('Fetching audio and text...')
+        n_ok, n_failed = prefetch_build_inputs(reciter_id, surah, start_ayah, last_ayah)
+        logging.info(f"Prefetch complete: {n_ok} items ready, {n_failed} failed")
+
+        # Resolve every ayah's text now, before the pool starts: a text
+        # failure aborts the build here instead of mid-render.
+        ayah_texts = get_ayah_texts(surah, start_ayah, last_ayah)
+
+        # Warm the cache for the likely next request (the following ayat
+        # of the same surah) in the background, at low priority.
+        try:
+            get_prefetcher().schedule(reciter_id, surah, last_ayah, last_ayah - start_ayah + 1)
+        except Exception as e:
+            logging.warning(f"Could not schedule surah prefetch: {e}")
+
         # Feature: target_duration_seconds — cap the number of ayahs so the
         # final video won't exceed the user's requested length.  Iterates
         # through candidate ayahs in order, summing their (cached) audio
@@ -2360,8 +2633,9 @@ def build_video(reciter_id, surah, start_ayah, end_ayah=None,
         total_ayahs = last_ayah - start_ayah + 1
         job = current_job()
         ayah_args = [
-            (job, reciter_id, surah, ayah, idx, template, bg_style, selected_font, show_text,
-             text_animation, auto_text_color, quality, reciter_speed, idx == total_ayahs)
+            (job, reciter_id, surah, ayah, ayah_texts[ayah], idx, template, bg_style,
+             selected_font, show_text, text_animation, auto_text_color, quality,
+             reciter_speed, idx == total_ayahs)
             for idx, ayah in enumerate(range(start_ayah, last_ayah + 1), start=1)
         ]
 
@@ -2402,30 +2676,71 @@ def build_video(reciter_id, surah, start_ayah, end_ayah=None,
         # it and the xfade chain at the end naturally crossfades Bismillah
         # into ayah 1.  Skipped for surahs in BISMILLAH_SKIP_SURAHS.
         segment_results = []
-        if (include_bismillah
-                and start_ayah == 1
-                and surah not in BISMILLAH_SKIP_SURAHS):
+        with_bismillah = (include_bismillah
+                          and start_ayah == 1
+                          and surah not in BISMILLAH_SKIP_SURAHS)
+
+        # Continuous timeline: the workers only prepare each segment (audio,
+        # background, text card) and one pass renders the video.  Only
+        # without crossfades — an xfade needs both sides as separate inputs.
+        if continuous_timeline is None:
+            continuous_timeline = CONTINUOUS_TIMELINE
+        use_timeline = False
+        if continuous_timeline:
+            trans_spec = VIDEO_TRANSITIONS.get(template_config.get('transition', 'fade'),
+                                               VIDEO_TRANSITIONS.get('fade'))
+            use_timeline = not any(_compute_xfade_pairs(
+                template_config.get('transition_style', 'cinematic'),
+                total_ayahs + (1 if with_bismillah else 0),
+                trans_spec.get('duration', 0.5)))
+            if not use_timeline:
+                add_log('Continuous timeline skipped: template crossfades between segments')
+        plans = []
+        results = plans if use_timeline else segment_results
+        worker = prepare_ayah_segment if use_timeline else process_single_ayah_ffmpeg
+
+        if with_bismillah:
             update_progress(11, 'جاري تحضير البسملة...')
             add_log('Building Bismillah title card...')
-            bismillah_result = _build_bismillah_segment(
-                template, selected_font, quality, bg_paths=None)
-            segment_results.append(bismillah_result)
+            if use_timeline:
+                plans.append(_prepare_bismillah_segment(
+                    template, selected_font, quality, bg_paths=None))
+            else:
+                segment_results.append(_build_bismillah_segment(
+                    template, selected_font, quality, bg_paths=None))
         elif include_bismillah and surah in BISMILLAH_SKIP_SURAHS:
             add_log(f"Skipping Bismillah for surah {surah} (in BISMILLAH_SKIP_SURAHS)")
 
         if max_workers > 1:
             with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = {executor.submit(process_single_ayah_ffmpeg, a): a for a in ayah_args}
+                futures = {executor.submit(worker, a): a for a in ayah_args}
                 for i, future in enumerate(concurrent.futures.as_completed(futures), 1):
-                    ayah_num, seg_path = future.result()
-                    segment_results.append((ayah_num, seg_path))
+                    results.append(future.result())
                     update_progress(int(10 + 70 * i / total), f'تم معالجة {i}/{total} آيات...')
         else:
             for i, args in enumerate(ayah_args, 1):
-                ayah_num, seg_path = process_single_ayah_ffmpeg(args)
-                segment_results.append((ayah_num, seg_path))
+                results.append(worker(args))
                 update_progress(int(10 + 70 * i / total), f'تم معالجة {i}/{total} آيات...')
 
+        if use_timeline:
+            plans.sort(key=lambda p: p.num)
+            add_log('Rendering continuous timeline...')
+            update_progress(85, 'جاري إنشاء الفيديو في مسار واحد...')
+            audio_track = current_job().audio_track_path()
+            build_audio_track([(p.num, p.segment_path) for p in plans],
+                              [p.duration for p in plans], [list(range(len(plans)))],
+                              0.0, audio_track)
+            try:
+                build_timeline_ffmpeg(plans, audio_track, temp_output_path,
+                                      canvas=canvas, upscale_filter=upscale_filter)
+                return _finish_build(temp_output_path, output_path)
+            except Exception as e:
+                logging.warning(f"Continuous timeline failed, rendering segments instead: {e}")
+                add_log('Continuous timeline failed, rendering segments...')
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    segment_results = list(executor.map(
+                        lambda plan: render_segment(plan, canvas), plans))
+
         # Sort by ayah number
         segment_results.sort(key=lambda x: x[0])
 
@@ -2446,29 +2761,53 @@ def build_video(reciter_id, surah, start_ayah, end_ayah=None,
 
         cmd_concat = None
 
-        if len(segment_results) <= 1:
-            # Single segment - simple concat
-            cmd_concat = [
+        # Segment durations are known from the build; only probe a
+        # segment the builder did not record.
+        seg_durations = []
+        for _, seg_path in segment_results:
+            d = current_job().segment_durations.get(seg_path)
+            if d is None:
+                try:
+                    d = get_audio_duration_ffprobe(seg_path)
+                except Exception as e:
+                    logging.warning(f"ffprobe failed for {seg_path}: {e}; defaulting to 5.0s")
+                    d = 5.0
+            seg_durations.append(d)
+        logging.info(f"Segment durations: {[f'{d:.2f}' for d in seg_durations]}")
+
+        # Segments are video-only; the audio timeline is rendered once
+        # (build_audio_track) and muxed into whichever final command runs
+        # with -c:a copy.  Hard cuts everywhere unless the xfade chain
+        # below is set up, in which case audio crossfades between the same
+        # chunks.
+        audio_track = current_job().audio_track_path()
+        audio_segments = list(segment_results)
+        audio_durations = list(seg_durations)
+        audio_groups = [list(range(len(segment_results)))]
+        audio_xfade_d = 0.0
+
+        def concat_cmd(video_codec_args):
+            if upscale_filter:
+                if video_codec_args[:2] == ["-c:v", "copy"]:
+                    # A stream copy cannot upscale; re-encode instead.
+                    video_codec_args = ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "23"]
+                video_codec_args = ["-vf", upscale_filter] + video_codec_args
+            return [
                 FFMPEG_EXE, "-y", "-f", "concat", "-safe", "0", "-i", list_path,
-                "-c:v", "libx264", "-preset", "ultrafast", "-threads", "4",
-                "-c:a", "aac", "-b:a", "192k",
+                "-i", audio_track,
+                "-map", "0:v", "-map", "1:a",
+            ] + video_codec_args + [
+                "-c:a", "copy",
                 "-movflags", "+faststart",
                 temp_output_path
             ]
+
+        if len(segment_results) <= 1:
+            # Single segment - simple concat
+            cmd_concat = concat_cmd(["-c:v", "libx264", "-preset", "ultrafast", "-threads", "4"])
         else:
             # Multiple segments - decide whether to xfade any pair, and which
             try:
-                # Probe each segment's actual duration
-                seg_durations = []
-                for _, seg_path in segment_results:
-                    try:
-                        d = get_audio_duration_ffprobe(seg_path)
-                    except Exception as e:
-                        logging.warning(f"ffprobe failed for {seg_path}: {e}; defaulting to 5.0s")
-                        d = 5.0
-                    seg_durations.append(d)
-                logging.info(f"Segment durations: {[f'{d:.2f}' for d in seg_durations]}")
-
                 # Resolve transition name from template
                 trans_name = template_config.get('transition', 'fade')
                 trans_spec = VIDEO_TRANSITIONS.get(trans_name, VIDEO_TRANSITIONS.get('fade'))
@@ -2495,13 +2834,7 @@ def build_video(reciter_id, surah, start_ayah, end_ayah=None,
                     # No xfade anywhere — fall back to the simple concat demuxer
                     # (hard cuts).  This path is identical to the single-segment
                     # branch above, just with more inputs.
-                    cmd_concat = [
-                        FFMPEG_EXE, "-y", "-f", "concat", "-safe", "0", "-i", list_path,
-                        "-c:v", "libx264", "-preset", "ultrafast", "-threads", "4",
-                        "-c:a", "aac", "-b:a", "192k",
-                        "-movflags", "+faststart",
-                        temp_output_path
-                    ]
+                    cmd_concat = concat_cmd(["-c:v", "libx264", "-preset", "ultrafast", "-threads", "4"])
                 else:
                     # xfade d=0 produces invalid output, so the "smooth" style
                     # pre-merges hard-cut runs into single files via the
@@ -2523,8 +2856,7 @@ def build_video(reciter_id, surah, start_ayah, end_ayah=None,
                     for i, (_, seg_path) in enumerate(segment_results):
                         seg_d = seg_durations[i]
                         filter_complex.append(
-                            f"[{i}:v]trim=duration={seg_d:.3f},setpts=PTS-STARTPTS[v{i}];"
-                            f"[{i}:a]atrim=duration={seg_d:.3f},asetpts=PTS-STARTPTS[a{i}]"
+                            f"[{i}:v]trim=duration={seg_d:.3f},setpts=PTS-STARTPTS[v{i}]"
                         )
 
                     # Crossfade between consecutive chunks using computed offsets.
@@ -2537,48 +2869,44 @@ def build_video(reciter_id, surah, start_ayah, end_ayah=None,
                         offset = max(0.0, cumulative - (i + 1) * xfade_d)
                         filter_complex.append(
                             f"[v{i}][v{i+1}]xfade=transition={xfade_name}:"
-                            f"duration={xfade_d}:offset={offset:.3f}[v{i+1}];"
-                            f"[a{i}][a{i+1}]acrossfade=d={xfade_d}[a{i+1}]"
+                            f"duration={xfade_d}:offset={offset:.3f}[v{i+1}]"
                         )
 
-                    # Final output — null filters are required so we can map both
-                    # video and audio streams to the named output labels.
+                    # Final output — a null filter (or the proxy upscale) is
+                    # required so we can map the video stream to a named
+                    # output label.
                     last_v = f"v{len(segment_results) - 1}"
-                    last_a = f"a{len(segment_results) - 1}"
-                    filter_complex.append(
-                        f"[{last_v}]null[outv];"
-                        f"[{last_a}]anull[outa]"
-                    )
+                    filter_complex.append(f"[{last_v}]{upscale_filter or 'null'}[outv]")
 
                     filter_complex_str = ';'.join(filter_complex)
 
                     inputs = []
                     for _, seg_path in segment_results:
                         inputs.extend(["-i", seg_path])
+                    inputs.extend(["-i", audio_track])
 
                     cmd_concat = [
                         FFMPEG_EXE, "-y"
                     ] + inputs + [
                         "-filter_complex", filter_complex_str,
-                        "-map", "[outv]", "-map", "[outa]",
+                        "-map", "[outv]", "-map", f"{len(segment_results)}:a",
                         "-c:v", "libx264", "-preset", "ultrafast", "-threads", "4",
-                        "-c:a", "aac", "-b:a", "192k",
+                        "-c:a", "copy",
                         "-movflags", "+faststart",
                         temp_output_path
-                ]
+                    ]
+                    audio_groups = chunk_groups
+                    audio_xfade_d = xfade_d
 
             except Exception as e:
                 logging.warning(f"Crossfade setup failed, using simple concat: {e}")
 
                 # Fallback to simple concat (list_path already exists)
-                cmd_concat = [
-                    FFMPEG_EXE, "-y", "-f", "concat", "-safe", "0", "-i", list_path,
-                    "-c:v", "libx264", "-preset", "ultrafast", "-threads", "4",
-                    "-c:a", "aac", "-b:a", "192k",
-                    "-af", "acrossfade=d=0.5",  # Simple audio crossfade
-                    "-movflags", "+faststart",
-                    temp_output_path
-                ]
+                cmd_concat = concat_cmd(["-c:v", "libx264", "-preset", "ultrafast", "-threads", "4"])
+
+        add_log('Rendering audio track...')
+        build_audio_track(audio_segments, audio_durations, audio_groups,
+                          audio_xfade_d, audio_track)
 
         try:
             if cmd_concat is None:
@@ -2593,13 +2921,13 @@ def build_video(reciter_id, surah, start_ayah, end_ayah=None,
 
             # Fallback: try without fade effects (list_path already exists from the top)
             logging.info("Trying fallback without fade effects...")
+            if audio_groups != [list(range(len(audio_segments)))]:
+                # The audio track was crossfaded for the xfade chain; a
+                # hard-cut picture needs hard-cut audio to stay in sync.
+                build_audio_track(audio_segments, audio_durations,
+                                  [list(range(len(audio_segments)))], 0.0, audio_track)
 
-            cmd_fallback = [
-                FFMPEG_EXE, "-y", "-f", "concat", "-safe", "0", "-i", list_path,
-                "-c", "copy",  # Simple stream copy
-                "-movflags", "+faststart",
-                temp_output_path
-            ]
+            cmd_fallback = concat_cmd(["-c:v", "copy"])  # Simple stream copy
 
             try:
                 logging.info(f"Running Fallback: {' '.join(cmd_fallback)}")
@@ -2610,29 +2938,10 @@ def build_video(reciter_id, surah, start_ayah, end_ayah=None,
 
                 # Last resort: re-encode everything (list_path already exists)
                 logging.info("Last resort: re-encoding all segments...")
-                cmd_last_resort = [
-                    FFMPEG_EXE, "-y", "-f", "concat", "-safe", "0", "-i", list_path,
-                    "-c:v", "libx264", "-preset", "ultrafast", "-crf", "23",
-                    "-c:a", "aac", "-b:a", "192k",
-                    "-movflags", "+faststart",
-                    temp_output_path
-                ]
+                cmd_last_resort = concat_cmd(["-c:v", "libx264", "-preset", "ultrafast", "-crf", "23"])
                 subprocess.run(cmd_last_resort, check=True, capture_output=True, text=True, timeout=600)
 
-        # Move to final location with Arabic name
-        if os.path.exists(temp_output_path):
-            shutil.move(temp_output_path, output_path)
-
-        # Success
-        add_log('Done!')
-        update_progress(100, 'تم بنجاح!')
-        current_progress.set(is_complete=True, output_path=output_path)
-
-        if os.path.isfile(output_path):
-            size_mb = os.path.getsize(output_path) / (1024 * 1024)
-            logging.info(f"Output: {output_path} ({size_mb:.2f} MB)")
-
-        return output_path
+        return _finish_build(temp_output_path, output_path)
 
     except Exception as e:
         logging.exception("Error in build_video")
@@ -2688,6 +2997,11 @@ def generate_video():
     except (TypeError, ValueError):
         reciter_speed = 1.0
     transition_style_override = data.get('transitionStyle') or None
+    # Real JSON booleans only; anything else (absent, "false", 1) leaves the
+    # QURAN_CONTINUOUS_TIMELINE default in place.
+    continuous_timeline = data.get('continuousTimeline')
+    if not isinstance(continuous_timeline, bool):
+        continuous_timeline = None
 
     reset_progress()
 
@@ -2696,6 +3010,7 @@ def generate_video():
         args=(reciter_id, surah, start_ayah, end_ayah, quality,
               format_type, template, person_name, selected_font, target_duration_seconds,
               show_text, include_bismillah, reciter_speed, transition_style_override),
+        kwargs={'continuous_timeline': continuous_timeline},
         daemon=True
     )
     thread.start()
@@ -2717,12 +3032,15 @@ def preview_video():
     surah = int(data.get('surah', 1))
     ayah = int(data.get('ayah', data.get('startAyah', 1)))
     template = data.get('template', 'normal')
+    selected_font = data.get('selectedFont', 'random')
     show_text = data.get('showText', True)
 
     reset_progress()
+    # Previews composite on the proxy canvas and stay at its size.
     thread = threading.Thread(
         target=build_video,
         args=(reciter_id, surah, ayah, ayah, 'low', 'reels', template, '', selected_font, None, show_text),
+        kwargs={'upscale_proxy': False},
         daemon=True
     )
     thread.start()
@@ -2752,6 +3070,14 @@ def get_config():
         'availableFonts': available_fonts,
     })
 
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({
+        'audio': get_audio_index().stats(),
+        'single_flight': singleflight_stats(),
+        'bg_ingest': get_bg_ingestor().stats(),
+    })
+
 @app.route('/vision/<path:filename>')
 def serve_vision(filename):
     return send_from_directory(VISION_DIR, filename)
@@ -2765,6 +3091,9 @@ def serve_output(filename):
 # =============================================================================
 
 if __name__ == '__main__':
+    # Background ingestion uses a process pool; frozen (PyInstaller)
+    # builds must let its worker processes bootstrap here.
+    multiprocessing.freeze_support()
     logging.info('Server Starting...')
     print('=' * 50)
     print('  Quran Reels Generator (Refactored)')
@@ -2785,6 +3114,9 @@ if __name__ == '__main__':
 
     # Initialize background cache
     init_bg_cache()
+    get_bg_cache().sweep()
+    if BG_INGEST:
+        get_bg_ingestor().start()
 
     # webbrowser.open('http://127.0.0.1:5000')
     app.run(
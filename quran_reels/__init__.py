@@ -11,6 +11,27 @@ the leaf modules have been extracted from ``main.py``:
     animation filter expressions.
   * :mod:`quran_reels.services.background` — ``BackgroundRotator`` and
     its module-level helpers.
+  * :mod:`quran_reels.services.bg_index`   — immutable snapshot of the
+    background library with probed per-file metadata.
+  * :mod:`quran_reels.services.bg_cache`   — preprocessed-background
+    cache, keyed by source and tier and validated by manifest, with a
+    keyframe-aligned clip library per entry.
+  * :mod:`quran_reels.services.bg_ingest`  — low-priority ingestion of
+    new background videos ahead of builds.
+  * :mod:`quran_reels.services.fetch`      — shared asyncio fetch engine
+    (per-host concurrency / rate limits) for ayah audio and text.
+  * :mod:`quran_reels.services.audio_index` — persistent SQLite index of
+    per-ayah audio metadata (durations measured once, at fill time).
+  * :mod:`quran_reels.services.prefetch`   — low-priority prefetch of the
+    ayat following a build, bounded by the audio cache budget.
+  * :mod:`quran_reels.services.corpus`     — memory-mapped offline
+    Uthmani text corpus, indexed by global ayah number.
+  * :mod:`quran_reels.services.text_store` — persistent SQLite store of
+    ayah text, filled a whole surah per request.
+  * :mod:`quran_reels.services.layout`     — analytic text-card geometry
+    (font size, wrapping, PNG size) and its persistent index.
+  * :mod:`quran_reels.services.timeline`   — single-pass plan of a whole
+    video: background clip timeline and timed text overlays.
 
 ``main.py`` continues to be the entry point and re-exports the public
 names that used to live there, so existing callers
@@ -0,0 +1,455 @@
+"""Persistent audio-cache index: metadata, LRU bookkeeping and eviction.
+
+Durations used to be probed with one ffprobe process per ayah, per
+build: once in ``process_single_ayah_ffmpeg``, again for every
+candidate in ``_estimate_ayah_duration`` during the
+``target_duration_seconds`` loop, and again per finished segment.  And
+``cleanup_audio_cache`` walked and stat-ed the whole cache tree, sorted
+by mtime (which a cache hit never updated), and only ran at startup, so
+the cache grew without bound while the server was up.
+
+The index stores one row per cached recitation file, keyed by
+``(reciter, surah, ayah)``, in a small SQLite database next to the
+audio cache:
+
+  * **Metadata.**  Durations are computed at cache-fill time by the
+    pure-Python parser in :mod:`quran_reels.utils.mp3info`; ffprobe is
+    only used when the parser cannot read a file.  Each row records the
+    file's size and ``mtime_ns`` so a replaced file is re-measured
+    instead of served stale.
+  * **LRU.**  Every hit and fill stamps ``last_access``; an index on that
+    column makes "oldest N entries" a range scan.
+  * **Incremental eviction.**  Running totals (files, bytes, hits,
+    misses) live in a one-row ``totals`` table maintained in the same
+    transaction as each insert / delete, so enforcing
+    ``AUDIO_CACHE_MAX_SIZE_MB`` / ``AUDIO_CACHE_MAX_FILES`` after a fill
+    costs O(evicted), not O(cache).
+  * **Loudness.**  The EBU R128 integrated loudness and true peak of a
+    file are measured by one ffmpeg ``ebur128`` pass the first time a
+    build needs them, and kept with the row until the file changes, so
+    level matching between reciters / mirrors costs a single ``volume``
+    filter per build instead of a two-pass ``loudnorm``.
+
+SQLite (stdlib) gives safe concurrent access from every worker thread
+and from other processes sharing the same cache directory.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import sqlite3
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from quran_reels.utils.mp3info import mp3_duration
+
+
+INDEX_FILENAME = 'index.sqlite3'
+
+# Rows fetched per eviction round; eviction loops until under the limits.
+_EVICT_BATCH = 16
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS audio (
+        reciter      TEXT    NOT NULL,
+        surah        INTEGER NOT NULL,
+        ayah         INTEGER NOT NULL,
+        duration     REAL,
+        size         INTEGER NOT NULL,
+        mtime_ns     INTEGER NOT NULL,
+        last_access  REAL    NOT NULL DEFAULT 0,
+        hits         INTEGER NOT NULL DEFAULT 0,
+        digest       TEXT,
+        loudness     REAL,
+        peak         REAL,
+        PRIMARY KEY (reciter, surah, ayah)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS totals (
+        id      INTEGER PRIMARY KEY CHECK (id = 0),
+        files   INTEGER NOT NULL,
+        bytes   INTEGER NOT NULL,
+        hits    INTEGER NOT NULL,
+        misses  INTEGER NOT NULL
+    )
+    """,
+)
+
+# Columns added after the first release of the index, with their DDL.
+_MIGRATIONS = {
+    'last_access': 'ALTER TABLE audio ADD COLUMN last_access REAL NOT NULL DEFAULT 0',
+    'hits':        'ALTER TABLE audio ADD COLUMN hits INTEGER NOT NULL DEFAULT 0',
+    'digest':      'ALTER TABLE audio ADD COLUMN digest TEXT',
+    'loudness':    'ALTER TABLE audio ADD COLUMN loudness REAL',
+    'peak':        'ALTER TABLE audio ADD COLUMN peak REAL',
+}
+
+# ebur128 summary lines: "I: -18.3 LUFS" and (true peak) "Peak: -0.8 dBFS".
+_EBUR128_I = re.compile(r'\bI:\s+(-?[\d.]+|-inf)\s+LUFS')
+_EBUR128_PEAK = re.compile(r'\bPeak:\s+(-?[\d.]+|-inf)\s+dBFS')
+
+
+def probe_duration(path: str) -> float:
+    """Duration of ``path``: in-process MP3 parse, ffprobe as fallback."""
+    d = mp3_duration(path)
+    if d is not None and d > 0:
+        return d
+    # Lazy import — FFPROBE_EXE lives in main.py.
+    from main import get_audio_duration_ffprobe
+    return get_audio_duration_ffprobe(path)
+
+
+def measure_loudness(path: str, ffmpeg_exe: Optional[str] = None) -> Tuple[float, float]:
+    """EBU R128 integrated loudness (LUFS) and true peak (dBFS) of
+    ``path``, from one ffmpeg ``ebur128`` pass.  Silence reports
+    ``-inf`` loudness as ``-70.0`` (the absolute gate).
+
+    ``ffmpeg_exe`` defaults to main's ``FFMPEG_EXE``; worker processes
+    pass it in so they never import ``main``."""
+    if ffmpeg_exe is None:
+        # Lazy import — FFMPEG_EXE lives in main.py.
+        from main import FFMPEG_EXE
+        ffmpeg_exe = FFMPEG_EXE
+    cmd = [ffmpeg_exe or 'ffmpeg', '-hide_banner', '-nostats', '-i', path,
+           '-af', 'ebur128=peak=true:framelog=verbose', '-f', 'null', '-']
+    res = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+    loud = _EBUR128_I.findall(res.stderr)
+    peak = _EBUR128_PEAK.findall(res.stderr)
+    if res.returncode != 0 or not loud:
+        raise RuntimeError(f"ebur128 failed for {path}: {res.stderr.strip()[-200:]}")
+
+    def _db(value: str) -> float:
+        return -70.0 if value == '-inf' else float(value)
+
+    # The summary is printed last; earlier matches would be frame logs.
+    return _db(loud[-1]), (_db(peak[-1]) if peak else 0.0)
+
+
+class AudioIndex:
+    """SQLite-backed metadata + LRU index for the audio cache."""
+
+    def __init__(self, db_path: str, cache_dir: Optional[str] = None,
+                 max_bytes: int = 0, max_files: int = 0):
+        self.db_path = db_path
+        self.cache_dir = cache_dir or os.path.dirname(db_path)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        try:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.DatabaseError:
+            pass
+        for ddl in _SCHEMA:
+            self._conn.execute(ddl)
+        cols = {r[1] for r in self._conn.execute('PRAGMA table_info(audio)')}
+        for col, ddl in _MIGRATIONS.items():
+            if col not in cols:
+                self._conn.execute(ddl)
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS audio_lru ON audio (last_access)')
+        if self._conn.execute('SELECT 1 FROM totals WHERE id = 0').fetchone() is None:
+            # First open (or an index from before totals existed): seed the
+            # running totals with one full count.  Every later change is
+            # applied as a delta.
+            files, size = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM audio').fetchone()
+            self._conn.execute(
+                'INSERT OR IGNORE INTO totals (id, files, bytes, hits, misses) '
+                'VALUES (0, ?, ?, 0, 0)', (files, size))
+
+    # ---- reads ----
+
+    def _row(self, reciter, surah, ayah):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT duration, size, mtime_ns FROM audio '
+                'WHERE reciter=? AND surah=? AND ayah=?',
+                (str(reciter), surah, ayah)).fetchone()
+
+    def duration(self, reciter, surah: int, ayah: int, path: str) -> Optional[float]:
+        """Indexed duration of the cached file at ``path``.
+
+        Measures and records the file if it is not indexed yet or has
+        changed on disk since it was indexed.  Returns ``None`` if the
+        file does not exist.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        row = self._row(reciter, surah, ayah)
+        if (row is not None and row[0] is not None
+                and row[1] == st.st_size and row[2] == st.st_mtime_ns):
+            return row[0]
+        return self.record_fill(reciter, surah, ayah, path, enforce=False)
+
+    def loudness(self, reciter, surah: int, ayah: int, path: str,
+                 measure: Optional[Callable[[str], Tuple[float, float]]] = None
+                 ) -> Optional[Tuple[float, float]]:
+        """``(integrated LUFS, true peak dBFS)`` of the cached file.
+
+        Measured on first use and stored with the row; re-measured only
+        when the file changes.  ``measure`` replaces
+        :func:`measure_loudness` (e.g. to run it in another process).
+        Returns ``None`` if the file is missing or cannot be measured.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (str(reciter), surah, ayah)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT size, mtime_ns, loudness, peak FROM audio '
+                'WHERE reciter=? AND surah=? AND ayah=?', key).fetchone()
+        if (row is not None and row[2] is not None
+                and row[0] == st.st_size and row[1] == st.st_mtime_ns):
+            return row[2], row[3]
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+            self.record_fill(reciter, surah, ayah, path, enforce=False)
+        try:
+            loud, peak = (measure or measure_loudness)(path)
+        except Exception as e:
+            logging.warning(f"Could not measure loudness of {path}: {e}")
+            return None
+        with self._lock:
+            # Only attach the measurement to the file version it came from.
+            self._conn.execute(
+                'UPDATE audio SET loudness = ?, peak = ? '
+                'WHERE reciter=? AND surah=? AND ayah=? AND size=? AND mtime_ns=?',
+                (loud, peak) + key + (st.st_size, st.st_mtime_ns))
+        return loud, peak
+
+    def stats(self) -> Dict[str, float]:
+        """Cache totals and hit rate since the index was created."""
+        with self._lock:
+            files, size, hits, misses = self._conn.execute(
+                'SELECT files, bytes, hits, misses FROM totals WHERE id = 0').fetchone()
+        lookups = hits + misses
+        return {
+            'files': files,
+            'size_mb': round(size / (1024 * 1024), 2),
+            'max_files': self.max_files,
+            'max_size_mb': round(self.max_bytes / (1024 * 1024), 2),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    # ---- writes ----
+
+    def record_fill(self, reciter, surah: int, ayah: int, path: str,
+                    enforce: bool = True, digest: Optional[str] = None) -> Optional[float]:
+        """Measure ``path``, (re)write its row and enforce the limits.
+
+        ``digest`` is the content hash computed while the file was
+        written (see ``quran_reels.utils.fileio.AtomicWriter``).
+        Returns the duration (``None`` if it could not be measured).
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        try:
+            duration = probe_duration(path)
+        except Exception as e:
+            logging.warning(f"Could not measure duration of {path}: {e}")
+            duration = None
+        key = (str(reciter), surah, ayah)
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                old = self._conn.execute(
+                    'SELECT size FROM audio WHERE reciter=? AND surah=? AND ayah=?',
+                    key).fetchone()
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO audio '
+                    '(reciter, surah, ayah, duration, size, mtime_ns, last_access, hits, digest) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)',
+                    key + (duration, st.st_size, st.st_mtime_ns, time.time(), digest))
+                if old is None:
+                    self._conn.execute(
+                        'UPDATE totals SET files = files + 1, bytes = bytes + ? WHERE id = 0',
+                        (st.st_size,))
+                else:
+                    self._conn.execute(
+                        'UPDATE totals SET bytes = bytes + ? WHERE id = 0',
+                        (st.st_size - old[0],))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        if enforce:
+            self.enforce_limits(protect=key)
+        return duration
+
+    def record_hit(self, reciter, surah: int, ayah: int) -> None:
+        """Stamp an access on a cached entry and count it as a hit."""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute(
+                    'UPDATE audio SET last_access = ?, hits = hits + 1 '
+                    'WHERE reciter=? AND surah=? AND ayah=?',
+                    (time.time(), str(reciter), surah, ayah))
+                self._conn.execute('UPDATE totals SET hits = hits + 1 WHERE id = 0')
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self._conn.execute('UPDATE totals SET misses = misses + 1 WHERE id = 0')
+
+    def touch(self, reciter, surah: int, ayah: int) -> None:
+        """Refresh ``last_access`` without counting a hit."""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE audio SET last_access = ? WHERE reciter=? AND surah=? AND ayah=?',
+                (time.time(), str(reciter), surah, ayah))
+
+    def _delete_rows(self, rows) -> None:
+        """Remove ``(reciter, surah, ayah, size)`` rows and update totals.
+
+        Must be called with ``self._lock`` held.
+        """
+        if not rows:
+            return
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            removed = 0
+            freed = 0
+            for reciter, surah, ayah, size in rows:
+                cur = self._conn.execute(
+                    'DELETE FROM audio WHERE reciter=? AND surah=? AND ayah=?',
+                    (reciter, surah, ayah))
+                if cur.rowcount:
+                    removed += 1
+                    freed += size
+            self._conn.execute(
+                'UPDATE totals SET files = files - ?, bytes = bytes - ? WHERE id = 0',
+                (removed, freed))
+            self._conn.execute('COMMIT')
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+
+    def forget(self, reciter, surah: int, ayah: int) -> None:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT size FROM audio WHERE reciter=? AND surah=? AND ayah=?',
+                (str(reciter), surah, ayah)).fetchone()
+            if row is not None:
+                self._delete_rows([(str(reciter), surah, ayah, row[0])])
+
+    def enforce_limits(self, protect=None) -> int:
+        """Evict least-recently-used entries until within the limits.
+
+        ``protect`` is a ``(reciter, surah, ayah)`` key that must survive
+        (the entry that was just filled).  Returns the number evicted.
+        """
+        evicted = 0
+        while True:
+            with self._lock:
+                files, size = self._conn.execute(
+                    'SELECT files, bytes FROM totals WHERE id = 0').fetchone()
+                over_files = self.max_files and files > self.max_files
+                over_bytes = self.max_bytes and size > self.max_bytes
+                if not (over_files or over_bytes):
+                    return evicted
+                victims = self._conn.execute(
+                    'SELECT reciter, surah, ayah, size FROM audio '
+                    'ORDER BY last_access LIMIT ?', (_EVICT_BATCH,)).fetchall()
+                if protect is not None:
+                    victims = [v for v in victims if tuple(v[:3]) != tuple(protect)]
+                if not victims:
+                    return evicted
+                # Take only as many as needed to get back under the limits.
+                chosen = []
+                for v in victims:
+                    if not ((self.max_files and files > self.max_files)
+                            or (self.max_bytes and size > self.max_bytes)):
+                        break
+                    chosen.append(v)
+                    files -= 1
+                    size -= v[3]
+                for reciter, surah, ayah, _ in chosen:
+                    path = self.entry_path(reciter, surah, ayah)
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        logging.debug(f"Could not evict {path}: {e}")
+                self._delete_rows(chosen)
+                evicted += len(chosen)
+                logging.debug(f"Evicted {len(chosen)} audio cache entries")
+
+    def entry_path(self, reciter, surah: int, ayah: int) -> str:
+        """Cache path of an entry (mirrors ``main.get_cached_audio_path``)."""
+        return os.path.join(self.cache_dir, str(reciter), f'{surah:03d}{ayah:03d}.mp3')
+
+    def reconcile(self) -> None:
+        """Sync the index with the files on disk.
+
+        Indexes files that were added outside the index (e.g. caches from
+        before it existed) and drops rows whose files have gone.  This is
+        the only O(cache) operation and runs once at startup.
+        """
+        on_disk = {}
+        for root, _dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.mp3') or len(name) != 10:
+                    continue
+                try:
+                    surah, ayah = int(name[:3]), int(name[3:6])
+                except ValueError:
+                    continue
+                reciter = os.path.basename(root)
+                on_disk[(reciter, surah, ayah)] = os.path.join(root, name)
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT reciter, surah, ayah, size FROM audio').fetchall()
+            known = {tuple(r[:3]) for r in rows}
+            self._delete_rows([r for r in rows if tuple(r[:3]) not in on_disk])
+        for key, path in on_disk.items():
+            if key not in known:
+                self.record_fill(*key, path, enforce=False)
+                # Untracked files have no access history; age them to
+                # their mtime so they are evicted before recent fills.
+                with self._lock:
+                    self._conn.execute(
+                        'UPDATE audio SET last_access = ? '
+                        'WHERE reciter=? AND surah=? AND ayah=?',
+                        (os.path.getmtime(path),) + key)
+
+
+_index: Optional[AudioIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_audio_index() -> AudioIndex:
+    """Return the process-wide :class:`AudioIndex` for ``AUDIO_CACHE_DIR``."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            # Lazy import — cache dir and limits are defined in main.py.
+            from main import (
+                AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_FILES, AUDIO_CACHE_MAX_SIZE_MB,
+            )
+            _index = AudioIndex(
+                os.path.join(AUDIO_CACHE_DIR, INDEX_FILENAME),
+                cache_dir=AUDIO_CACHE_DIR,
+                max_bytes=AUDIO_CACHE_MAX_SIZE_MB * 1024 * 1024,
+                max_files=AUDIO_CACHE_MAX_FILES,
+            )
+        return _index
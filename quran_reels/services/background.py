@@ -13,44 +13,136 @@ They are co-located here so a future caller can reason about the
 The module also keeps the module-level ``bg_rotator`` singleton so the
 ``global bg_rotator`` rewrite in ``main.py`` is mechanical.
 
+Usage counts and last-use positions live in one process-wide
+:class:`RotationState` (dicts, O(1) per query) shared by every rotator
+and persisted to ``rotation_state.json`` under the background cache
+dir; a new rotator per build only resets which backgrounds the current
+video has used.
+
 Lazy imports from ``main`` keep the new module decoupled at module-load
 time and avoid the circular import that would otherwise occur between
 ``main`` and ``quran_reels.services.background``.
 """
 from __future__ import annotations
 
+import json
 import logging
 import os
 import random
-from typing import List, Optional, Union
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+from quran_reels.services.bg_cache import variant_name
+from quran_reels.services.bg_index import get_background_index
+from quran_reels.services.bg_ingest import ingestion_active
+from quran_reels.utils.fileio import atomic_write_bytes
+
+
+STATE_VERSION = 1
+STATE_FILENAME = 'rotation_state.json'
+
+
+class RotationState:
+    """Usage counters shared by every rotator in the process.
+
+    ``counts[path]`` is how often a background has been picked and
+    ``last_used[path]`` the pick number of its latest use (picks are
+    numbered from 1), so every query in ``get_next`` is a dict lookup.
+    The state is saved to ``rotation_state.json`` after each pick, so
+    rotation fairness survives restarts, not just builds.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.picks = 0
+        self.counts: Dict[str, int] = {}
+        self.last_used: Dict[str, int] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.picks = int(data.get('picks', 0))
+            self.counts = {str(k): int(v) for k, v in data.get('counts', {}).items()}
+            self.last_used = {str(k): int(v) for k, v in data.get('last_used', {}).items()}
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self.lock:
+            data = json.dumps({'version': STATE_VERSION, 'picks': self.picks,
+                               'counts': self.counts, 'last_used': self.last_used})
+        try:
+            atomic_write_bytes(self.path, data.encode('utf-8'))
+        except OSError as e:
+            logging.debug(f"Could not save rotation state: {e}")
+
+    def count(self, bg_path: str) -> int:
+        return self.counts.get(bg_path, 0)
+
+    def last_use(self, bg_path: str) -> int:
+        """Pick number of the latest use (0 if never used)."""
+        return self.last_used.get(bg_path, 0)
+
+    def used_within(self, bg_path: str, picks: int) -> bool:
+        """True if ``bg_path`` was one of the last ``picks`` picks."""
+        last = self.last_used.get(bg_path)
+        return last is not None and self.picks - last < picks
+
+    def record(self, bg_path: str) -> None:
+        with self.lock:
+            self.picks += 1
+            self.counts[bg_path] = self.counts.get(bg_path, 0) + 1
+            self.last_used[bg_path] = self.picks
 
 
 class BackgroundRotator:
     """Manages background video rotation to prevent repetition per video generation."""
 
-    def __init__(self, style: str = 'nature'):
+    def __init__(self, style: str = 'nature', state: Optional[RotationState] = None,
+                 tier: Optional[Tuple[int, int, int]] = None):
         self.style = style
+        # (width, height, fps) of the preprocessed backgrounds the build
+        # uses; None means the full tier.
+        self.tier = tier
         self.used_backgrounds = set()
         self.available = self._load_backgrounds()
         self.current_index = 0
-        self.usage_history: List[str] = []  # Track usage across sessions
-        self.min_distance = 3                # Minimum distance between repeats
+        self.state = state or get_rotation_state()  # Track usage across sessions
+        self.min_distance = 3                       # Minimum distance between repeats
+        # Ayah workers call get_next concurrently.
+        self._lock = self.state.lock
 
     def _load_backgrounds(self) -> List[str]:
-        """Load available backgrounds for the style."""
-        # Lazy import — VISION_DIR is defined in main.py.
-        from main import VISION_DIR
-
-        style_dir = os.path.join(VISION_DIR, self.style)
-        if os.path.isdir(style_dir):
-            files = [f for f in os.listdir(style_dir) if f.endswith('.mp4')]
-            return [os.path.join(style_dir, f) for f in files]
-        else:
-            # Fallback to pattern-based in main vision folder
-            pattern = f"{self.style}_part"
-            files = [f for f in os.listdir(VISION_DIR)
-                     if f.startswith(pattern) and f.endswith('.mp4')]
-            return [os.path.join(VISION_DIR, f) for f in files]
+        """Available backgrounds for the style, from the shared snapshot
+        index (no directory listing unless the library changed).
+
+        While background ingestion is running, videos it has not
+        preprocessed yet for the rotator's tier are skipped so no build
+        pays for their first transcode — unless none of the style's
+        videos is ready.
+        """
+        index = get_background_index()
+        paths = list(index.snapshot().paths(self.style))
+        if not ingestion_active():
+            return paths
+        tier = self.tier
+        if tier is None:
+            # Lazy import — the tiers are configured in main.py.
+            from main import BG_TIERS
+            tier = BG_TIERS[0]
+        variant = variant_name(*tier)
+        ready = [p for p in paths if index.is_prepared(p, variant)]
+        if len(ready) < len(paths):
+            logging.debug(f"Rotator: {len(paths) - len(ready)} '{self.style}' "
+                          f"background(s) not ingested yet")
+        return ready or paths
 
     def get_next(self, count: int = 1) -> Union[str, List[str]]:
         """Get next background(s) ensuring variety with smart rotation.
@@ -63,7 +155,16 @@ class BackgroundRotator:
              LRU, a near-recent one) cannot repeat too soon.
           4. If every candidate is filtered out, accept the violation rather
              than starve — the alternative is failing the call.
+
+        Thread-safe; the shared usage state is saved after each call.
         """
+        with self._lock:
+            selected = self._pick(count)
+        self.state.save()
+        return selected
+
+    def _pick(self, count: int) -> Union[str, List[str]]:
+        # Caller holds self._lock.
         if not self.available:
             raise ValueError(f"No backgrounds found for style: {self.style}")
 
@@ -148,21 +249,15 @@ class BackgroundRotator:
 
     def _get_usage_count(self, bg_path: str) -> int:
         """Get how many times this background was used."""
-        return sum(1 for entry in self.usage_history if entry == bg_path)
+        return self.state.count(bg_path)
 
     def _get_last_usage_time(self, bg_path: str) -> int:
         """Get last usage time (0 if never used)."""
-        for i in reversed(range(len(self.usage_history))):
-            if self.usage_history[i] == bg_path:
-                return i
-        return 0
+        return self.state.last_use(bg_path)
 
     def _record_usage(self, bg_path: str) -> None:
         """Record background usage."""
-        self.usage_history.append(bg_path)
-        # Keep history manageable
-        if len(self.usage_history) > 100:
-            self.usage_history = self.usage_history[-50:]
+        self.state.record(bg_path)
 
     def _violates_min_distance(self, bg_path: str) -> bool:
         """Return True if bg_path was used within the last min_distance picks.
@@ -172,25 +267,48 @@ class BackgroundRotator:
         """
         if self.min_distance <= 0:
             return False
-        recent = self.usage_history[-self.min_distance:] if self.usage_history else []
-        return bg_path in recent
+        return self.state.used_within(bg_path, self.min_distance)
 
     def reset(self) -> None:
         """Reset rotation for new video generation."""
-        self.used_backgrounds.clear()
-        self.current_index = 0
+        with self._lock:
+            self.used_backgrounds.clear()
+            self.current_index = 0
+
+
+_state: Optional[RotationState] = None
+_state_lock = threading.Lock()
+
+
+def get_rotation_state() -> RotationState:
+    """Return the process-wide :class:`RotationState`, loaded from
+    ``rotation_state.json`` in the background cache dir."""
+    global _state
+    with _state_lock:
+        if _state is None:
+            # Lazy import — BG_CACHE_DIR is defined in main.py.
+            from main import BG_CACHE_DIR
+            _state = RotationState(os.path.join(BG_CACHE_DIR, STATE_FILENAME))
+        return _state
 
 
 # Module-level singleton — keep the same shape as the original main.py
 # ``bg_rotator = None`` so any ``global bg_rotator`` rewrite in main.py
 # is purely a rename.
 bg_rotator: Optional[BackgroundRotator] = None
+_rotator_lock = threading.Lock()
+
 
+def init_background_rotator(style: str = 'nature',
+                            tier: Optional[Tuple[int, int, int]] = None) -> BackgroundRotator:
+    """Initialize or reset the background rotator for a new video.
 
-def init_background_rotator(style: str = 'nature') -> BackgroundRotator:
-    """Initialize or reset the background rotator for a new video."""
+    Only the per-video "already used" set starts afresh; usage counts
+    live in the shared :class:`RotationState`.  ``tier`` is the build
+    canvas's ``(width, height, fps)``.
+    """
     global bg_rotator
-    bg_rotator = BackgroundRotator(style)
+    bg_rotator = BackgroundRotator(style, tier=tier)
     logging.info(f"Background rotator initialized for style: {style}")
     return bg_rotator
 
@@ -198,6 +316,7 @@ def init_background_rotator(style: str = 'nature') -> BackgroundRotator:
 def get_next_background(
     style: str = 'nature',
     count: int = 1,
+    tier: Optional[Tuple[int, int, int]] = None,
 ) -> Union[str, List[str]]:
     """Get next background(s) using rotator to prevent repetition."""
     global bg_rotator
@@ -206,11 +325,14 @@ def get_next_background(
     from main import pick_bg
 
     # Initialize if needed or style changed
-    if bg_rotator is None or bg_rotator.style != style:
-        init_background_rotator(style)
+    with _rotator_lock:
+        rotator = bg_rotator
+        if rotator is None or rotator.style != style or \
+                (tier is not None and rotator.tier != tier):
+            rotator = init_background_rotator(style, tier)
 
     try:
-        return bg_rotator.get_next(count)
+        return rotator.get_next(count)
     except ValueError:
         # Fallback to random selection if rotator fails
         logging.warning("Rotator failed, falling back to random selection")
@@ -0,0 +1,354 @@
+"""Immutable snapshot index of the background video library.
+
+``pick_bg`` used to call ``init_bg_cache()`` on every pick — a
+``listdir`` of ``VISION_DIR`` and of every style folder, rebinding the
+global ``BG_CACHE`` while other worker threads were reading it — and
+``BackgroundRotator`` listed its style folder again on every build.  On
+a network-mounted vision share those listings are slow.
+
+:class:`BackgroundIndex` keeps one immutable :class:`BackgroundSnapshot`
+of the library:
+
+  * **Refreshed on change only.**  A snapshot remembers the mtime of
+    ``VISION_DIR`` and of each style folder.  At most every
+    ``CHECK_INTERVAL`` seconds a reader re-``stat``s those directories
+    (one stat each, no listing); only when one has changed — a file was
+    added, removed or renamed — is the library listed again.
+  * **Immutable.**  A refresh builds a new snapshot and swaps the
+    reference; readers holding the old one keep a consistent view, so
+    no lock is needed to read.
+  * **Per-file metadata.**  Every entry carries its size and mtime and,
+    from one ffprobe per file, duration, resolution and frame rate.
+    Probes are cached in ``bg_index.json`` under the background cache
+    dir keyed by path + size + mtime, so a refresh or restart only
+    probes new or replaced files.
+  * **Readiness records.**  The same file records, per output size,
+    whether a file's preprocessed copy is in the background cache
+    (:meth:`BackgroundIndex.mark_prepared`), stamped with the size and
+    mtime it was made from; replacing the file invalidates the record.
+  * **Analysis results.**  Per-file results such as the luminance stats
+    used for automatic text colour are stored the same way
+    (:meth:`BackgroundIndex.record_analysis`), so each file is analysed
+    once, not once per segment.
+
+``pick_bg`` and ``BackgroundRotator`` both read from the process-wide
+index returned by :func:`get_background_index`.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from dataclasses import asdict, dataclass
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
+
+from quran_reels.utils.fileio import atomic_write_bytes
+
+
+VIDEO_EXTS = ('.mp4',)
+
+# Seconds between directory mtime checks.
+CHECK_INTERVAL = 2.0
+
+METADATA_FILENAME = 'bg_index.json'
+
+
+@dataclass(frozen=True)
+class BackgroundInfo:
+    """One background video and its probed stream parameters."""
+
+    path:     str
+    size:     int
+    mtime_ns: int
+    duration: Optional[float] = None
+    width:    Optional[int] = None
+    height:   Optional[int] = None
+    fps:      Optional[float] = None
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+
+@dataclass(frozen=True)
+class BackgroundSnapshot:
+    """The library as of one scan.
+
+    ``styles`` maps each style folder to its videos; ``loose`` holds the
+    videos directly in ``VISION_DIR`` (the old ``<style>_part*.mp4``
+    naming).  ``dir_mtimes`` records the directories the scan listed.
+    """
+
+    root:       str
+    styles:     Mapping[str, Tuple[BackgroundInfo, ...]]
+    loose:      Tuple[BackgroundInfo, ...]
+    dir_mtimes: Mapping[str, int]
+    by_path:    Mapping[str, BackgroundInfo]
+
+    def entries(self, style: str) -> Tuple[BackgroundInfo, ...]:
+        """Videos for ``style``: its folder if there is one, else the
+        loose files named ``<style>_part*`` / ``<style> part*``."""
+        if style in self.styles:
+            return self.styles[style]
+        prefixes = (f"{style}_part", f"{style} part")
+        return tuple(e for e in self.loose if e.name.startswith(prefixes))
+
+    def paths(self, style: str) -> Tuple[str, ...]:
+        return tuple(e.path for e in self.entries(style))
+
+    def info(self, path: str) -> Optional[BackgroundInfo]:
+        return self.by_path.get(path)
+
+
+def probe_background(path: str, ffprobe_exe: Optional[str] = None) -> Dict[str, Optional[float]]:
+    """Duration, resolution and frame rate of ``path`` via ffprobe."""
+    if ffprobe_exe is None:
+        # Lazy import — FFPROBE_EXE lives in main.py.
+        from main import FFPROBE_EXE as ffprobe_exe
+    cmd = [ffprobe_exe or 'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries', 'stream=width,height,avg_frame_rate,r_frame_rate:format=duration',
+           '-of', 'json', path]
+    out = subprocess.run(cmd, capture_output=True, text=True, timeout=15, check=True)
+    data = json.loads(out.stdout or '{}')
+    stream = (data.get('streams') or [{}])[0]
+
+    def _rate(value):
+        try:
+            num, _, den = (value or '').partition('/')
+            return round(float(num) / float(den or 1), 3) if float(num) else None
+        except (ValueError, ZeroDivisionError):
+            return None
+
+    duration = (data.get('format') or {}).get('duration')
+    return {
+        'duration': float(duration) if duration not in (None, 'N/A') else None,
+        'width': stream.get('width'),
+        'height': stream.get('height'),
+        'fps': _rate(stream.get('avg_frame_rate')) or _rate(stream.get('r_frame_rate')),
+    }
+
+
+def _stat_mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class BackgroundIndex:
+    """Holds the current :class:`BackgroundSnapshot` of ``root``."""
+
+    def __init__(self, root: str, metadata_path: Optional[str] = None,
+                 check_interval: float = CHECK_INTERVAL, probe_workers: int = 4):
+        self.root = root
+        self.metadata_path = metadata_path
+        self.check_interval = check_interval
+        self.probe_workers = probe_workers
+        self._lock = threading.Lock()
+        self._meta_lock = threading.RLock()
+        self._snapshot: Optional[BackgroundSnapshot] = None
+        self._checked_at = 0.0
+        self._meta: Dict[str, dict] = self._load_metadata()
+
+    # ---- metadata cache ----
+
+    def _load_metadata(self) -> Dict[str, dict]:
+        if not self.metadata_path:
+            return {}
+        try:
+            with open(self.metadata_path, encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_metadata(self) -> None:
+        if not self.metadata_path:
+            return
+        try:
+            with self._meta_lock:
+                data = json.dumps(self._meta, sort_keys=True).encode('utf-8')
+            atomic_write_bytes(self.metadata_path, data)
+        except OSError as e:
+            logging.debug(f"Could not save background metadata: {e}")
+
+    def _entry(self, path: str, st: os.stat_result) -> Tuple[BackgroundInfo, bool]:
+        """Entry for ``path``; second item is True if it still needs a probe."""
+        meta = self._meta.get(path)
+        if meta and meta.get('size') == st.st_size and meta.get('mtime_ns') == st.st_mtime_ns:
+            return BackgroundInfo(**{k: meta.get(k) for k in BackgroundInfo.__dataclass_fields__}), False
+        return BackgroundInfo(path, st.st_size, st.st_mtime_ns), True
+
+    def _probe_all(self, entries: Dict[str, BackgroundInfo]) -> None:
+        def probe(info: BackgroundInfo) -> BackgroundInfo:
+            try:
+                return BackgroundInfo(info.path, info.size, info.mtime_ns, **probe_background(info.path))
+            except Exception as e:
+                logging.warning(f"Could not probe background {info.name}: {e}")
+                return info
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.probe_workers) as pool:
+            for info in pool.map(probe, list(entries.values())):
+                entries[info.path] = info
+                with self._meta_lock:
+                    # A new or replaced file: any readiness record is stale.
+                    self._meta[info.path] = asdict(info)
+
+    # ---- preprocessing readiness ----
+
+    def mark_prepared(self, path: str, variant: str, prepared: bool = True) -> None:
+        """Record whether ``path`` has a preprocessed copy of ``variant``
+        (see ``bg_cache.variant_name``) as of its current size / mtime."""
+        with self._meta_lock:
+            meta = self._meta.get(path)
+            if meta is None:
+                return
+            marks = meta.setdefault('prepared', {})
+            stamp = [meta.get('size'), meta.get('mtime_ns')]
+            if prepared:
+                if marks.get(variant) == stamp:
+                    return
+                marks[variant] = stamp
+            elif marks.pop(variant, None) is None:
+                return
+        self._save_metadata()
+
+    def is_prepared(self, path: str, variant: str) -> bool:
+        with self._meta_lock:
+            meta = self._meta.get(path) or {}
+            stamp = (meta.get('prepared') or {}).get(variant)
+            return stamp is not None and stamp == [meta.get('size'), meta.get('mtime_ns')]
+
+    # ---- per-file analysis results ----
+
+    def analysis(self, path: str, name: str):
+        """Stored result ``name`` for ``path`` (e.g. ``'luma'``), or
+        None if there is none for the file as it is now on disk."""
+        with self._meta_lock:
+            record = ((self._meta.get(path) or {}).get('analysis') or {}).get(name)
+        if record is None:
+            return None
+        # Stamped with a live stat, not the scan's: a file overwritten in
+        # place does not change its folder's mtime, so no rescan sees it.
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if record.get('stamp') != [st.st_size, st.st_mtime_ns]:
+            return None
+        return record.get('value')
+
+    def record_analysis(self, path: str, name: str, value, stamp: Optional[Tuple[int, int]] = None) -> bool:
+        """Store result ``name`` for ``path`` as of ``stamp`` (its size and
+        mtime when analysed; default: now).  Returns False if ``path`` is
+        not in the index."""
+        if stamp is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            stamp = (st.st_size, st.st_mtime_ns)
+        with self._meta_lock:
+            meta = self._meta.get(path)
+            if meta is None:
+                return False
+            meta.setdefault('analysis', {})[name] = {'stamp': list(stamp), 'value': value}
+        self._save_metadata()
+        return True
+
+    # ---- scanning ----
+
+    def _scan(self) -> BackgroundSnapshot:
+        dir_mtimes = {self.root: _stat_mtime(self.root)}
+        styles: Dict[str, list] = {}
+        loose: list = []
+        by_path: Dict[str, BackgroundInfo] = {}
+        to_probe: Dict[str, BackgroundInfo] = {}
+
+        def add(path: str, st: os.stat_result, bucket: list) -> None:
+            info, stale = self._entry(path, st)
+            if stale:
+                to_probe[path] = info
+            bucket.append(path)
+            by_path[path] = info
+
+        try:
+            top = sorted(os.scandir(self.root), key=lambda d: d.name)
+        except OSError as e:
+            logging.warning(f"Cannot list background folder {self.root}: {e}")
+            top = []
+        for d in top:
+            if d.is_dir():
+                bucket = styles.setdefault(d.name, [])
+                dir_mtimes[d.path] = d.stat().st_mtime_ns
+                for f in sorted(os.scandir(d.path), key=lambda x: x.name):
+                    if f.is_file() and f.name.lower().endswith(VIDEO_EXTS):
+                        add(f.path, f.stat(), bucket)
+            elif d.is_file() and d.name.lower().endswith(VIDEO_EXTS):
+                add(d.path, d.stat(), loose)
+
+        if to_probe:
+            logging.info(f"Probing {len(to_probe)} new background video(s)")
+            self._probe_all(to_probe)
+            by_path.update(to_probe)
+            self._save_metadata()
+
+        def freeze(paths):
+            return tuple(by_path[p] for p in paths)
+
+        return BackgroundSnapshot(
+            root=self.root,
+            styles=MappingProxyType({s: freeze(p) for s, p in styles.items()}),
+            loose=freeze(loose),
+            dir_mtimes=MappingProxyType(dir_mtimes),
+            by_path=MappingProxyType(by_path),
+        )
+
+    def _changed(self, snap: BackgroundSnapshot) -> bool:
+        if _stat_mtime(self.root) != snap.dir_mtimes.get(self.root):
+            return True
+        return any(_stat_mtime(d) != m for d, m in snap.dir_mtimes.items() if d != self.root)
+
+    def snapshot(self) -> BackgroundSnapshot:
+        """The current snapshot, rescanning first if the library changed."""
+        snap = self._snapshot
+        now = time.monotonic()
+        if snap is not None and now - self._checked_at < self.check_interval:
+            return snap
+        with self._lock:
+            snap = self._snapshot
+            if snap is None or (time.monotonic() - self._checked_at >= self.check_interval
+                                and self._changed(snap)):
+                snap = self._snapshot = self._scan()
+                logging.debug(f"Background index: {len(snap.by_path)} videos, "
+                              f"{len(snap.styles)} style folders")
+            self._checked_at = time.monotonic()
+            return snap
+
+    def refresh(self) -> BackgroundSnapshot:
+        """Rescan unconditionally."""
+        with self._lock:
+            self._snapshot = self._scan()
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+
+_index: Optional[BackgroundIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_background_index() -> BackgroundIndex:
+    """Return the process-wide :class:`BackgroundIndex` for ``VISION_DIR``."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            # Lazy import — VISION_DIR / BG_CACHE_DIR are defined in main.py.
+            from main import BG_CACHE_DIR, VISION_DIR
+            _index = BackgroundIndex(
+                VISION_DIR, metadata_path=os.path.join(BG_CACHE_DIR, METADATA_FILENAME))
+        return _index
@@ -0,0 +1,222 @@
+"""Background ingestion: preprocess new videos before a build needs them.
+
+A background added to ``VISION_DIR`` used to be transcoded (scale, crop,
+fps=30, yuv420p) the first time a build picked it, inside that user's
+request — up to two minutes of ``libx264`` on the critical path.
+
+:class:`BackgroundIngestor` moves that work off it:
+
+  * **Watches the library.**  A daemon thread polls the background
+    index (:mod:`quran_reels.services.bg_index`), which rescans only
+    when a style folder changed, and checks every video against the
+    background cache (:mod:`quran_reels.services.bg_cache`).
+  * **Preprocesses in a low-priority process pool.**  Missing or stale
+    entries are transcoded by ``workers`` processes started at
+    ``os.nice(NICENESS)`` (inherited by their ffmpeg; see
+    :mod:`quran_reels.utils.priority`), so ingestion
+    yields the CPU to user builds.  Workers run the cache's own fill, so
+    the cache's cross-process key lock still applies: a build that
+    needs a file while it is being ingested waits for that transcode
+    instead of starting a second one.  Newest files go first.
+  * **Records readiness in the index.**  Each finished (or found) entry
+    is recorded with :meth:`BackgroundIndex.mark_prepared`; while
+    ingestion is active, ``BackgroundRotator`` only picks videos that
+    are ready, so a new file joins the rotation once it is ingested.
+    Every tier the ingestor is configured with (the full tier and, when
+    enabled, the proxy tier) is prepared; the rotator checks the tier of
+    the build it serves.
+    The worker also measures the file's luminance stats for automatic
+    text colour (:mod:`quran_reels.services.contrast`), stored alongside.
+
+Worker processes are spawned, not forked (see
+:mod:`quran_reels.utils.priority`), and import only this module and its
+leaf dependencies — never ``main``.
+
+A poll checks the cache only for files that are not marked prepared
+for a tier; a mark is stamped with the index snapshot's size / mtime,
+so a changed file is checked again, but unchanged ready files cost no
+``stat`` on the (possibly network) library share.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from quran_reels.services.bg_cache import BackgroundCache, get_bg_cache, variant_name
+from quran_reels.services.bg_index import BackgroundIndex, get_background_index
+from quran_reels.services.contrast import ANALYSIS_NAME, measure_background_stats
+from quran_reels.utils.priority import low_priority_pool
+
+
+# Seconds between library checks.
+POLL_INTERVAL = 10.0
+
+def _prepare(cache_dir: str, ffmpeg_exe: Optional[str], ffprobe_exe: Optional[str],
+             bg_path: str, target_w: int, target_h: int, fps: int,
+             with_stats: bool) -> Tuple[bool, Optional[dict]]:
+    """Worker: fill one cache entry, cut its clip library and (if asked)
+    measure the source's luminance stats.  Returns ``(entry present,
+    stats)``; the parent records both in the index."""
+    cache = BackgroundCache(cache_dir, ffmpeg_exe=ffmpeg_exe, ffprobe_exe=ffprobe_exe)
+    stats = measure_background_stats(bg_path, ffmpeg_exe=ffmpeg_exe) if with_stats else None
+    cached_path = cache.get(bg_path, target_w, target_h, fps)
+    if cached_path == bg_path:
+        return False, stats
+    cache.clips(cached_path)
+    return True, stats
+
+
+class BackgroundIngestor:
+    """Keeps every background in the index preprocessed for each
+    ``(width, height, fps)`` tier in ``tiers``."""
+
+    def __init__(self, index: BackgroundIndex, cache: BackgroundCache,
+                 tiers: List[Tuple[int, int, int]], ffmpeg_exe: Optional[str],
+                 ffprobe_exe: Optional[str], workers: int = 1,
+                 poll_interval: float = POLL_INTERVAL):
+        self.index = index
+        self.cache = cache
+        self.tiers = list(tiers)
+        self.ffmpeg_exe = ffmpeg_exe
+        self.ffprobe_exe = ffprobe_exe
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._pending: Set[Tuple[str, str]] = set()
+        # (path, variant) -> (size, mtime_ns) of a source that failed to
+        # ingest; not retried until the file changes.
+        self._failed: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self.ingested = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._pool = low_priority_pool(self.workers)
+            self._thread = threading.Thread(target=self._run, name='bg-ingest', daemon=True)
+            self._thread.start()
+        logging.info(f"Background ingestion started ({self.workers} worker(s))")
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, pool = self._thread, self._pool
+        if thread is not None:
+            thread.join(timeout=self.poll_interval)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._thread = self._pool = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                logging.warning(f"Background ingestion check failed: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def poll_once(self) -> int:
+        """Check the library once; returns the number of files queued."""
+        snap = self.index.snapshot()
+        queued = 0
+        # Newest first: a file just dropped in is the one a user is waiting on.
+        for info in sorted(snap.by_path.values(), key=lambda i: i.mtime_ns, reverse=True):
+            for ti, (w, h, fps) in enumerate(self.tiers):
+                variant = variant_name(w, h, fps)
+                if self.index.is_prepared(info.path, variant):
+                    continue
+                key = (info.path, variant)
+                with self._lock:
+                    if key in self._pending or \
+                            self._failed.get(key) == (info.size, info.mtime_ns):
+                        continue
+                if self.cache.lookup(info.path, self.cache.path_for(info.path, w, h, fps)):
+                    self.index.mark_prepared(info.path, variant)
+                    continue
+                self.index.mark_prepared(info.path, variant, prepared=False)
+                # Luminance stats belong to the source: measured with the first tier only.
+                if self._submit(key, (info.size, info.mtime_ns), info.path, w, h, fps,
+                                ti == 0):
+                    queued += 1
+        if queued:
+            logging.info(f"Background ingestion: {queued} file(s) queued")
+        return queued
+
+    def _submit(self, key: Tuple[str, str], stamp: Tuple[int, int],
+                path: str, w: int, h: int, fps: int, with_stats: bool) -> bool:
+        pool = self._pool
+        if pool is None:
+            return False
+        with self._lock:
+            self._pending.add(key)
+        try:
+            future = pool.submit(_prepare, self.cache.cache_dir, self.ffmpeg_exe,
+                                 self.ffprobe_exe, path, w, h, fps,
+                                 with_stats and self.index.analysis(path, ANALYSIS_NAME) is None)
+        except RuntimeError:  # pool shut down
+            with self._lock:
+                self._pending.discard(key)
+            return False
+        future.add_done_callback(lambda f: self._done(key, stamp, f))
+        return True
+
+    def _done(self, key: Tuple[str, str], stamp: Tuple[int, int],
+              future: concurrent.futures.Future) -> None:
+        path, variant = key
+        ok, stats = False, None
+        try:
+            if not future.cancelled():
+                ok, stats = future.result()
+        except Exception as e:
+            logging.warning(f"Ingesting {os.path.basename(path)} failed: {e}")
+        if stats is not None:
+            self.index.record_analysis(path, ANALYSIS_NAME, stats, stamp)
+        with self._lock:
+            self._pending.discard(key)
+            if ok:
+                self.ingested += 1
+                self._failed.pop(key, None)
+            elif not future.cancelled():
+                self.failed += 1
+                self._failed[key] = stamp
+        if ok:
+            self.index.mark_prepared(path, variant)
+            logging.info(f"Background ingested: {os.path.basename(path)} ({variant})")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'running': self.running, 'pending': len(self._pending),
+                    'ingested': self.ingested, 'failed': self.failed}
+
+
+_ingestor: Optional[BackgroundIngestor] = None
+_ingestor_lock = threading.Lock()
+
+
+def get_bg_ingestor() -> BackgroundIngestor:
+    """Return the process-wide :class:`BackgroundIngestor` (not started)."""
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is None:
+            # Lazy import — tiers, binaries and worker count are configured in main.py.
+            from main import BG_INGEST_WORKERS, BG_TIERS, FFMPEG_EXE, FFPROBE_EXE
+            _ingestor = BackgroundIngestor(
+                get_background_index(), get_bg_cache(), list(BG_TIERS),
+                FFMPEG_EXE, FFPROBE_EXE, workers=BG_INGEST_WORKERS)
+        return _ingestor
+
+
+def ingestion_active() -> bool:
+    """True while the process-wide ingestor is running."""
+    return _ingestor is not None and _ingestor.running
@@ -1,9 +1,31 @@
-"""Background brightness sampling and template-aware text colour picking.
+"""Background luminance analysis and template-aware text colour picking.
 
 The functions here used to live in ``main.py`` STEP 13.5.  They are
 extracted so the contrast logic can be tested and reasoned about in
-isolation, and so future "smart colour" work (e.g. caching brightness
-results, region sampling) can be added without touching ``main.py``.
+isolation.
+
+**Analysis.**  :func:`measure_background_stats` decodes a handful of
+keyframes of a background once, downscaled to ``SAMPLE_W`` x
+``SAMPLE_H`` and cropped to the output's 9:16 frame the way
+preprocessing crops it, and reduces them with NumPy to per-band
+statistics: the frame is cut into ``BANDS`` horizontal bands and, over
+the columns the text card covers, each band keeps a luminance histogram
+and a local-contrast (busyness) figure.  The text card is centred, so
+the bands it overlaps are known from its height alone; the colour
+decision looks only at those (:func:`region_luminance`), not at a sky
+or a floor the text never touches.
+
+**Caching.**  The stats are stored in the background index
+(:mod:`quran_reels.services.bg_index`) stamped with the file's size and
+mtime — by background ingestion, or by the first segment that needs
+them — so ffmpeg runs once per background, not once per segment.
+Files outside the library are memoised in-process instead.
+
+**Colour choice.**  :func:`get_contrasting_text_color` scores candidate
+text colours by WCAG contrast ratio against the region's worst case —
+its bright end for light text, its dark end for dark text — keeps the
+template's colour when it clears the threshold (higher over a busy
+region) and otherwise takes the best of white and near-black.
 
 Lazy imports from ``main`` keep the new module decoupled at module-load
 time and avoid the circular import that would otherwise occur between
@@ -11,63 +33,216 @@ time and avoid the circular import that would otherwise occur between
 """
 from __future__ import annotations
 
+import logging
+import os
 import subprocess
-from typing import Tuple
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from quran_reels.services.bg_index import get_background_index
+from quran_reels.utils.singleflight import SingleFlight
+
+
+STATS_VERSION = 1
+ANALYSIS_NAME = 'luma'
+
+# Analysis raster: the 1080x1920 output frame at 1/15 scale.
+SAMPLE_W, SAMPLE_H = 72, 128
+SAMPLE_FRAMES = 8
+BANDS = 16
+BINS = 16
+
+# Columns the text card covers (render width TARGET_W - 160 plus
+# padding, of TARGET_W): all but a ~3% margin each side.
+TEXT_MARGIN = 0.03
+
+# WCAG 2 contrast ratios: 3:1 is AA for large text; a busy region gets
+# the normal-text 4.5:1.
+MIN_CONTRAST = 3.0
+MIN_CONTRAST_BUSY = 4.5
+# Mean absolute neighbour difference (0-1 luma) above which a region is busy.
+BUSY_THRESHOLD = 0.06
+
+LIGHT_TEXT = ('#ffffff', '#000000')
+DARK_TEXT = ('#1a1a1a', '#ffffff')
+
+# Analyses of files the background index does not know, by (path, size, mtime).
+_memo: Dict[Tuple[str, int, int], dict] = {}
+_memo_lock = threading.Lock()
+_flight = SingleFlight('luma')
+
+
+def measure_background_stats(bg_path: str, ffmpeg_exe: Optional[str] = None) -> Optional[dict]:
+    """Per-band luminance statistics of ``bg_path`` (uncached), or None if
+    it cannot be decoded.  ``ffmpeg_exe`` defaults to main.py's."""
+    if ffmpeg_exe is None:
+        # Lazy import — FFMPEG_EXE is defined in main.py and bringing it
+        # in at module top would create a circular import.
+        from main import FFMPEG_EXE as ffmpeg_exe
+
+    # Keyframes only (-skip_frame nokey): a spread of the video for the
+    # cost of decoding a few frames.
+    cmd = [
+        ffmpeg_exe, '-v', 'error', '-skip_frame', 'nokey', '-i', bg_path,
+        '-vf', (f'scale={SAMPLE_W}:{SAMPLE_H}:force_original_aspect_ratio=increase,'
+                f'crop={SAMPLE_W}:{SAMPLE_H},format=gray'),
+        '-frames:v', str(SAMPLE_FRAMES),
+        '-f', 'rawvideo', '-pix_fmt', 'gray', 'pipe:1',
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=30)
+    except Exception as e:
+        logging.warning(f"Could not analyze background luminance: {e}")
+        return None
+    frame_bytes = SAMPLE_W * SAMPLE_H
+    n = len(result.stdout) // frame_bytes
+    if result.returncode != 0 or n == 0:
+        logging.warning(f"Could not analyze background luminance of {os.path.basename(bg_path)}")
+        return None
+    return stats_from_frames(
+        np.frombuffer(result.stdout[:n * frame_bytes], dtype=np.uint8).reshape(n, SAMPLE_H, SAMPLE_W))
+
+
+def stats_from_frames(frames: np.ndarray) -> dict:
+    """Reduce ``(n, SAMPLE_H, SAMPLE_W)`` gray frames to the stored stats."""
+    # Y' is limited range (16-235); bring it to 0-1.
+    luma = np.clip((frames.astype(np.float32) - 16.0) / 219.0, 0.0, 1.0)
+    margin = int(round(SAMPLE_W * TEXT_MARGIN))
+    luma = luma[:, :, margin:SAMPLE_W - margin]
+    # Local contrast: mean absolute difference to the right / lower neighbour.
+    dx = np.abs(np.diff(luma, axis=2))[:, :-1, :]
+    dy = np.abs(np.diff(luma, axis=1))[:, :, :-1]
+    detail = np.pad((dx + dy) / 2, ((0, 0), (0, 1), (0, 1)), mode='edge')
+
+    edges = np.linspace(0, SAMPLE_H, BANDS + 1).round().astype(int)
+    hist, busy = [], []
+    for top, bottom in zip(edges[:-1], edges[1:]):
+        band = luma[:, top:bottom, :]
+        counts, _ = np.histogram(band, bins=BINS, range=(0.0, 1.0))
+        hist.append(counts.tolist())
+        busy.append(round(float(detail[:, top:bottom, :].mean()), 4))
+    return {'version': STATS_VERSION, 'frames': int(frames.shape[0]),
+            'hist': hist, 'busy': busy}
+
+
+def _srgb_to_linear(v):
+    v = np.asarray(v, dtype=np.float64)
+    return np.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+
+
+def region_luminance(stats: dict, height_frac: float = 0.5) -> Dict[str, float]:
+    """Luminance of the centred band covering ``height_frac`` of the
+    frame: WCAG relative luminance at the 10th / 50th / 90th percentile,
+    the mean gamma-encoded brightness, and the mean local contrast."""
+    height_frac = min(1.0, max(1.0 / BANDS, height_frac))
+    first = int(np.floor((0.5 - height_frac / 2) * BANDS + 1e-9))
+    last = int(np.ceil((0.5 + height_frac / 2) * BANDS - 1e-9))
+    hist = np.asarray(stats['hist'][first:last], dtype=np.float64).sum(axis=0)
+    busy = float(np.mean(stats['busy'][first:last]))
+    centers = (np.arange(BINS) + 0.5) / BINS
+    total = hist.sum()
+    if total <= 0:
+        return {'p10': 0.2, 'p50': 0.2, 'p90': 0.2, 'brightness': 0.5, 'busy': busy}
+    cdf = np.cumsum(hist) / total
+
+    def pct(q):
+        return float(_srgb_to_linear(centers[min(int(np.searchsorted(cdf, q)), BINS - 1)]))
+
+    return {'p10': pct(0.10), 'p50': pct(0.50), 'p90': pct(0.90),
+            'brightness': float((hist * centers).sum() / total), 'busy': busy}
+
+
+def background_stats(bg_path: str) -> Optional[dict]:
+    """Cached :func:`measure_background_stats` (see the module docstring)."""
+    index = get_background_index()
+    stats = index.analysis(bg_path, ANALYSIS_NAME)
+    if stats is not None and stats.get('version') == STATS_VERSION:
+        return stats
+    try:
+        st = os.stat(bg_path)
+    except OSError:
+        return None
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _memo_lock:
+        stats = _memo.get((bg_path,) + stamp)
+    if stats is not None:
+        return stats
+
+    def measure():
+        stats = measure_background_stats(bg_path)
+        if stats is None:
+            return None
+        index.snapshot()  # make sure the library has been scanned
+        if not index.record_analysis(bg_path, ANALYSIS_NAME, stats, stamp):
+            with _memo_lock:
+                _memo[(bg_path,) + stamp] = stats
+        return stats
+
+    # Concurrent segments on one new background share one measurement.
+    return _flight.do(f"{bg_path}|{stamp[0]}|{stamp[1]}", measure)
 
 
 def analyze_background_brightness(bg_path: str, sample_seconds: int = 1) -> float:
     """
     Analyze background video brightness to determine optimal text color.
 
+    Cached per file; ``sample_seconds`` is accepted for compatibility.
+
     Returns:
-        Brightness value 0.0 (dark) to 1.0 (bright).
+        Mean brightness of the text region, 0.0 (dark) to 1.0 (bright).
     """
-    # Lazy import — FFMPEG_EXE/logging are defined in main.py and bringing
-    # them in at module top would create a circular import.
-    from main import FFMPEG_EXE, logging
+    stats = background_stats(bg_path)
+    # Default to medium brightness if analysis fails
+    return region_luminance(stats)['brightness'] if stats else 0.5
+
 
+def hex_luminance(hex_str: str) -> Optional[float]:
+    """WCAG relative luminance of ``#rrggbb``, or None if malformed."""
+    if not (hex_str and len(hex_str) == 7 and hex_str[0] == '#'):
+        return None
     try:
-        # Use FFmpeg to extract a frame and calculate average brightness
-        cmd = [
-            FFMPEG_EXE, '-i', bg_path,
-            '-ss', str(sample_seconds),
-            '-vframes', '1',
-            '-vf', 'format=gray,scale=1:1',
-            '-f', 'rawvideo', '-pix_fmt', 'gray',
-            'pipe:1',
-        ]
-
-        result = subprocess.run(cmd, capture_output=True, timeout=10)
-        if result.returncode == 0 and result.stdout:
-            # Get the pixel value (0-255)
-            pixel_value = result.stdout[0] if result.stdout else 128
-            brightness = pixel_value / 255.0
-            return brightness
-    except Exception as e:
-        logging.warning(f"Could not analyze background brightness: {e}")
+        rgb = [int(hex_str[i:i + 2], 16) / 255.0 for i in (1, 3, 5)]
+    except ValueError:
+        return None
+    r, g, b = _srgb_to_linear(rgb)
+    return float(0.2126 * r + 0.7152 * g + 0.0722 * b)
 
-    # Default to medium brightness if analysis fails
-    return 0.5
+
+def contrast_ratio(l1: float, l2: float) -> float:
+    """WCAG contrast ratio of two relative luminances (1.0 - 21.0)."""
+    hi, lo = max(l1, l2), min(l1, l2)
+    return (hi + 0.05) / (lo + 0.05)
+
+
+def _worst_case_ratio(text_lum: float, region: Dict[str, float]) -> float:
+    # Light text is read against the region's bright end, dark text
+    # against its dark end.
+    bg = region['p90'] if text_lum >= region['p50'] else region['p10']
+    return contrast_ratio(text_lum, bg)
 
 
 def get_contrasting_text_color(
     bg_path: str,
     template_color: str = 'white',
     auto_detect: bool = True,
+    text_height_frac: float = 0.5,
 ) -> Tuple[str, str]:
     """
-    Determine optimal text color based on background brightness.
+    Determine optimal text color based on the background behind the text.
 
-    The template_color is treated as a *hint* — it is kept whenever it has
-    enough contrast against the background.  When the background's
-    brightness disagrees with the template (e.g. the ramadan template's
-    gold on a bright frame, or a white template on a dark frame), the
-    result is overridden to a default that maximises readability.
+    The template_color is treated as a *hint* — it is kept whenever its
+    WCAG contrast ratio against the text region clears ``MIN_CONTRAST``
+    (``MIN_CONTRAST_BUSY`` over a busy region).  Otherwise the result is
+    white or near-black, whichever contrasts more.
 
     Args:
         bg_path: Path to background video.
         template_color: Default color from template (name or hex).
         auto_detect: If True, analyze background; if False, use template color.
+        text_height_frac: Height of the (centred) text card as a fraction
+            of the frame height.
 
     Returns:
         Tuple ``(text_color, stroke_color)`` of PIL color strings.
@@ -90,40 +265,23 @@ def get_contrasting_text_color(
     if template_hex is None:
         candidate = template_color if template_color else '#ffffff'
         template_hex = candidate.lower() if candidate.startswith('#') else '#ffffff'
+    template_lum = hex_luminance(template_hex)
 
-    def _hex_luminance(hex_str):
-        if not (hex_str and len(hex_str) == 7 and hex_str[0] == '#'):
-            return 128.0
-        try:
-            r = int(hex_str[1:3], 16)
-            g = int(hex_str[3:5], 16)
-            b = int(hex_str[5:7], 16)
-        except ValueError:
-            return 128.0
-        return 0.299 * r + 0.587 * g + 0.114 * b
-
-    template_lum = _hex_luminance(template_hex)
-
-    # Analyze background brightness
-    brightness = analyze_background_brightness(bg_path)
-
-    # Choose colors based on brightness, preserving the template hint when
-    # it already has enough contrast.
-    if brightness > 0.6:
-        # Bright background — prefer dark text.  Keep the template only if
-        # it is itself dark; otherwise fall back to a dark default.
-        if template_lum < 128:
-            return (template_hex, 'white')
-        return ('#1a1a1a', '#ffffff')
-    elif brightness < 0.4:
-        # Dark background — prefer light text.  Keep the template only if
-        # it is itself light; otherwise fall back to a white default.
-        if template_lum > 128:
-            return (template_hex, '#000000')
-        return ('#ffffff', '#000000')
-    else:
-        # Medium brightness — the template hint dominates.  Gold stays
-        # gold, white stays white, anything else is best-effort.
+    stats = background_stats(bg_path)
+    if stats is None:
+        # Unknown background — the template hint dominates.  Gold stays
+        # gold, anything else is white.
         if t_lower == 'gold':
             return ('#ffd700', '#000000')
-        return ('#ffffff', '#000000')
+        return LIGHT_TEXT
+
+    region = region_luminance(stats, text_height_frac)
+    required = MIN_CONTRAST_BUSY if region['busy'] > BUSY_THRESHOLD else MIN_CONTRAST
+
+    if template_lum is not None and _worst_case_ratio(template_lum, region) >= required:
+        # Stroke on the far side of the text's luminance.
+        return (template_hex, '#000000' if template_lum >= 0.18 else '#ffffff')
+
+    light = _worst_case_ratio(hex_luminance(LIGHT_TEXT[0]), region)
+    dark = _worst_case_ratio(hex_luminance(DARK_TEXT[0]), region)
+    return LIGHT_TEXT if light >= dark else DARK_TEXT
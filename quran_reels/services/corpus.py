@@ -0,0 +1,218 @@
+"""Bundled offline Uthmani text corpus.
+
+``get_ayah_text`` used to make a live call to api.alquran.cloud for
+every ayah not already in the process-local text cache, so every cold
+start and every new surah depended on the network.  The Qur'an text is
+fixed; this module ships it as one compact file that is memory-mapped
+and read in place.
+
+File layout (all integers little-endian)::
+
+    header   magic b'QRTX' | uint16 version | uint16 reserved | uint32 N
+    offsets  uint32[N + 1]   byte offset of ayah g in the blob, g = 0..N-1
+    blob     UTF-8 text of every ayah, in mushaf order
+
+``N`` is the total number of ayat (6236) and ayat are addressed by
+their *global* number: the position of ``surah:ayah`` in mushaf order,
+derived from ``VERSE_COUNTS``.  A lookup is two ``uint32`` reads and the
+UTF-8 decode of one slice; decoded strings are memoised, so repeat
+reads are a list index.  Nothing is read from disk until first used —
+the OS pages the mapped file in on demand.
+
+The text stored is the cleaned ``quran-uthmani`` edition exactly as
+``get_ayah_text`` returned it from the API.  Build (or refresh) the
+file with::
+
+    python -m quran_reels.services.corpus [output-path]
+
+which fetches the whole edition in a single request.
+"""
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from quran_reels.config import VERSE_COUNTS
+from quran_reels.utils.fileio import AtomicWriter
+
+
+MAGIC = b'QRTX'
+VERSION = 1
+CORPUS_FILENAME = 'quran-uthmani.qtx'
+CORPUS_SOURCE_URL = 'https://api.alquran.cloud/v1/quran/quran-uthmani'
+
+_HEADER = struct.Struct('<4sHHI')
+_SPAN = struct.Struct('<II')
+
+# Global number (0-based) of the first ayah of each surah.
+_SURAH_BASE: Dict[int, int] = {}
+_total = 0
+for _s in sorted(VERSE_COUNTS):
+    _SURAH_BASE[_s] = _total
+    _total += VERSE_COUNTS[_s]
+TOTAL_AYAT = _total
+del _s, _total
+
+
+def global_ayah_index(surah: int, ayah: int) -> int:
+    """0-based position of ``surah:ayah`` in mushaf order."""
+    base = _SURAH_BASE.get(surah)
+    if base is None or not 1 <= ayah <= VERSE_COUNTS[surah]:
+        raise ValueError(f"No such ayah: {surah}:{ayah}")
+    return base + ayah - 1
+
+
+class CorpusError(Exception):
+    """The corpus file is missing, truncated or of another format."""
+
+
+class QuranCorpus:
+    """Read-only, memory-mapped view of a corpus file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:  # empty file
+                raise CorpusError(f"{path}: {e}") from e
+        try:
+            if len(self._mm) < _HEADER.size:
+                raise CorpusError(f"{path}: truncated header")
+            magic, version, _reserved, count = _HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise CorpusError(f"{path}: not a v{VERSION} corpus file")
+            if count != TOTAL_AYAT:
+                raise CorpusError(f"{path}: {count} ayat, expected {TOTAL_AYAT}")
+            self._offsets_at = _HEADER.size
+            self._blob_at = self._offsets_at + 4 * (count + 1)
+            if len(self._mm) < self._blob_at:
+                raise CorpusError(f"{path}: truncated offset table")
+            end, =struct.unpack_from('<I', self._mm, self._blob_at - 4)
+            if self._blob_at + end != len(self._mm):
+                raise CorpusError(f"{path}: blob size does not match the index")
+        except BaseException:
+            self._mm.close()
+            raise
+        self._decoded: List[Optional[str]] = [None] * count
+
+    def text(self, surah: int, ayah: int) -> Optional[str]:
+        """Text of ``surah:ayah``, or ``None`` if the ayah is not in the
+        corpus (an empty entry)."""
+        g = global_ayah_index(surah, ayah)
+        text = self._decoded[g]
+        if text is None:
+            start, end = _SPAN.unpack_from(self._mm, self._offsets_at + 4 * g)
+            if start == end:
+                return None
+            text = self._decoded[g] = self._mm[self._blob_at + start:self._blob_at + end].decode('utf-8')
+        return text
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+def write_corpus(path: str, texts: Dict[Tuple[int, int], str]) -> int:
+    """Write ``{(surah, ayah): text}`` as a corpus file at ``path``
+    (atomically).  Missing ayat are stored as empty entries.  Returns
+    the number of ayat written."""
+    offsets = [0]
+    chunks = []
+    pos = 0
+    written = 0
+    for surah in sorted(VERSE_COUNTS):
+        for ayah in range(1, VERSE_COUNTS[surah] + 1):
+            text = texts.get((surah, ayah))
+            data = text.encode('utf-8') if text else b''
+            written += bool(data)
+            chunks.append(data)
+            pos += len(data)
+            offsets.append(pos)
+    with AtomicWriter(path) as w:
+        w.write(_HEADER.pack(MAGIC, VERSION, 0, TOTAL_AYAT))
+        w.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        for data in chunks:
+            w.write(data)
+    return written
+
+
+def fetch_corpus_texts(timeout: float = 120) -> Dict[Tuple[int, int], str]:
+    """Download the whole ``quran-uthmani`` edition in one request."""
+    import requests
+
+    from quran_reels.services.fetch import clean_ayah_text
+
+    resp = requests.get(CORPUS_SOURCE_URL, timeout=timeout)
+    resp.raise_for_status()
+    texts = {}
+    for surah in resp.json()['data']['surahs']:
+        for ayah in surah['ayahs']:
+            texts[(int(surah['number']), int(ayah['numberInSurah']))] = clean_ayah_text(ayah['text'])
+    return texts
+
+
+def build_corpus(path: str) -> int:
+    """Fetch the edition and write it to ``path``.  Returns the number
+    of ayat written; raises if any ayah is missing from the response."""
+    texts = fetch_corpus_texts()
+    missing = TOTAL_AYAT - sum(
+        1 for s in VERSE_COUNTS for a in range(1, VERSE_COUNTS[s] + 1) if texts.get((s, a)))
+    if missing:
+        raise CorpusError(f"Source response is missing {missing} ayat")
+    return write_corpus(path, texts)
+
+
+_corpus: Optional[QuranCorpus] = None
+# (size, mtime_ns) of the file _corpus was loaded from; None if missing.
+_corpus_stamp: Optional[Tuple[int, int]] = None
+_corpus_checked = False
+_corpus_lock = threading.Lock()
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def get_corpus() -> Optional[QuranCorpus]:
+    """The process-wide corpus at ``CORPUS_PATH``, or ``None`` if there
+    is no usable file (text then comes from the network).
+
+    The file is re-checked on every call (one ``stat``): a corpus built
+    or replaced while the server runs is picked up without a restart.
+    """
+    global _corpus, _corpus_stamp, _corpus_checked
+    # Lazy import — CORPUS_PATH is configured in main.py.
+    from main import CORPUS_PATH
+    stamp = _file_stamp(CORPUS_PATH)
+    if _corpus_checked and stamp == _corpus_stamp:
+        return _corpus
+    with _corpus_lock:
+        if not _corpus_checked or stamp != _corpus_stamp:
+            # Readers still holding the previous corpus keep its mapping;
+            # it is unmapped once they drop it.
+            _corpus = None
+            try:
+                _corpus = QuranCorpus(CORPUS_PATH)
+                logging.info(f"Text corpus: {CORPUS_PATH}")
+            except FileNotFoundError:
+                logging.info(f"No text corpus at {CORPUS_PATH}; ayah text will be fetched online")
+            except (OSError, CorpusError) as e:
+                logging.warning(f"Ignoring text corpus: {e}")
+            _corpus_stamp = stamp
+            _corpus_checked = True
+    return _corpus
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    out = sys.argv[1] if len(sys.argv) > 1 else os.path.join('data', CORPUS_FILENAME)
+    n = build_corpus(out)
+    print(f"Wrote {n} ayat to {out} ({os.path.getsize(out)} bytes)")
@@ -0,0 +1,456 @@
+"""Asynchronous audio / text fetch engine with per-host limits.
+
+``download_audio_parallel`` used to rate-limit by holding a lock and
+calling ``time.sleep(min_delay)`` — every worker thread spent most of
+its life asleep — and ``download_audio`` walked its mirror list
+sequentially with blocking back-off sleeps in between.  On a cold cache
+a 50-ayah build therefore paid ~50 round-trips of latency.
+
+This module replaces that with a single asyncio engine:
+
+  * One long-lived event loop runs in a daemon thread.  Every build (and
+    any other caller) submits work to the *same* loop, so the per-host
+    limits below are shared across concurrent jobs instead of being
+    re-created per call.
+  * Each host gets a :class:`_HostLimiter` — an ``asyncio.Semaphore``
+    bounding in-flight requests plus a :class:`TokenBucket` bounding the
+    request rate.  Waiting on either is an ``await``, never a sleep that
+    pins a thread.
+  * Mirror fallback and retries are async: a failed mirror moves on to
+    the next host immediately, and the exponential back-off between
+    rounds is an ``asyncio.sleep``.
+  * :meth:`FetchEngine.fetch_build` fans out every ayah's audio and text
+    of a build at once and feeds :class:`FetchResult` items into a
+    thread-safe ``queue.Queue`` as they complete, terminated by ``None``.
+
+The HTTP calls themselves still go through ``requests`` (already a
+dependency) on the engine's own thread pool; asyncio only orchestrates
+them.  That keeps the dependency list unchanged while giving the
+one-round-trip latency profile of a native async client.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from quran_reels.utils.breaker import get_download_breaker
+from quran_reels.utils.fileio import AtomicWriter
+from quran_reels.utils.singleflight import SingleFlight
+
+
+# Per-host limits: (max concurrent requests, sustained requests/second,
+# burst size).  everyayah.com and quranicaudio.com are static-file CDNs
+# that tolerate a good number of parallel connections, and the bursts
+# are sized so a typical build goes out in one wave; the alquran.cloud
+# text API is rate-limited more aggressively on their side.
+HOST_LIMITS: Dict[str, Tuple[int, float, int]] = {
+    'everyayah.com':             (16, 25.0, 32),
+    'www.everyayah.com':         (16, 25.0, 32),
+    'download.quranicaudio.com': (8, 15.0, 16),
+    'mp3.quranicaudio.com':      (8, 15.0, 16),
+    'api.alquran.cloud':         (8, 10.0, 20),
+}
+DEFAULT_HOST_LIMIT: Tuple[int, float, int] = (2, 2.0, 2)
+
+# Request priorities: lower values are served first when a host is at
+# its concurrency limit.  Prefetch traffic yields to user builds.
+PRIORITY_FOREGROUND = 0
+PRIORITY_PREFETCH = 10
+
+# Full passes over the mirror list before an ayah is reported as failed.
+MAX_ROUNDS = 3
+
+# Files smaller than this are treated as error pages / truncated bodies.
+MIN_AUDIO_BYTES = 1000
+
+SURAH_TEXT_API_URL = 'https://api.alquran.cloud/v1/surah/{surah}/quran-uthmani'
+
+
+def audio_source_urls(reciter_id: str, fn: str) -> List[str]:
+    """Mirror URLs for one ayah mp3, in preference order."""
+    return [
+        f'https://everyayah.com/data/{reciter_id}/{fn}',
+        f'https://download.quranicaudio.com/quran/{reciter_id}/{fn}',
+        f'https://www.everyayah.com/data/{reciter_id}/{fn}',
+        f'https://mp3.quranicaudio.com/quran/{reciter_id}/{fn}',
+    ]
+
+
+def clean_ayah_text(raw: str) -> str:
+    """Strip the BOM / zero-width characters the text API sometimes emits."""
+    return raw.replace('\ufeff', '').replace('\u200b', '').strip()
+
+
+@dataclass
+class FetchResult:
+    """One completed fetch, as delivered on the results queue."""
+
+    kind:   str                   # 'audio' | 'text'
+    surah:  int
+    ayah:   int
+    path:   Optional[str] = None  # audio: cache path of the mp3
+    texts:  Optional[Dict[int, str]] = None  # text: ayah -> cleaned Uthmani text
+    cached: bool          = False # True if served without a network call
+    error:  Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens/second, at most ``capacity``."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+class PrioritySemaphore:
+    """asyncio semaphore that wakes waiters lowest ``priority`` first."""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: list = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+
+    async def acquire(self, priority: int = PRIORITY_FOREGROUND) -> None:
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # Granted just as we were cancelled: hand the slot on.
+            # Otherwise the cancelled future is skipped by release().
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._value += 1
+
+
+class _HostLimiter:
+    """Concurrency + rate limit for one host."""
+
+    def __init__(self, concurrency: int, rate: float, burst: int):
+        self.semaphore = PrioritySemaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+
+    async def acquire(self, priority: int = PRIORITY_FOREGROUND) -> None:
+        await self.semaphore.acquire(priority)
+        try:
+            await self.bucket.acquire()
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    def release(self) -> None:
+        self.semaphore.release()
+
+
+class FetchEngine:
+    """Shared asyncio fetch engine.  Use :func:`get_fetch_engine`."""
+
+    def __init__(self, host_limits: Optional[Dict[str, Tuple[int, float, int]]] = None,
+                 max_rounds: int = MAX_ROUNDS):
+        self.host_limits = dict(HOST_LIMITS if host_limits is None else host_limits)
+        self.max_rounds = max_rounds
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._limiters: Dict[str, _HostLimiter] = {}
+        # Blocking HTTP calls run here.  Sized to the sum of the host
+        # concurrencies so the pool itself is never the bottleneck.
+        pool_size = max(4, sum(c for c, _, _ in self.host_limits.values()))
+        self._io_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix='quran-fetch')
+        self._sessions = threading.local()
+
+    # ---- loop lifecycle ----
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def _run():
+                    asyncio.set_event_loop(loop)
+                    ready.set()
+                    loop.run_forever()
+
+                self._thread = threading.Thread(
+                    target=_run, name='quran-fetch-loop', daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule ``coro`` on the engine loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def _limiter(self, url: str) -> _HostLimiter:
+        # Only ever called on the engine loop, so no lock is needed.
+        host = urlsplit(url).hostname or ''
+        lim = self._limiters.get(host)
+        if lim is None:
+            lim = _HostLimiter(*self.host_limits.get(host, DEFAULT_HOST_LIMIT))
+            self._limiters[host] = lim
+        return lim
+
+    # ---- blocking HTTP (runs on the io pool) ----
+
+    def _session(self):
+        sess = getattr(self._sessions, 'session', None)
+        if sess is None:
+            import requests
+            sess = requests.Session()
+            self._sessions.session = sess
+        return sess
+
+    def _http_get(self, url: str, timeout: float) -> bytes:
+        r = self._session().get(url, timeout=timeout)
+        r.raise_for_status()
+        return r.content
+
+    def _http_download(self, url: str, timeout: float, dest: str) -> Tuple[int, str]:
+        """Stream ``url`` into ``dest`` atomically; returns ``(size, digest)``.
+
+        The body is never held in memory.  A short or truncated body
+        (fewer than ``MIN_AUDIO_BYTES`` or than the ``Content-Length``)
+        is discarded without touching ``dest``.
+        """
+        with self._session().get(url, timeout=timeout, stream=True) as r:
+            r.raise_for_status()
+            expected = r.headers.get('Content-Length')
+            with AtomicWriter(dest) as w:
+                for chunk in r.iter_content(64 * 1024):
+                    w.write(chunk)
+                if w.size < MIN_AUDIO_BYTES:
+                    w.abort()
+                    raise ValueError(f"Audio file too small: {w.size} bytes")
+                if expected and expected.isdigit() and int(expected) != w.size:
+                    w.abort()
+                    raise ValueError(f"Truncated body: {w.size} of {expected} bytes")
+            return w.size, w.digest
+
+    async def _run_io(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._io_pool, fn, *args)
+
+    async def _get(self, url: str, timeout: float = 30,
+                   priority: int = PRIORITY_FOREGROUND) -> bytes:
+        limiter = self._limiter(url)
+        await limiter.acquire(priority)
+        try:
+            return await self._run_io(self._http_get, url, timeout)
+        finally:
+            limiter.release()
+
+    async def _download(self, url: str, dest: str, timeout: float = 30,
+                        priority: int = PRIORITY_FOREGROUND) -> Tuple[int, str]:
+        limiter = self._limiter(url)
+        await limiter.acquire(priority)
+        try:
+            return await self._run_io(self._http_download, url, timeout, dest)
+        finally:
+            limiter.release()
+
+    # ---- per-item coroutines ----
+
+    async def fetch_audio(self, reciter_id: str, surah: int, ayah: int,
+                          priority: int = PRIORITY_FOREGROUND) -> FetchResult:
+        """Fill the audio cache for one ayah, trying every mirror."""
+        # Lazy import — the cache layout lives in main.py.
+        from main import get_cached_audio_path
+
+        cached_path = get_cached_audio_path(reciter_id, surah, ayah)
+
+        def cached():
+            if os.path.exists(cached_path) and os.path.getsize(cached_path) > MIN_AUDIO_BYTES:
+                return FetchResult('audio', surah, ayah, path=cached_path, cached=True)
+            return None
+
+        # Hit-rate stats and LRU recency reflect user builds only; a
+        # speculative prefetch must neither count nor refresh an entry.
+        foreground = priority <= PRIORITY_FOREGROUND
+        hit = cached()
+        if hit is not None:
+            if foreground:
+                await self._run_io(_index_call, 'record_hit', reciter_id, surah, ayah)
+            return hit
+        if foreground:
+            await self._run_io(_index_call, 'record_miss')
+
+        # Concurrent misses for one ayah (two builds, a build and the
+        # prefetcher, or two server processes) download it once.
+        return await _audio_flight().do_async(
+            cached_path,
+            lambda: self._download_audio(reciter_id, surah, ayah, cached_path, priority),
+            check=cached,
+        )
+
+    async def _download_audio(self, reciter_id: str, surah: int, ayah: int,
+                              cached_path: str, priority: int) -> FetchResult:
+        breaker = get_download_breaker()
+        fn = f'{surah:03d}{ayah:03d}.mp3'
+        last_error = None
+        for rnd in range(self.max_rounds):
+            if rnd:
+                # Back off between full passes only; moving to a different
+                # mirror after a failure needs no delay.
+                await asyncio.sleep(min(2 ** rnd, 10) * (0.5 + random.random() / 2))
+            for url in audio_source_urls(reciter_id, fn):
+                if breaker.is_open():
+                    return FetchResult('audio', surah, ayah,
+                                       error='Circuit breaker is open')
+                try:
+                    size, digest = await self._download(url, cached_path, priority=priority)
+                    # Measure once, at fill time, so later duration
+                    # lookups are an index read; also enforces the cache
+                    # limits incrementally.  The index row doubles as the
+                    # entry's manifest (size, mtime, hash).
+                    await self._run_io(_index_call, 'record_fill',
+                                       reciter_id, surah, ayah, cached_path, True, digest)
+                    breaker.record_success()
+                    logging.debug(f"Audio fetched: {fn} from {url} ({size} bytes)")
+                    return FetchResult('audio', surah, ayah, path=cached_path)
+                except Exception as e:
+                    last_error = e
+                    logging.debug(f"Fetch failed for {url}: {e}")
+        # Only an ayah that no mirror could serve counts against the breaker.
+        if breaker.record_failure():
+            logging.error("Circuit breaker opened due to consecutive failures")
+        return FetchResult('audio', surah, ayah,
+                           error=f"Failed to download audio for {surah}:{ayah}: {last_error}")
+
+    async def fetch_surah_text(self, surah: int,
+                               priority: int = PRIORITY_FOREGROUND) -> FetchResult:
+        """Fetch the Uthmani text of every ayah of ``surah`` in one request.
+
+        The result has ``ayah=0`` and the texts in ``texts``
+        (``{ayah: text}``).
+        """
+        import json
+
+        url = SURAH_TEXT_API_URL.format(surah=surah)
+        last_error = None
+        for rnd in range(self.max_rounds):
+            if rnd:
+                await asyncio.sleep(min(2 ** rnd, 10) * (0.5 + random.random() / 2))
+            try:
+                payload = json.loads(await self._get(url, timeout=15, priority=priority))
+                texts = {int(a['numberInSurah']): clean_ayah_text(a['text'])
+                         for a in payload['data']['ayahs']}
+                # Per-ayah length checks would reject real ayat such as 20:1.
+                empty = [a for a, t in texts.items() if not t]
+                if not texts or empty:
+                    raise ValueError(f"Empty ayah text in surah {surah}: {empty[:5]}")
+                return FetchResult('text', surah, 0, texts=texts)
+            except Exception as e:
+                last_error = e
+        return FetchResult('text', surah, 0,
+                           error=f"Failed to fetch text for surah {surah}: {last_error}")
+
+    async def _fan_out(self, coros, results: 'queue.Queue') -> List[FetchResult]:
+        out = []
+        for fut in asyncio.as_completed(list(coros)):
+            res = await fut
+            results.put(res)
+            out.append(res)
+        results.put(None)
+        return out
+
+    # ---- public, thread-facing API ----
+
+    def fetch_build(
+        self,
+        reciter_id: str,
+        surah: int,
+        ayahs: Iterable[int],
+        with_text: bool = True,
+    ) -> Tuple['queue.Queue', concurrent.futures.Future]:
+        """Fetch every ayah of a build concurrently.
+
+        Returns ``(results, done)``: ``results`` receives one
+        :class:`FetchResult` per audio item, plus one for the whole
+        surah's text when ``with_text``, as they complete, and a final
+        ``None``; ``done`` resolves to the full result list.
+        """
+        results: 'queue.Queue' = queue.Queue()
+        coros = [self.fetch_audio(reciter_id, surah, ayah) for ayah in ayahs]
+        if with_text:
+            coros.append(self.fetch_surah_text(surah))
+        done = self.submit(self._fan_out(coros, results))
+        return results, done
+
+
+_audio_flight_group: Optional[SingleFlight] = None
+
+
+def _audio_flight() -> SingleFlight:
+    """Single-flight group for audio cache fills (lock files live in the
+    audio cache dir so every process sharing the cache shares them)."""
+    global _audio_flight_group
+    if _audio_flight_group is None:
+        from main import AUDIO_CACHE_DIR
+        _audio_flight_group = SingleFlight(
+            'audio', lock_dir=os.path.join(AUDIO_CACHE_DIR, '.locks'))
+    return _audio_flight_group
+
+
+def _index_call(method: str, *args) -> None:
+    """Call ``AudioIndex.<method>(*args)``; index errors never fail a fetch."""
+    from quran_reels.services.audio_index import get_audio_index
+    try:
+        getattr(get_audio_index(), method)(*args)
+    except Exception as e:
+        logging.warning(f"Audio index {method} failed: {e}")
+
+
+_engine: Optional[FetchEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_fetch_engine() -> FetchEngine:
+    """Return the process-wide :class:`FetchEngine`, creating it lazily."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = FetchEngine()
+        return _engine
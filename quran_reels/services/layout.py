@@ -0,0 +1,172 @@
+"""Text layout index: the geometry of an ayah's text card, computed once.
+
+Every render used to recount ``len(arabic_text.split())``, re-derive the
+font size and words-per-line from it, re-wrap the text and re-size the
+canvas, and ``process_single_ayah_ffmpeg`` then reopened the finished
+PNG with PIL just to learn the ``text_size`` the zoom animations need.
+All of that is a pure function of the text, the template's size
+multiplier and the font actually used, so it is computed analytically
+here — the same arithmetic the renderers use — and kept in a
+:class:`LayoutIndex` next to the ayah text (``text.sqlite3``).
+
+Because the card's size is known before a pixel is drawn, the segment's
+filter graph can be built, and its backgrounds prepared, while the text
+is still rendering.
+
+``LAYOUT_VERSION`` is part of every key; bump it whenever the sizing
+rules below or the renderers' canvas arithmetic change, and stale rows
+are simply never read again.
+"""
+from __future__ import annotations
+
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+LAYOUT_VERSION = 1
+
+# Canvas arithmetic shared with the renderers in main.py.
+LINE_HEIGHT_FACTOR = 1.6
+CANVAS_PADDING = 50
+MIN_CANVAS_HEIGHT = 300
+EMPTY_CANVAS_HEIGHT = 100
+
+MEMO_ITEMS = 4096
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS text_layout (
+        key         TEXT    PRIMARY KEY,
+        word_count  INTEGER NOT NULL,
+        fontsize    INTEGER NOT NULL,
+        per_line    INTEGER NOT NULL,
+        lines       INTEGER NOT NULL,
+        width       INTEGER NOT NULL,
+        height      INTEGER NOT NULL
+    )
+"""
+
+
+@dataclass(frozen=True)
+class TextLayout:
+    """Geometry of one rendered text card."""
+
+    word_count: int
+    fontsize:   int   # requested size, before per-font tuning
+    per_line:   int   # words per line
+    lines:      int
+    width:      int   # final PNG size in pixels
+    height:     int
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return (self.width, self.height)
+
+
+def fontsize_for_wordcount(word_count: int, size_mult: float) -> Tuple[int, int]:
+    """``(fontsize, words_per_line)`` for an ayah of ``word_count`` words."""
+    if word_count > 60:
+        return int(50 * size_mult), 7
+    if word_count > 40:
+        return int(60 * size_mult), 6
+    if word_count > 25:
+        return int(70 * size_mult), 5
+    if word_count > 15:
+        return int(80 * size_mult), 4
+    return int(95 * size_mult), 3
+
+
+def compute_layout(text: str, size_mult: float, target_width: int,
+                   tuning_mult: float = 1.0) -> TextLayout:
+    """Layout of ``text`` as ``render_text_to_png`` will draw it.
+
+    ``tuning_mult`` is the rendering font's ``size_mult`` tuning (applied
+    by the shaping renderer on top of ``fontsize``; 1.0 on the legacy
+    path).
+    """
+    cleaned = text.replace('\ufeff', '').replace('\u200b', '').strip() if text else ''
+    word_count = len(cleaned.split())
+    fontsize, per_line = fontsize_for_wordcount(word_count, size_mult)
+    if word_count == 0:
+        return TextLayout(0, fontsize, per_line, 0, target_width, EMPTY_CANVAS_HEIGHT)
+    lines = math.ceil(word_count / per_line)
+    eff_fontsize = max(8, int(round(fontsize * tuning_mult))) if tuning_mult != 1.0 else fontsize
+    line_height = int(eff_fontsize * LINE_HEIGHT_FACTOR)
+    height = max(MIN_CANVAS_HEIGHT, lines * line_height + 2 * CANVAS_PADDING)
+    width = target_width + 2 * CANVAS_PADDING
+    return TextLayout(word_count, fontsize, per_line, lines, width, height)
+
+
+def layout_key(ref: str, template: str, font_name: Optional[str],
+               quality: str, target_width: int) -> str:
+    """Index key; ``ref`` names the text (``"surah:ayah"``, ``"bismillah"``)."""
+    return f"v{LAYOUT_VERSION}|{ref}|{template}|{font_name or '-'}|{quality}|{target_width}"
+
+
+class LayoutIndex:
+    """Persistent ``key -> TextLayout`` map with an in-memory front."""
+
+    def __init__(self, db_path: str, memo_items: int = MEMO_ITEMS):
+        self.db_path = db_path
+        self.memo_items = memo_items
+        self._lock = threading.Lock()
+        self._memo: 'OrderedDict[str, TextLayout]' = OrderedDict()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        try:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.DatabaseError:
+            pass
+        self._conn.execute(_SCHEMA)
+
+    def get(self, key: str) -> Optional[TextLayout]:
+        with self._lock:
+            layout = self._memo.get(key)
+            if layout is not None:
+                self._memo.move_to_end(key)
+                return layout
+            row = self._conn.execute(
+                'SELECT word_count, fontsize, per_line, lines, width, height '
+                'FROM text_layout WHERE key=?', (key,)).fetchone()
+            if row is None:
+                return None
+            layout = TextLayout(*row)
+            self._remember(key, layout)
+            return layout
+
+    def put(self, key: str, layout: TextLayout) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO text_layout '
+                '(key, word_count, fontsize, per_line, lines, width, height) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, layout.word_count, layout.fontsize, layout.per_line,
+                 layout.lines, layout.width, layout.height))
+            self._remember(key, layout)
+
+    def _remember(self, key: str, layout: TextLayout) -> None:
+        # Caller holds self._lock.
+        self._memo[key] = layout
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.memo_items:
+            self._memo.popitem(last=False)
+
+
+_index: Optional[LayoutIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_layout_index() -> LayoutIndex:
+    """Return the process-wide :class:`LayoutIndex` (stored in the text
+    store's database file)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            # Lazy import — the cache location is configured in main.py.
+            from main import TEXT_CACHE_PATH
+            _index = LayoutIndex(TEXT_CACHE_PATH)
+        return _index
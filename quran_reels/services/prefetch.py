@@ -0,0 +1,174 @@
+"""Predictive, low-priority prefetch of the next ayat of a surah.
+
+Traffic is highly sequential: a user who builds ayat 1-10 of a surah
+usually comes back for 11-20 with the same reciter.  When a build for
+``(reciter, surah, start..last)`` starts, :meth:`Prefetcher.schedule`
+queues the *following* ayat (as many as the build covers) for download
+into the audio cache, and the surah's text into the text store, so the
+next request in the session starts warm.  Each prefetched file also gets
+its loudness measured into the audio index, in a low-priority worker
+process (:func:`quran_reels.utils.priority.low_priority_pool`) so the
+ffmpeg ``ebur128`` pass yields the CPU to user builds.
+
+Prefetching rides on the shared fetch engine
+(:mod:`quran_reels.services.fetch`), so it:
+
+  * counts against the same per-host concurrency and rate limits as
+    user builds, at ``PRIORITY_PREFETCH`` — a host slot is always given
+    to a waiting foreground request first;
+  * honours the same circuit breaker (``fetch_audio`` checks it before
+    every mirror attempt);
+  * uses at most ``concurrency`` requests of its own at a time.
+
+It stops as soon as the audio cache reaches ``BUDGET_FRACTION`` of
+either cache limit, so speculative fills never evict entries a user
+actually asked for.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import List, Optional, Set, Tuple
+
+from quran_reels.config import VERSE_COUNTS
+from quran_reels.services.audio_index import get_audio_index, measure_loudness
+from quran_reels.services.corpus import get_corpus
+from quran_reels.services.text_store import get_text_store
+from quran_reels.services.fetch import (
+    PRIORITY_PREFETCH,
+    FetchEngine,
+    get_fetch_engine,
+)
+from quran_reels.utils.priority import low_priority_pool
+
+
+# Fraction of AUDIO_CACHE_MAX_SIZE_MB / AUDIO_CACHE_MAX_FILES that
+# prefetching may fill; beyond it only user builds add entries.
+BUDGET_FRACTION = 0.9
+
+# Cap on ayat queued per schedule() call (a build covers at most 50).
+MAX_LOOKAHEAD = 50
+
+
+def _budget_exhausted() -> bool:
+    index = get_audio_index()
+    st = index.stats()
+    if index.max_files and st['files'] >= index.max_files * BUDGET_FRACTION:
+        return True
+    if index.max_bytes and st['size_mb'] * 1024 * 1024 >= index.max_bytes * BUDGET_FRACTION:
+        return True
+    return False
+
+
+class Prefetcher:
+    """Queues low-priority downloads of the ayat following a build."""
+
+    def __init__(self, engine: Optional[FetchEngine] = None, concurrency: int = 2):
+        self._engine = engine
+        self.concurrency = concurrency
+        self._pending: Set[Tuple[str, int, int]] = set()
+        self._lock = threading.Lock()
+        self._slots: Optional[asyncio.Semaphore] = None  # created on the engine loop
+        self._measure_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self.fetched = 0
+        self.stopped_on_budget = 0
+
+    @property
+    def engine(self) -> FetchEngine:
+        return self._engine or get_fetch_engine()
+
+    def _measure(self, path: str, ffmpeg_exe: Optional[str]) -> Tuple[float, float]:
+        with self._lock:
+            if self._measure_pool is None:
+                self._measure_pool = low_priority_pool(1)
+            pool = self._measure_pool
+        return pool.submit(measure_loudness, path, ffmpeg_exe).result()
+
+    def _warm_loudness(self, reciter_id: str, surah: int, ayah: int) -> None:
+        """Measure a prefetched file into the audio index, off-priority."""
+        # Lazy import — the loudness settings and cache paths live in main.py.
+        from main import FFMPEG_EXE, LOUDNESS_NORMALIZE, get_cached_audio_path
+
+        if not LOUDNESS_NORMALIZE:
+            return
+        path = get_cached_audio_path(reciter_id, surah, ayah)
+        try:
+            get_audio_index().loudness(reciter_id, surah, ayah, path,
+                                       measure=lambda p: self._measure(p, FFMPEG_EXE))
+        except Exception as e:
+            logging.debug(f"Prefetch loudness {surah}:{ayah} failed: {e}")
+
+    def schedule(self, reciter_id: str, surah: int, last_ayah: int, count: int) -> int:
+        """Queue the ``count`` ayat after ``last_ayah``.  Returns how many
+        were newly queued (ayat already pending are skipped)."""
+        end = min(VERSE_COUNTS.get(surah, 0), last_ayah + min(max(1, count), MAX_LOOKAHEAD))
+        ayahs: List[int] = []
+        with self._lock:
+            for ayah in range(last_ayah + 1, end + 1):
+                key = (str(reciter_id), surah, ayah)
+                if key not in self._pending:
+                    self._pending.add(key)
+                    ayahs.append(ayah)
+        if ayahs:
+            self.engine.submit(self._run(reciter_id, surah, ayahs))
+            logging.info(f"Prefetch queued: {reciter_id} {surah}:{ayahs[0]}-{ayahs[-1]}")
+        return len(ayahs)
+
+    async def _run(self, reciter_id: str, surah: int, ayahs: List[int]) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        stop = asyncio.Event()
+        try:
+            if get_corpus() is None:
+                await self._surah_text(surah)
+            await asyncio.gather(*(self._one(reciter_id, surah, a, stop) for a in ayahs))
+        finally:
+            with self._lock:
+                for a in ayahs:
+                    self._pending.discard((str(reciter_id), surah, a))
+
+    async def _surah_text(self, surah: int) -> None:
+        loop = asyncio.get_running_loop()
+        store = await loop.run_in_executor(None, get_text_store)
+        if await loop.run_in_executor(None, store.has_surah, surah):
+            return
+        res = await self.engine.fetch_surah_text(surah, priority=PRIORITY_PREFETCH)
+        if res.ok:
+            await loop.run_in_executor(None, store.put_surah, surah, res.texts)
+        else:
+            logging.debug(f"Prefetch text of surah {surah} failed: {res.error}")
+
+    async def _one(self, reciter_id: str, surah: int, ayah: int, stop: asyncio.Event) -> None:
+        async with self._slots:
+            if stop.is_set():
+                return
+            loop = asyncio.get_running_loop()
+            if await loop.run_in_executor(None, _budget_exhausted):
+                if not stop.is_set():
+                    self.stopped_on_budget += 1
+                    logging.info("Prefetch stopped: audio cache budget reached")
+                stop.set()
+                return
+            engine = self.engine
+            res = await engine.fetch_audio(reciter_id, surah, ayah, priority=PRIORITY_PREFETCH)
+            if not res.ok:
+                logging.debug(f"Prefetch audio {surah}:{ayah} failed: {res.error}")
+                return
+            if not res.cached:
+                self.fetched += 1
+            await loop.run_in_executor(None, self._warm_loudness, reciter_id, surah, ayah)
+
+
+_prefetcher: Optional[Prefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> Prefetcher:
+    """Return the process-wide :class:`Prefetcher`."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
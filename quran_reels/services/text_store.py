@@ -0,0 +1,184 @@
+"""Persistent, surah-granular ayah text store.
+
+When the offline corpus (:mod:`quran_reels.services.corpus`) is not
+installed, ayah text comes from api.alquran.cloud.  That used to be one
+request per ayah — 50 round trips for a 50-ayah build — cached in
+``AYAH_TEXT_CACHE``, an unbounded module-level dict that every worker
+thread mutated unlocked and that was lost on restart.
+
+The store replaces it:
+
+  * **Whole surahs.**  A miss fetches the entire surah with one
+    ``/v1/surah/{n}/quran-uthmani`` request (via the shared fetch
+    engine, so host limits still apply) and stores every ayah of it.
+    Concurrent misses for one surah — other threads, other processes
+    sharing the cache — share that request through a
+    :class:`~quran_reels.utils.singleflight.SingleFlight` group.
+  * **Disk-backed.**  Text lives in a small SQLite file (``text.sqlite3``
+    under the cache dir), shared by every worker process and surviving
+    restarts.  A bounded in-memory LRU sits in front of it.
+  * **Batch API.**  :func:`get_ayah_texts` resolves a whole
+    ``start..end`` range in one call; ``build_video`` uses it to resolve
+    all of a build's text before the ayah pool starts.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from quran_reels.config import VERSE_COUNTS
+from quran_reels.services.corpus import get_corpus
+from quran_reels.services.fetch import PRIORITY_FOREGROUND, get_fetch_engine
+from quran_reels.utils.singleflight import SingleFlight
+
+
+# Ayat kept in the in-memory LRU in front of SQLite (~2 long surahs).
+MEMO_ITEMS = 1024
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ayah_text (
+        surah       INTEGER NOT NULL,
+        ayah        INTEGER NOT NULL,
+        text        TEXT    NOT NULL,
+        fetched_at  REAL    NOT NULL,
+        PRIMARY KEY (surah, ayah)
+    )
+"""
+
+
+class TextStore:
+    """SQLite-backed ``(surah, ayah) -> text`` store with an LRU front."""
+
+    def __init__(self, db_path: str, memo_items: int = MEMO_ITEMS):
+        self.db_path = db_path
+        self.memo_items = memo_items
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._memo: 'OrderedDict[tuple[int, int], str]' = OrderedDict()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        try:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.DatabaseError:
+            pass
+        self._conn.execute(_SCHEMA)
+        self._flight = SingleFlight(
+            'text', lock_dir=os.path.join(os.path.dirname(db_path) or '.', '.locks'))
+
+    def _remember(self, surah: int, ayah: int, text: str) -> None:
+        # Caller holds self._lock.
+        self._memo[(surah, ayah)] = text
+        self._memo.move_to_end((surah, ayah))
+        while len(self._memo) > self.memo_items:
+            self._memo.popitem(last=False)
+
+    def get_range(self, surah: int, start: int, end: int) -> Dict[int, str]:
+        """Stored texts of ``surah:start..end`` (missing ayat are absent)."""
+        out: Dict[int, str] = {}
+        with self._lock:
+            for ayah in range(start, end + 1):
+                text = self._memo.get((surah, ayah))
+                if text is not None:
+                    self._memo.move_to_end((surah, ayah))
+                    out[ayah] = text
+            if len(out) == end - start + 1:
+                return out
+            for ayah, text in self._conn.execute(
+                    'SELECT ayah, text FROM ayah_text WHERE surah=? AND ayah BETWEEN ? AND ?',
+                    (surah, start, end)):
+                if ayah not in out:
+                    out[ayah] = text
+                    self._remember(surah, ayah, text)
+        return out
+
+    def put_surah(self, surah: int, texts: Dict[int, str]) -> None:
+        """Store the texts of one surah (one transaction)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO ayah_text (surah, ayah, text, fetched_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    [(surah, ayah, text, now) for ayah, text in texts.items()])
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            for ayah, text in texts.items():
+                self._remember(surah, ayah, text)
+
+    def has_surah(self, surah: int) -> bool:
+        with self._lock:
+            n, = self._conn.execute(
+                'SELECT COUNT(*) FROM ayah_text WHERE surah=?', (surah,)).fetchone()
+        return n >= VERSE_COUNTS.get(surah, 0)
+
+    def fill_surah(self, surah: int, priority: int = PRIORITY_FOREGROUND) -> None:
+        """Fetch and store the whole surah unless it is already stored.
+        Concurrent callers share one request."""
+        def check():
+            return True if self.has_surah(surah) else None
+
+        def fill():
+            engine = get_fetch_engine()
+            res = engine.submit(engine.fetch_surah_text(surah, priority=priority)).result()
+            if not res.ok:
+                raise RuntimeError(res.error)
+            self.put_surah(surah, res.texts)
+            logging.info(f"Text store: fetched surah {surah} ({len(res.texts)} ayat)")
+            return True
+
+        if check() is None:
+            self._flight.do(f"surah:{surah}", fill, check=check)
+
+
+def get_ayah_texts(surah: int, start: int, end: int,
+                   priority: int = PRIORITY_FOREGROUND) -> Dict[int, str]:
+    """Texts of ``surah:start..end`` as ``{ayah: text}``.
+
+    Reads the offline corpus if installed, else the text store, fetching
+    the whole surah on a miss.  Raises ``ValueError`` for an invalid
+    range and ``RuntimeError`` if the text cannot be obtained.
+    """
+    if surah not in VERSE_COUNTS or not 1 <= start <= end <= VERSE_COUNTS[surah]:
+        raise ValueError(f"No such ayah range: {surah}:{start}-{end}")
+    out: Dict[int, str] = {}
+    corpus = get_corpus()
+    if corpus is not None:
+        for ayah in range(start, end + 1):
+            text = corpus.text(surah, ayah)
+            if text:
+                out[ayah] = text
+        if len(out) == end - start + 1:
+            return out
+    store = get_text_store()
+    out.update(store.get_range(surah, start, end))
+    if len(out) < end - start + 1:
+        store.fill_surah(surah, priority=priority)
+        out.update(store.get_range(surah, start, end))
+    missing = [a for a in range(start, end + 1) if a not in out]
+    if missing:
+        raise RuntimeError(f"No text for {surah}:{missing[0]}" +
+                           (f" (+{len(missing) - 1} more)" if len(missing) > 1 else ""))
+    return out
+
+
+_store: Optional[TextStore] = None
+_store_lock = threading.Lock()
+
+
+def get_text_store() -> TextStore:
+    """Return the process-wide :class:`TextStore` at ``TEXT_CACHE_PATH``."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            # Lazy import — the cache location is configured in main.py.
+            from main import TEXT_CACHE_PATH
+            _store = TextStore(TEXT_CACHE_PATH)
+        return _store
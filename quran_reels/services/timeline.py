@@ -0,0 +1,114 @@
+"""Continuous-timeline builds: the whole video in one ffmpeg pass.
+
+The segment pipeline renders every ayah separately — its own background
+decode, its own encoder warm-up — and then decodes all the segments
+again to concatenate them.  When no pair of segments is crossfaded,
+none of that is needed: the video is one background timeline with text
+cards on top.  This module plans that timeline:
+
+  * **Background.**  Each ayah's backgrounds contribute a run of
+    keyframe-aligned clips from their clip library
+    (:class:`~quran_reels.services.bg_cache.BackgroundClips`), starting
+    at a random clip, and :func:`background_timeline` lines the runs up
+    back to back.  Cuts fall on ayah boundaries to the frame: a run ends
+    with an ``outpoint`` that keeps exactly the frames it needs, and the
+    frame counts are taken against the running total, so rounding never
+    accumulates across ayat.  The result is a single concat demuxer list
+    (:func:`write_timeline_list`), decoded once.
+  * **Text.**  Each ayah's card is its own looped-image input; its
+    animation runs on the card's own clock and only then is it shifted
+    to the ayah's start, and overlaid while that ayah is on screen
+    (:func:`overlay_filters`).
+
+Nothing here runs ffmpeg; ``build_timeline_ffmpeg`` in ``main`` builds
+and runs the command.  The module has no dependency on ``main``.
+"""
+from __future__ import annotations
+
+import os
+from typing import List, Optional, Sequence, Tuple
+
+from quran_reels.services.bg_cache import BackgroundClips
+
+
+# (clip path, outpoint in seconds or None for the whole clip)
+TimelineEntry = Tuple[str, Optional[float]]
+
+
+def frame_count(seconds: float, fps: int) -> int:
+    return int(round(seconds * fps))
+
+
+def snap_duration(seconds: float, fps: int) -> float:
+    """``seconds`` rounded to whole frames at ``fps`` (at least one).
+
+    Segment durations are snapped once, when a segment is planned, and the
+    snapped value is used for both its video and its slice of the audio
+    track, so per-segment frame rounding cannot accumulate into drift.
+    """
+    return max(1, frame_count(seconds, fps)) / fps
+
+
+def background_timeline(parts: Sequence[Tuple[BackgroundClips, int, float]],
+                        fps: int) -> List[TimelineEntry]:
+    """Clip entries for ``parts`` of ``(clips, start clip, duration)``,
+    played one after another.
+
+    Part ``i`` ends on frame ``round(sum(durations[:i+1]) * fps)`` of the
+    timeline.  A part that ends inside a clip gets an ``outpoint`` half
+    a frame after its last kept frame (preprocessed clips have no
+    B-frames, so this keeps exactly those frames).
+    """
+    entries: List[TimelineEntry] = []
+    emitted = 0
+    boundary = 0.0
+    for clips, start, duration in parts:
+        boundary += duration
+        need = frame_count(boundary, fps) - emitted
+        i = start % len(clips.clips)
+        while need > 0:
+            path, s, e = clips.clips[i]
+            frames = max(1, frame_count(e - s, fps))
+            if frames > need:
+                entries.append((path, (need - 0.5) / fps))
+                frames = need
+            else:
+                entries.append((path, None))
+            emitted += frames
+            need -= frames
+            i = (i + 1) % len(clips.clips)
+    return entries
+
+
+def write_timeline_list(list_path: str, entries: Sequence[TimelineEntry]) -> None:
+    """Write ``entries`` as a concat demuxer list."""
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path, outpoint in entries:
+            abs_path = os.path.abspath(path).replace(os.sep, '/').replace("'", "'\\''")
+            f.write(f"file '{abs_path}'\n")
+            if outpoint is not None:
+                f.write(f"outpoint {outpoint:.6f}\n")
+
+
+def overlay_filters(base: str, cards: Sequence[Tuple[int, float, float, Optional[str]]],
+                    out: str) -> List[str]:
+    """Filter chains overlaying text cards on ``[base]``, ending in ``[out]``.
+
+    ``cards`` holds ``(input index, start, duration, card filter)``; the
+    card filter (animation, outro fade) sees the card's own timestamps,
+    starting at 0, before the card is shifted to ``start``.
+    """
+    if not cards:
+        return [f"[{base}]null[{out}]"]
+    chains = []
+    last = base
+    for k, (idx, start, duration, card_filter) in enumerate(cards):
+        prefix = f"{card_filter}," if card_filter else ""
+        chains.append(f"[{idx}:v]{prefix}setpts=PTS-STARTPTS+{start:.3f}/TB[t{k}]")
+        label = out if k == len(cards) - 1 else f"o{k}"
+        chains.append(
+            f"[{last}][t{k}]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2:format=auto:"
+            f"eof_action=pass:enable='between(t,{start:.3f},{start + duration:.3f})'[{label}]"
+        )
+        last = label
+    return chains
@@ -0,0 +1,73 @@
+"""Circuit breaker for ayah audio downloads.
+
+After ``threshold`` consecutive ayat could not be downloaded from *any*
+mirror, the breaker opens and further downloads fail fast for
+``timeout`` seconds instead of walking every mirror again.  One failure
+is one ayah whose mirrors were all exhausted — a single dead mirror
+that the next one covers for does not count.
+
+The state lives here rather than in ``main`` so the fetch engine and
+``main.download_audio`` share one breaker: a lazy ``from main import``
+made while the app runs as ``python main.py`` loads a second copy of
+``main`` with its own globals.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Optional
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a timed reset (thread-safe)."""
+
+    def __init__(self, threshold: int = 5, timeout: float = 60):
+        self.threshold = threshold
+        self.timeout = timeout
+        self._failures = 0
+        self._last_failure = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    def is_open(self) -> bool:
+        """True while the breaker rejects downloads.  Closes itself once
+        ``timeout`` seconds have passed since the last failure."""
+        with self._lock:
+            if self._failures < self.threshold:
+                return False
+            if time.time() - self._last_failure > self.timeout:
+                self._failures = 0
+                return False
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self) -> bool:
+        """Count one failure.  Returns True if this one opened the breaker."""
+        with self._lock:
+            self._failures += 1
+            self._last_failure = time.time()
+            return self._failures == self.threshold
+
+    def reset(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._last_failure = 0.0
+
+
+_download_breaker: Optional[CircuitBreaker] = None
+_download_breaker_lock = threading.Lock()
+
+
+def get_download_breaker() -> CircuitBreaker:
+    """Return the process-wide breaker for audio downloads."""
+    global _download_breaker
+    with _download_breaker_lock:
+        if _download_breaker is None:
+            _download_breaker = CircuitBreaker()
+        return _download_breaker
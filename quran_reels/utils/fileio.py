@@ -0,0 +1,237 @@
+"""Cache-friendly file operations: zero-copy staging and atomic writes.
+
+Two patterns used to cost a full copy of every cached file per build:
+
+  * A cache *hit* was served with ``shutil.copy2(cached, temp)`` just so
+    ffprobe / ffmpeg could read it from the job's temp dir.
+  * A cache *fill* wrote the download to temp and then copied it into
+    the cache.
+
+:func:`link_or_copy` stages a cached file into the job's temp dir by
+hardlink first, then by reflink (copy-on-write clone, Linux ``FICLONE``)
+where the filesystem supports it, and only falls back to a real copy
+when the two paths are on different devices.  A hardlink also doubles
+as a read lease: if the cache entry is evicted or replaced while the
+build is still running, the job's link keeps the old inode alive.
+
+:func:`atomic_write_bytes` writes a fresh download exactly once, to a
+temp name in the destination directory, and renames it into place so
+readers never observe a half-written cache entry.
+
+:class:`AtomicWriter` is the streaming form: chunks go straight to the
+temp file (memory use no longer grows with the download size) and are
+hashed on the way through, so the digest costs no second read.
+:func:`commit_file` does the same for files written by another process
+(ffmpeg) and records a sidecar manifest (size, mtime, hash) that lets
+later cache hits be trusted with one ``stat`` — see
+:func:`manifest_valid`.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+from typing import Optional, Tuple
+
+
+# Linux ioctl number for FICLONE (_IOW(0x94, 9, int)).
+_FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """Clone ``src`` to ``dst`` copy-on-write.  Returns False if unsupported."""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """Make ``dst`` a view of ``src`` as cheaply as the filesystem allows.
+
+    Tries, in order: hardlink, reflink, ``shutil.copy2``.  An existing
+    ``dst`` is replaced.  Returns the method used (``'link'``,
+    ``'reflink'`` or ``'copy'``) for logging.
+    """
+    try:
+        os.remove(dst)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dst)
+        return 'link'
+    except OSError:
+        pass
+    if _reflink(src, dst):
+        return 'reflink'
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def temp_path_for(path: str) -> str:
+    """A temp name next to ``path`` that is unique per process and thread."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+
+
+def atomic_write_bytes(path: str, data: bytes) -> str:
+    """Write ``data`` to ``path`` via a temp file and an atomic rename."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = temp_path_for(path)
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+# ---- streaming writes, hashing and sidecar manifests ----
+
+HASH_ALGO = 'blake2b-128'
+_CHUNK = 1 << 20
+
+
+def fast_hasher():
+    """Hash object used for cache integrity digests."""
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_file(path: str) -> Tuple[int, str]:
+    """``(size, digest)`` of ``path``, read in 1 MiB chunks."""
+    h = fast_hasher()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+            size += len(chunk)
+    return size, h.hexdigest()
+
+
+class AtomicWriter:
+    """Stream bytes into ``path`` via a temp file, hashing as they pass.
+
+    Used as a context manager; the temp file is renamed into place on a
+    clean exit and removed if the block raises or :meth:`abort` was
+    called::
+
+        with AtomicWriter(dest) as w:
+            for chunk in response.iter_content(65536):
+                w.write(chunk)
+        w.size, w.digest
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp = temp_path_for(path)
+        self.size = 0
+        self._hash = fast_hasher()
+        self._f = None
+        self._aborted = False
+
+    def __enter__(self) -> 'AtomicWriter':
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._f = open(self.tmp, 'wb')
+        return self
+
+    def write(self, chunk: bytes) -> None:
+        self._f.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def abort(self) -> None:
+        """Discard the temp file instead of committing it on exit."""
+        self._aborted = True
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self._f.close()
+        if exc_type is None and not self._aborted:
+            os.replace(self.tmp, self.path)
+        else:
+            try:
+                os.remove(self.tmp)
+            except OSError:
+                pass
+        return False
+
+
+def manifest_path(path: str) -> str:
+    return f"{path}.manifest.json"
+
+
+def write_manifest(path: str, digest: str, **extra) -> dict:
+    """Record ``path``'s current size / mtime and ``digest`` in its sidecar."""
+    st = os.stat(path)
+    manifest = dict(extra, size=st.st_size, mtime_ns=st.st_mtime_ns,
+                    hash=digest, algo=HASH_ALGO)
+    atomic_write_bytes(manifest_path(path), json.dumps(manifest).encode('utf-8'))
+    return manifest
+
+
+def read_manifest(path: str) -> Optional[dict]:
+    try:
+        with open(manifest_path(path), 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def manifest_valid(path: str, manifest: Optional[dict] = None) -> bool:
+    """True if ``path`` still matches its manifest (size and mtime).
+
+    This is the cheap check for a cache hit: the entry was hashed and
+    renamed into place atomically when it was written, so an unchanged
+    stat means unchanged contents.
+    """
+    if manifest is None:
+        manifest = read_manifest(path)
+    if not manifest:
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_size == manifest.get('size') and st.st_mtime_ns == manifest.get('mtime_ns')
+
+
+def commit_file(tmp: str, path: str, **extra) -> dict:
+    """Hash a finished temp file, rename it to ``path`` and write its
+    manifest.  For outputs written by a subprocess (ffmpeg), which can
+    not be hashed in-stream."""
+    _, digest = hash_file(tmp)
+    os.replace(tmp, path)
+    return write_manifest(path, digest, **extra)
+
+
+def remove_with_manifest(path: str) -> None:
+    for p in (path, manifest_path(path)):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,170 @@
+"""Pure-Python MP3 duration parser (frame headers + Xing/Info/VBRI).
+
+``get_audio_duration_ffprobe`` spawns one ffprobe process per call,
+which adds up to dozens of process spawns per build for what is a
+header read.  This module computes the duration in-process:
+
+  1.  Skip an ID3v2 tag, if present, and sync to the first frame.
+  2.  If the first frame carries a Xing/Info or VBRI header (written by
+      LAME and most encoders), use its frame count:
+      ``frames * samples_per_frame / sample_rate``.
+  3.  Otherwise hop frame-to-frame through the stream summing samples
+      (exact for CBR and header-less VBR).
+  4.  If the stream is too damaged to walk, estimate from the first
+      frame's bitrate and the audio byte count.
+
+:func:`mp3_duration` returns ``None`` when the file is not recognisable
+as MPEG audio, so callers can fall back to ffprobe.
+"""
+from __future__ import annotations
+
+import struct
+from typing import NamedTuple, Optional
+
+
+_BITRATES = {
+    # (version_is_v1, layer) -> kbps table indexed by the 4-bit field
+    (True, 1):  (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2):  (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3):  (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000),   # MPEG-2.5
+}
+
+
+class FrameHeader(NamedTuple):
+    version: int          # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer: int            # 1, 2 or 3
+    bitrate: int          # kbps
+    sample_rate: int      # Hz
+    channels: int         # 1 or 2
+    samples: int          # samples per frame
+    length: int           # frame length in bytes
+
+
+def parse_frame_header(data: bytes, pos: int) -> Optional[FrameHeader]:
+    """Decode the 4-byte frame header at ``pos``, or ``None`` if invalid."""
+    if pos + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[pos], data[pos + 1], data[pos + 2], data[pos + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    br_idx = (b2 >> 4) & 0x0F
+    sr_idx = (b2 >> 2) & 0x03
+    if version == 1 or layer_bits == 0 or br_idx in (0, 15) or sr_idx == 3:
+        return None
+    layer = 4 - layer_bits
+    is_v1 = version == 3
+    bitrate = _BITRATES[(is_v1, layer)][br_idx]
+    sample_rate = _SAMPLE_RATES[version][sr_idx]
+    padding = (b2 >> 1) & 0x01
+    channels = 1 if (b3 >> 6) == 3 else 2
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    elif layer == 2 or is_v1:
+        samples = 1152
+        length = 144 * bitrate * 1000 // sample_rate + padding
+    else:
+        samples = 576
+        length = 72 * bitrate * 1000 // sample_rate + padding
+    return FrameHeader(version, layer, bitrate, sample_rate, channels, samples, length)
+
+
+def _skip_id3v2(data: bytes) -> int:
+    if len(data) >= 10 and data[:3] == b'ID3':
+        size = ((data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14
+                | (data[8] & 0x7F) << 7 | (data[9] & 0x7F))
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def _find_first_frame(data: bytes, start: int, limit: int = 64 * 1024) -> Optional[int]:
+    """Return the offset of the first frame followed by a valid second frame."""
+    end = min(len(data) - 4, start + limit)
+    pos = start
+    while pos < end:
+        pos = data.find(b'\xFF', pos, end)
+        if pos < 0:
+            return None
+        hdr = parse_frame_header(data, pos)
+        if hdr is not None and hdr.length > 0:
+            nxt = pos + hdr.length
+            # Accept a lone frame at EOF, otherwise require a second sync
+            # so random 0xFFEx bytes in junk are not mistaken for audio.
+            if nxt >= len(data) - 4 or parse_frame_header(data, nxt) is not None:
+                return pos
+        pos += 1
+    return None
+
+
+def _vbr_frame_count(data: bytes, pos: int, hdr: FrameHeader) -> Optional[int]:
+    """Frame count from a Xing/Info or VBRI header in the first frame."""
+    if hdr.version == 3:
+        side = 17 if hdr.channels == 1 else 32
+    else:
+        side = 9 if hdr.channels == 1 else 17
+    x = pos + 4 + side
+    tag = data[x:x + 4]
+    if tag in (b'Xing', b'Info') and len(data) >= x + 12:
+        flags = struct.unpack('>I', data[x + 4:x + 8])[0]
+        if flags & 0x01:
+            return struct.unpack('>I', data[x + 8:x + 12])[0]
+        return None
+    v = pos + 4 + 32
+    if data[v:v + 4] == b'VBRI' and len(data) >= v + 18:
+        return struct.unpack('>I', data[v + 14:v + 18])[0]
+    return None
+
+
+def mp3_duration_from_bytes(data: bytes) -> Optional[float]:
+    """Duration in seconds of the MPEG audio stream in ``data``."""
+    start = _find_first_frame(data, _skip_id3v2(data))
+    if start is None:
+        return None
+    first = parse_frame_header(data, start)
+
+    frames = _vbr_frame_count(data, start, first)
+    if frames:
+        return frames * first.samples / first.sample_rate
+
+    end = len(data)
+    if end >= 128 and data[end - 128:end - 125] == b'TAG':
+        end -= 128
+
+    total_samples = 0
+    pos = start
+    while pos < end:
+        hdr = parse_frame_header(data, pos)
+        if (hdr is None or hdr.length <= 0 or hdr.sample_rate != first.sample_rate
+                or hdr.layer != first.layer):
+            break
+        total_samples += hdr.samples
+        pos += hdr.length
+
+    # A clean walk reaches (or slightly overshoots) the end of the audio.
+    # If it stopped early on junk, estimate from the first frame's bitrate.
+    if pos >= end - first.length:
+        return total_samples / first.sample_rate
+    return (end - start) * 8 / (first.bitrate * 1000)
+
+
+def mp3_duration(path: str) -> Optional[float]:
+    """Duration in seconds of the mp3 at ``path``, or ``None`` if unknown."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    return mp3_duration_from_bytes(data)
@@ -0,0 +1,38 @@
+"""Low-priority worker processes for background work.
+
+Work nobody is waiting on — ingesting new backgrounds, measuring the
+loudness of prefetched recitations — runs in process pools whose workers
+lower their own scheduling priority, so the ffmpeg they start yields the
+CPU to user builds.
+
+The pools always *spawn* their workers: they are started from helper
+threads while the web server, the fetch loop and other threads are
+running, and a forked child could inherit a lock one of them holds.
+Worker functions must therefore not import ``main``; callers pass them
+what they need (e.g. the ffmpeg binary).
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import multiprocessing
+import os
+
+
+# Scheduling niceness of the worker processes (POSIX only).
+NICENESS = 10
+
+
+def lower_priority() -> None:
+    """Process pool initializer: run the worker at low CPU priority."""
+    if hasattr(os, 'nice'):
+        try:
+            os.nice(NICENESS)
+        except OSError:
+            pass
+
+
+def low_priority_pool(workers: int = 1) -> concurrent.futures.ProcessPoolExecutor:
+    """A process pool of ``workers`` spawned, low-priority processes."""
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=max(1, workers), initializer=lower_priority,
+        mp_context=multiprocessing.get_context('spawn'))
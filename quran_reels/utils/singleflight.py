@@ -0,0 +1,234 @@
+"""Single-flight deduplication of cache fills.
+
+Every cache in the app used a check-then-fill pattern with no
+coordination: two workers (or two concurrent builds, or two server
+processes) that needed the same uncached ayah or background both did
+the download / transcode and raced each other writing the same cache
+path.  :class:`SingleFlight` makes concurrent fills of one key do the
+work once:
+
+  * **In-process** — the first caller for a key (the *leader*) runs the
+    fill; callers that arrive while it is in flight wait for it and get
+    the leader's result (or its exception) instead of starting their
+    own.  Threads use :meth:`SingleFlight.do`; coroutines on one event
+    loop use :meth:`SingleFlight.do_async`.
+  * **Across processes** — when the group has a ``lock_dir``, the leader
+    also holds an exclusive ``flock`` on a per-key lock file while it
+    fills, and re-runs ``check`` once it holds the lock, so a process
+    that queued behind another process picks up the finished entry
+    instead of filling it again.  On platforms without ``fcntl`` only
+    the in-process half applies.
+
+Each group counts how much work it saved; :func:`singleflight_stats`
+reports the counters for the ``/api/cache/stats`` endpoint.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process coordination only
+    fcntl = None
+
+
+class FileLock:
+    """Exclusive advisory lock on ``path`` (no-op without ``fcntl``)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        """Block until the lock is held.  Returns True if another process
+        held it when we asked (i.e. we had to wait)."""
+        if fcntl is None:
+            return False
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                contended = False
+            except BlockingIOError:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                contended = True
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return contended
+
+    def release(self) -> None:
+        if self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """A named group of deduplicated fills, keyed by cache key.
+
+    ``fill()`` does the work and returns the result; the optional
+    ``check()`` returns the already-cached result or ``None``, and is
+    consulted after the cross-process lock is taken.
+    """
+
+    def __init__(self, name: str, lock_dir: Optional[str] = None):
+        self.name = name
+        self.lock_dir = lock_dir
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[str, 'asyncio.Future'] = {}
+        self.stats = {'fills': 0, 'shared': 0, 'cross_process_shared': 0}
+        _register(self)
+
+    def _file_lock(self, key: str) -> Optional[FileLock]:
+        if not self.lock_dir:
+            return None
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+        return FileLock(os.path.join(self.lock_dir, f"{digest}.lock"))
+
+    def _count(self, field: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[field] += n
+
+    def _lead(self, key: str, fill: Callable[[], Any],
+              check: Optional[Callable[[], Any]]) -> Any:
+        flock = self._file_lock(key)
+        contended = flock.acquire() if flock else False
+        try:
+            if check is not None:
+                cached = check()
+                if cached is not None:
+                    if contended:
+                        self._count('cross_process_shared')
+                    return cached
+            self._count('fills')
+            return fill()
+        finally:
+            if flock:
+                flock.release()
+
+    def do(self, key: str, fill: Callable[[], Any],
+           check: Optional[Callable[[], Any]] = None) -> Any:
+        """Run ``fill`` for ``key`` once across concurrent threads."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats['shared'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, fill, check)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+            if call.waiters:
+                logging.debug(f"single-flight[{self.name}] {key}: shared with {call.waiters} waiter(s)")
+
+    async def do_async(self, key: str, fill: Callable[[], Awaitable[Any]],
+                       check: Optional[Callable[[], Any]] = None) -> Any:
+        """Coroutine flavour of :meth:`do` for fills running on one loop.
+
+        ``fill`` returns an awaitable; ``check`` is a plain (cheap)
+        callable.  The cross-process lock is taken on the default
+        executor so the loop never blocks on it.
+        """
+        fut = self._async_calls.get(key)
+        if fut is not None:
+            self._count('shared')
+            return await asyncio.shield(fut)
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._async_calls[key] = fut
+        flock = self._file_lock(key)
+        try:
+            contended = False
+            if flock:
+                acquiring = loop.run_in_executor(None, flock.acquire)
+                try:
+                    contended = await asyncio.shield(acquiring)
+                except asyncio.CancelledError:
+                    # The executor thread still takes the lock; drop it then.
+                    acquiring.add_done_callback(lambda _: flock.release())
+                    raise
+            try:
+                cached = check() if check is not None else None
+                if cached is not None:
+                    if contended:
+                        self._count('cross_process_shared')
+                    result = cached
+                else:
+                    self._count('fills')
+                    result = await fill()
+            finally:
+                if flock:
+                    flock.release()
+            fut.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            # Mark retrieved so an unawaited failure does not log a warning.
+            fut.exception()
+            raise
+        finally:
+            self._async_calls.pop(key, None)
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def _register(group: SingleFlight) -> None:
+    with _groups_lock:
+        _groups[group.name] = group
+
+
+def singleflight_stats() -> Dict[str, Dict[str, int]]:
+    """Per-group counters: ``fills`` done, fills ``shared`` with an
+    in-process leader, and fills avoided because another process had
+    just completed them (``cross_process_shared``)."""
+    with _groups_lock:
+        groups = list(_groups.values())
+    out = {}
+    for g in groups:
+        with g._lock:
+            out[g.name] = dict(g.stats)
+    return out
@@ -0,0 +1,189 @@
+"""
+verify_audioop_patch.py
+=======================
+
+Conformance and throughput check for the NumPy ``audioop_patch``.  Run
+this from the project root::
+
+    python verify_audioop_patch.py
+
+The script:
+
+  1.  Compares every function of ``audioop_patch`` against the stdlib
+      ``audioop`` C module for sample widths 1-4, on random fragments
+      and on edge cases (full-scale samples, empty fragments, odd
+      factors, ratecv states carried across calls).  Skipped on
+      Python >= 3.13, where the stdlib module no longer exists.
+  2.  Benchmarks the common operations on a full-surah-sized PCM
+      buffer (10 minutes of 44.1 kHz 16-bit stereo, ~100 MB) and
+      prints the throughput of the patch and, if available, of C.
+
+Exit status is non-zero if any conformance case differs.
+"""
+
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+import audioop_patch as patch
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop as stdlib
+    except ImportError:
+        stdlib = None
+
+
+def banner(text: str) -> None:
+    bar = "=" * 70
+    print(f"\n{bar}\n  {text}\n{bar}")
+
+
+def _call(mod, name, args):
+    try:
+        return ("ok", getattr(mod, name)(*args))
+    except Exception as e:  # compare the exception type, not the message
+        kind = "error" if isinstance(e, getattr(mod, "error", ())) else type(e).__name__
+        return ("raise", kind)
+
+
+def _fragments(rng, width):
+    full = (1 << (8 * width - 1))
+    n = 2000
+    yield b""
+    yield bytes(width)
+    yield rng.integers(0, 256, n * width, dtype=np.uint8).tobytes()
+    # Slowly-varying signal: exercises avgpp / maxpp / cross.
+    t = np.arange(n)
+    sine = (np.sin(t / 7.0) * (full - 1) * 0.8).astype(np.int64)
+    yield patch._pack(sine, width)
+    # Full-scale extremes: clipping and wrap-around paths.
+    yield patch._pack(np.array([full - 1, -full, -full, full - 1, 0, -1] * 50), width)
+
+
+def conformance() -> int:
+    banner("1. Conformance against stdlib audioop")
+    if stdlib is None:
+        print("  stdlib audioop is not available on this Python; skipped.")
+        return 0
+
+    rng = np.random.default_rng(1234)
+    failures = 0
+    cases = 0
+    for width in (1, 2, 3, 4):
+        frags = list(_fragments(rng, width))
+        for frag in frags:
+            checks = [
+                ("max", (frag, width)), ("minmax", (frag, width)),
+                ("avg", (frag, width)), ("rms", (frag, width)),
+                ("avgpp", (frag, width)), ("maxpp", (frag, width)),
+                ("cross", (frag, width)), ("reverse", (frag, width)),
+                ("byteswap", (frag, width)), ("add", (frag, frag, width)),
+                ("lin2ulaw", (frag, width)), ("lin2alaw", (frag, width)),
+                ("ulaw2lin", (frag, width)), ("alaw2lin", (frag, width)),
+                ("lin2adpcm", (frag, width, None)), ("adpcm2lin", (frag, width, None)),
+                ("getsample", (frag, width, 0)), ("getsample", (frag, width, 10**6)),
+            ]
+            for factor in (0.0, 0.5, -1.0, 1.7, 3.0, float("nan")):
+                checks.append(("mul", (frag, width, factor)))
+                checks.append(("tostereo", (frag, width, factor, 1.0 - factor)))
+                checks.append(("tomono", (frag, width, factor, 0.25)))
+            for b in (0, 1, -1, 1 << (8 * width - 1), -7, 2**31 - 1, 2**31):
+                checks.append(("bias", (frag, width, b)))
+            for newwidth in (1, 2, 3, 4):
+                checks.append(("lin2lin", (frag, width, newwidth)))
+            for ch, inrate, outrate, wa, wb in ((1, 44100, 22050, 1, 0), (2, 8000, 44100, 1, 0),
+                                                (1, 48000, 44100, 1, 0), (2, 16000, 8000, 3, 2),
+                                                (1, 11025, 16000, 1, 1), (3, 100, 7, 1, 0)):
+                checks.append(("ratecv", (frag, width, ch, inrate, outrate, None, wa, wb)))
+            if width == 2 and len(frag) >= 200:
+                checks.append(("findmax", (frag, 50)))
+                checks.append(("findfit", (frag, frag[100:200])))
+                checks.append(("findfactor", (frag[:200], frag[200:400])))
+            for name, args in checks:
+                cases += 1
+                want = _call(stdlib, name, args)
+                got = _call(patch, name, args)
+                if want != got:
+                    failures += 1
+                    if failures <= 20:
+                        print(f"  MISMATCH {name} width={width} len={len(args[0])}: "
+                              f"{str(got)[:80]} != {str(want)[:80]}")
+
+        # ratecv / adpcm state threaded across consecutive chunks.
+        frag = frags[3]
+        for ch in (1, 2):
+            s_state = p_state = None
+            chunk = width * ch * 97
+            for i in range(0, len(frag) - chunk, chunk):
+                cases += 1
+                want, s_state = stdlib.ratecv(frag[i:i + chunk], width, ch, 44100, 16000, s_state)
+                got, p_state = patch.ratecv(frag[i:i + chunk], width, ch, 44100, 16000, p_state)
+                if (want, s_state) != (got, p_state):
+                    failures += 1
+                    print(f"  MISMATCH ratecv chained width={width} ch={ch} offset={i}")
+                    break
+        s_state = p_state = None
+        for i in range(0, len(frag), 40 * width):
+            cases += 1
+            want = stdlib.lin2adpcm(frag[i:i + 40 * width], width, s_state)
+            got = patch.lin2adpcm(frag[i:i + 40 * width], width, p_state)
+            s_state, p_state = want[1], got[1]
+            if want != got:
+                failures += 1
+                print(f"  MISMATCH lin2adpcm chained width={width} offset={i}")
+                break
+
+    print(f"\n  {cases - failures}/{cases} cases identical")
+    return failures
+
+
+def benchmark() -> None:
+    banner("2. Throughput on a full-surah PCM buffer")
+    seconds, rate, width, channels = 600, 44100, 2, 2
+    rng = np.random.default_rng(0)
+    n = seconds * rate * channels
+    t = np.arange(n) / (rate * channels)
+    pcm = (np.sin(t * 2 * np.pi * 220) * 12000 + rng.normal(0, 800, n)).astype("<i2").tobytes()
+    mono = pcm[: len(pcm) // 2]
+    print(f"  {len(pcm) / 1e6:.0f} MB stereo, {len(mono) / 1e6:.0f} MB mono, "
+          f"{seconds // 60} min @ {rate} Hz\n")
+
+    ops = [
+        ("rms", lambda m: m.rms(pcm, width)),
+        ("max", lambda m: m.max(pcm, width)),
+        ("avg", lambda m: m.avg(pcm, width)),
+        ("mul 0.8", lambda m: m.mul(pcm, width, 0.8)),
+        ("tomono", lambda m: m.tomono(pcm, width, 0.5, 0.5)),
+        ("tostereo", lambda m: m.tostereo(mono, width, 1.0, 1.0)),
+        ("lin2lin 2->4", lambda m: m.lin2lin(pcm, width, 4)),
+        ("ratecv 44.1k->16k", lambda m: m.ratecv(pcm, width, channels, rate, 16000, None)),
+    ]
+    print(f"  {'operation':20s} {'patch':>10s} {'C audioop':>10s}")
+    for label, op in ops:
+        row = []
+        for mod in (patch, stdlib):
+            if mod is None:
+                row.append("-")
+                continue
+            start = time.perf_counter()
+            op(mod)
+            elapsed = time.perf_counter() - start
+            row.append(f"{len(pcm) / 1e6 / elapsed:7.0f} MB/s")
+        print(f"  {label:20s} {row[0]:>10s} {row[1]:>10s}")
+
+
+def main() -> int:
+    failures = conformance()
+    benchmark()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())